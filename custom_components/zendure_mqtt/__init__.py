@@ -5,26 +5,127 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 
-from .const import DOMAIN
+from .batcher import StateWriteBatcher
+from .connection import ZendureMqttConnectionPool, mqtt
+from .const import (
+    CONF_COMMAND_INTERVAL,
+    CONF_DEVICE_ID,
+    CONF_DEVICE_MODEL,
+    CONF_MQTT_HOST,
+    CONF_MQTT_PASSWORD,
+    CONF_MQTT_PORT,
+    CONF_MQTT_USERNAME,
+    CONF_PACK_EXPIRY,
+    CONF_RECORD_TRAFFIC,
+    CONF_STATE_WRITE_INTERVAL,
+    CONF_TRANSPORT,
+    CONF_UPDATE_FILTERS,
+    DATA_BATCHER,
+    DATA_CONNECTIONS,
+    DATA_SNAPSHOTS,
+    DEFAULT_COMMAND_INTERVAL,
+    DEFAULT_MQTT_PORT,
+    DEFAULT_PACK_EXPIRY,
+    DEFAULT_STATE_WRITE_INTERVAL,
+    DEFAULT_TRANSPORT,
+    DEVICE_PRODUCT_IDS,
+    DOMAIN,
+)
+from .device import ZendureDevice
+from .properties import build_update_filters
+from .recording import TrafficRecorder
+from .snapshot import SnapshotStore
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS: list[Platform] = [Platform.SENSOR]
+PLATFORMS: list[Platform] = [
+    Platform.BINARY_SENSOR,
+    Platform.NUMBER,
+    Platform.SENSOR,
+    Platform.SWITCH,
+]
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Zendure MQTT from a config entry."""
+    if mqtt is None:
+        _LOGGER.error("paho-mqtt library is not installed")
+        return False
+
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
+    # The device of this setup takes over the snapshot
+    hass.data[DOMAIN].setdefault(DATA_SNAPSHOTS, {}).pop(entry.entry_id, None)
+
+    # Entries on the same broker share one connection
+    if DATA_CONNECTIONS not in hass.data[DOMAIN]:
+        hass.data[DOMAIN][DATA_CONNECTIONS] = ZendureMqttConnectionPool(hass)
+    # State writes of all entries are batched together
+    if DATA_BATCHER not in hass.data[DOMAIN]:
+        hass.data[DOMAIN][DATA_BATCHER] = StateWriteBatcher(hass)
+    connection = await hass.data[DOMAIN][DATA_CONNECTIONS].async_acquire(
+        entry.entry_id,
+        entry.data[CONF_MQTT_HOST],
+        entry.data.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT),
+        entry.data.get(CONF_MQTT_USERNAME),
+        entry.data.get(CONF_MQTT_PASSWORD),
+        entry.options.get(CONF_TRANSPORT, DEFAULT_TRANSPORT),
+    )
+
+    recorder = None
+    if entry.options.get(CONF_RECORD_TRAFFIC):
+        recorder = TrafficRecorder(
+            hass, hass.config.path(DOMAIN, f"{entry.entry_id}.rec")
+        )
+
+    device_model = entry.data[CONF_DEVICE_MODEL]
+    device = ZendureDevice(
+        hass,
+        connection,
+        entry.entry_id,
+        device_model,
+        entry.data[CONF_DEVICE_ID],
+        DEVICE_PRODUCT_IDS.get(device_model),
+        build_update_filters(entry.options.get(CONF_UPDATE_FILTERS)),
+        entry.options.get(CONF_PACK_EXPIRY, DEFAULT_PACK_EXPIRY),
+        entry.options.get(CONF_COMMAND_INTERVAL, DEFAULT_COMMAND_INTERVAL),
+        recorder,
+        batcher=hass.data[DOMAIN][DATA_BATCHER],
+        state_write_interval=entry.options.get(
+            CONF_STATE_WRITE_INTERVAL, DEFAULT_STATE_WRITE_INTERVAL
+        ),
+    )
+    await device.async_restore()
+    hass.data[DOMAIN][entry.entry_id] = device
+    device.start()
+
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
     return True
 
 
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload a config entry when its options change."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
-        hass.data[DOMAIN].pop(entry.entry_id)
+        device: ZendureDevice = hass.data[DOMAIN].pop(entry.entry_id)
+        device.stop()
+        await device.snapshot.async_flush()
+        # Kept so removing the entry can cancel a write that is still due
+        hass.data[DOMAIN][DATA_SNAPSHOTS][entry.entry_id] = device.snapshot
+        await hass.data[DOMAIN][DATA_CONNECTIONS].async_release(entry.entry_id)
 
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Delete the saved state of a removed config entry."""
+    snapshots = hass.data.get(DOMAIN, {}).get(DATA_SNAPSHOTS, {})
+    if (snapshot := snapshots.pop(entry.entry_id, None)) is None:
+        snapshot = SnapshotStore(hass, entry.entry_id, dict)
+    await snapshot.async_remove()
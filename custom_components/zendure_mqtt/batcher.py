@@ -0,0 +1,83 @@
+"""State writes of all Zendure entities, batched per event loop iteration."""
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
+from homeassistant.core import HassJob, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+
+class StateWriteBatcher:
+    """Write the states of entities updated close together in one go.
+
+    Shared by all config entries. Updates are collected per interval: with
+    an interval of 0 the batch is written in the next event loop iteration,
+    otherwise `interval` seconds after its first update. An entity updated
+    again before its batch is written is written once.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the batcher."""
+        self.hass = hass
+        # Interval -> state write callbacks waiting, in the order they came in
+        self._batches: dict[float, dict[Callable[[], None], None]] = {}
+        self._cancel: dict[float, Callable[[], None]] = {}
+        self.flushes = 0
+        self.writes = 0
+        self.coalesced = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Return batch counters."""
+        return {
+            "batch_flushes": self.flushes,
+            "batch_writes": self.writes,
+            "batch_coalesced": self.coalesced,
+            "batch_pending": sum(len(batch) for batch in self._batches.values()),
+        }
+
+    @callback
+    def async_schedule(self, write: Callable[[], None], interval: float = 0) -> None:
+        """Queue a state write for the batch of the interval."""
+        if (batch := self._batches.get(interval)) is None:
+            batch = self._batches[interval] = {}
+            if interval:
+                self._cancel[interval] = async_call_later(
+                    self.hass,
+                    interval,
+                    HassJob(
+                        partial(self._async_flush_later, interval),
+                        "zendure_mqtt state writes",
+                        cancel_on_shutdown=True,
+                    ),
+                )
+            else:
+                self._cancel[interval] = self.hass.loop.call_soon(
+                    self._async_flush, interval
+                ).cancel
+        if write in batch:
+            self.coalesced += 1
+        else:
+            batch[write] = None
+
+    @callback
+    def async_flush(self) -> None:
+        """Write every waiting state now."""
+        for interval in list(self._batches):
+            self._cancel.pop(interval)()
+            self._async_flush(interval)
+
+    @callback
+    def _async_flush(self, interval: float) -> None:
+        """Write the states of a batch."""
+        self._cancel.pop(interval, None)
+        batch = self._batches.pop(interval, {})
+        self.flushes += 1
+        for write in batch:
+            self.writes += 1
+            write()
+
+    @callback
+    def _async_flush_later(self, interval: float, _now: Any) -> None:
+        """Write the states of a batch whose interval has passed."""
+        self._async_flush(interval)
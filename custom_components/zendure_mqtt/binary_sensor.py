@@ -0,0 +1,29 @@
+"""Platform for Zendure MQTT binary sensor integration."""
+from homeassistant.components.binary_sensor import BinarySensorEntity
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .entity import ZendureEntity, async_setup_property_entities
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up Zendure MQTT binary sensors based on a config entry."""
+    async_setup_property_entities(
+        hass, config_entry, async_add_entities, "binary_sensor", ZendureBinarySensor
+    )
+
+
+class ZendureBinarySensor(ZendureEntity, BinarySensorEntity):
+    """A binary sensor for a device property."""
+
+    @property
+    def is_on(self) -> bool | None:
+        """Return true if the property is set."""
+        if (value := self.value) is None:
+            return None
+        return bool(value)
@@ -0,0 +1,152 @@
+"""Coalescing, rate limited queue for Zendure write commands."""
+import asyncio
+import logging
+import random
+from collections.abc import Callable
+from functools import partial
+from itertools import count
+from typing import Any
+
+from homeassistant.core import HassJob, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds a command waits for further writes to merge into it
+COMMAND_WINDOW = 0.1
+# Seconds to wait for the device to reply to a command
+ACK_TIMEOUT = 10
+
+
+class CommandQueue:
+    """Merge property writes into as few commands as the rate limit allows.
+
+    Writes submitted while a command is pending join it, the last value
+    winning per property. A command is sent once the coalescing window has
+    passed and at least `interval` seconds after the previous one. Each
+    command carries a `messageId`; its future resolves to True when the device
+    replies with that id, or False if publishing fails or no reply arrives
+    within `ack_timeout`. Any number of commands may await a reply at once.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        send: Callable[[str, dict[str, Any]], bool],
+        interval: float,
+        window: float = COMMAND_WINDOW,
+        ack_timeout: float = ACK_TIMEOUT,
+    ) -> None:
+        """Initialize the queue."""
+        self.hass = hass
+        self._send = send
+        self.interval = interval
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self._pending: dict[str, Any] = {}
+        self._future: asyncio.Future[bool] | None = None
+        self._last_sent: float | None = None
+        self._cancel_send: Callable[[], None] | None = None
+        self._send_job = HassJob(
+            self._async_send, "zendure_mqtt command", cancel_on_shutdown=True
+        )
+        # A random start keeps ids of a reloaded entry apart from recent ones
+        self._message_ids = count(random.randrange(1, 1 << 30))
+        # messageId -> future of the command and its timeout
+        self._in_flight: dict[str, tuple[asyncio.Future[bool], Callable[[], None]]] = {}
+        self.writes_requested = 0
+        self.writes_coalesced = 0
+        self.commands_sent = 0
+        self.commands_acknowledged = 0
+        self.commands_timed_out = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Return write and command counters."""
+        return {
+            "writes_requested": self.writes_requested,
+            "writes_coalesced": self.writes_coalesced,
+            "commands_sent": self.commands_sent,
+            "commands_acknowledged": self.commands_acknowledged,
+            "commands_timed_out": self.commands_timed_out,
+            "commands_in_flight": len(self._in_flight),
+        }
+
+    @callback
+    def async_submit(self, properties: dict[str, Any]) -> asyncio.Future[bool]:
+        """Queue property writes; the future resolves once the device replies."""
+        self.writes_requested += 1
+        if self._future is not None:
+            self.writes_coalesced += 1
+            self._pending.update(properties)
+            return self._future
+
+        self._pending = dict(properties)
+        self._future = self.hass.loop.create_future()
+        delay = self.window
+        if self._last_sent is not None:
+            delay = max(delay, self._last_sent + self.interval - self.hass.loop.time())
+        self._cancel_send = async_call_later(self.hass, delay, self._send_job)
+        return self._future
+
+    @callback
+    def async_flush(self) -> None:
+        """Send the pending command now."""
+        if self._cancel_send is not None:
+            self._cancel_send()
+            self._cancel_send = None
+        if self._future is not None:
+            self._async_send(None)
+
+    @callback
+    def async_stop(self) -> None:
+        """Send the pending command and stop waiting for replies."""
+        self.async_flush()
+        for future, cancel_timeout in self._in_flight.values():
+            cancel_timeout()
+            if not future.done():
+                future.set_result(False)
+        self._in_flight.clear()
+
+    @callback
+    def async_acknowledge(self, message_id: str) -> None:
+        """Resolve the command the device replied to."""
+        if (in_flight := self._in_flight.pop(message_id, None)) is None:
+            return
+        future, cancel_timeout = in_flight
+        cancel_timeout()
+        self.commands_acknowledged += 1
+        if not future.done():
+            future.set_result(True)
+
+    @callback
+    def _async_send(self, _now: Any) -> None:
+        """Publish the pending writes as one command."""
+        self._cancel_send = None
+        properties, self._pending = self._pending, {}
+        future, self._future = self._future, None
+        self._last_sent = self.hass.loop.time()
+        self.commands_sent += 1
+        message_id = str(next(self._message_ids))
+        if not self._send(message_id, properties):
+            future.set_result(False)
+            return
+        timeout_job = HassJob(
+            partial(self._async_timeout, message_id),
+            "zendure_mqtt command timeout",
+            cancel_on_shutdown=True,
+        )
+        self._in_flight[message_id] = (
+            future,
+            async_call_later(self.hass, self.ack_timeout, timeout_job),
+        )
+
+    @callback
+    def _async_timeout(self, message_id: str, _now: Any) -> None:
+        """Give up on a command the device did not reply to."""
+        if (in_flight := self._in_flight.pop(message_id, None)) is None:
+            return
+        _LOGGER.warning("No reply to write command %s", message_id)
+        self.commands_timed_out += 1
+        if not in_flight[0].done():
+            in_flight[0].set_result(False)
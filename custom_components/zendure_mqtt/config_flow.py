@@ -5,125 +5,318 @@ from typing import Any
 import voluptuous as vol
 
 from homeassistant import config_entries
+from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
-from homeassistant.exceptions import HomeAssistantError
-
-try:
-    import paho.mqtt.client as mqtt
-except ImportError:
-    mqtt = None
 
 from .const import (
+    CONF_COMMAND_INTERVAL,
     CONF_DEVICE_ID,
     CONF_DEVICE_MODEL,
     CONF_MQTT_HOST,
     CONF_MQTT_PASSWORD,
     CONF_MQTT_PORT,
     CONF_MQTT_USERNAME,
+    CONF_DEADBAND,
+    CONF_DEADBAND_PERCENT,
+    CONF_DEVICE,
+    CONF_MIN_INTERVAL,
+    CONF_PACK_EXPIRY,
+    CONF_PROPERTY,
+    CONF_RECORD_TRAFFIC,
+    CONF_STATE_WRITE_INTERVAL,
+    CONF_TRANSPORT,
+    CONF_UPDATE_FILTERS,
+    DEFAULT_COMMAND_INTERVAL,
     DEFAULT_MQTT_PORT,
+    DEFAULT_PACK_EXPIRY,
+    DEFAULT_STATE_WRITE_INTERVAL,
+    DEFAULT_TRANSPORT,
     DEVICE_MODELS,
+    DEVICE_PRODUCT_IDS,
     DOMAIN,
+    MQTT_TOPIC_REPORT,
+    TRANSPORTS,
+)
+from .probe import (
+    CannotConnect,
+    InvalidAuth,
+    async_discover_devices,
+    async_probe_broker,
 )
+from .properties import UpdateFilter, build_update_filters, filterable_properties
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def validate_mqtt_connection(
-    host: str, port: int, username: str | None, password: str | None
-) -> bool:
-    """Validate the MQTT connection."""
-    if mqtt is None:
-        _LOGGER.error("paho-mqtt library is not installed")
-        return False
-
-    try:
-        client = mqtt.Client()
-
-        if username and password:
-            client.username_pw_set(username, password)
-        elif username:
-            client.username_pw_set(username)
-
-        client.connect(host, port, 10)
-        client.loop_start()
-        client.loop_stop()
-        client.disconnect()
-        return True
-    except Exception as err:
-        _LOGGER.error("Failed to connect to MQTT broker: %s", err)
-        return False
-
-
 class ZendureMqttConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for Zendure MQTT."""
 
     VERSION = 1
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(
+        config_entry: config_entries.ConfigEntry,
+    ) -> config_entries.OptionsFlow:
+        """Get the options flow for this handler."""
+        return ZendureMqttOptionsFlow(config_entry)
+
+    def __init__(self) -> None:
+        """Initialize the config flow."""
+        self._broker: dict[str, Any] = {}
+        # "product_id/device_id" -> device model of discovered devices
+        self._discovered: dict[str, str] = {}
+
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
-        """Handle the initial step."""
+        """Choose between discovering devices and entering one by hand."""
+        return self.async_show_menu(step_id="user", menu_options=["discover", "manual"])
+
+    async def async_step_manual(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Handle a device entered by hand."""
         errors: dict[str, str] = {}
 
         if user_input is not None:
-            try:
-                # Validate the MQTT connection
-                mqtt_host = user_input[CONF_MQTT_HOST]
-                mqtt_port = user_input.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT)
-                mqtt_username = user_input.get(CONF_MQTT_USERNAME, "")
-                mqtt_password = user_input.get(CONF_MQTT_PASSWORD, "")
-
-                # Test connection
-                is_valid = await self.hass.async_add_executor_job(
-                    validate_mqtt_connection,
-                    mqtt_host,
-                    mqtt_port,
-                    mqtt_username if mqtt_username else None,
-                    mqtt_password if mqtt_password else None,
-                )
-
-                if not is_valid:
+            device_id = user_input.get(CONF_DEVICE_ID, "").strip()
+            if not device_id:
+                errors["base"] = "invalid_device_id"
+            else:
+                try:
+                    result = await async_probe_broker(
+                        user_input[CONF_MQTT_HOST],
+                        user_input.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT),
+                        user_input.get(CONF_MQTT_USERNAME) or None,
+                        user_input.get(CONF_MQTT_PASSWORD) or None,
+                        MQTT_TOPIC_REPORT.format(
+                            product_id=DEVICE_PRODUCT_IDS[user_input[CONF_DEVICE_MODEL]],
+                            device_id=device_id,
+                        ),
+                    )
+                except InvalidAuth as err:
+                    _LOGGER.warning("MQTT broker refused the credentials: %s", err)
+                    errors["base"] = "invalid_auth"
+                except CannotConnect as err:
+                    _LOGGER.warning("MQTT broker check failed: %s", err)
                     errors["base"] = "cannot_connect"
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Unexpected exception")
+                    errors["base"] = "unknown"
                 else:
-                    # Validate device ID is not empty
-                    device_id = user_input.get(CONF_DEVICE_ID, "").strip()
-                    if not device_id:
-                        errors["base"] = "invalid_device_id"
-                    else:
-                        # Create a unique ID based on the device ID and model
-                        await self.async_set_unique_id(
-                            f"{device_id}_{user_input[CONF_DEVICE_MODEL]}"
+                    _LOGGER.info(
+                        "MQTT broker %s answered in %.0f ms",
+                        user_input[CONF_MQTT_HOST],
+                        result.rtt * 1000,
+                    )
+                    if not result.report_seen:
+                        # The device may be idle or offline; setup still works
+                        _LOGGER.warning(
+                            "No report from device %s yet; check the device ID and"
+                            " that the device publishes to this broker",
+                            device_id,
                         )
-                        self._abort_if_unique_id_configured()
-
-                        return self.async_create_entry(
-                            title=f"Zendure {user_input[CONF_DEVICE_MODEL].upper()} ({device_id})",
-                            data=user_input,
-                        )
-            except Exception:  # pylint: disable=broad-except
-                _LOGGER.exception("Unexpected exception")
-                errors["base"] = "unknown"
+                    return await self._async_create_device_entry(user_input)
 
         # Show the configuration form
         data_schema = vol.Schema(
             {
-                vol.Required(CONF_MQTT_HOST): str,
-                vol.Optional(CONF_MQTT_PORT, default=DEFAULT_MQTT_PORT): int,
-                vol.Optional(CONF_MQTT_USERNAME, default=""): str,
-                vol.Optional(CONF_MQTT_PASSWORD, default=""): str,
+                **_broker_schema(),
                 vol.Required(CONF_DEVICE_MODEL): vol.In(DEVICE_MODELS),
                 vol.Required(CONF_DEVICE_ID): str,
             }
         )
 
         return self.async_show_form(
-            step_id="user", data_schema=data_schema, errors=errors
+            step_id="manual", data_schema=data_schema, errors=errors
         )
 
+    async def async_step_discover(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Listen on the broker for reports of devices not set up yet."""
+        errors: dict[str, str] = {}
 
-class CannotConnect(HomeAssistantError):
-    """Error to indicate we cannot connect."""
+        if user_input is not None:
+            try:
+                found = await async_discover_devices(
+                    user_input[CONF_MQTT_HOST],
+                    user_input.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT),
+                    user_input.get(CONF_MQTT_USERNAME) or None,
+                    user_input.get(CONF_MQTT_PASSWORD) or None,
+                )
+            except InvalidAuth as err:
+                _LOGGER.warning("MQTT broker refused the credentials: %s", err)
+                errors["base"] = "invalid_auth"
+            except CannotConnect as err:
+                _LOGGER.warning("MQTT broker check failed: %s", err)
+                errors["base"] = "cannot_connect"
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Unexpected exception")
+                errors["base"] = "unknown"
+            else:
+                configured = self._async_current_ids()
+                self._discovered = {
+                    f"{product_id}/{device_id}": model
+                    for (product_id, device_id), model in found.items()
+                    if f"{device_id}_{model}" not in configured
+                }
+                if self._discovered:
+                    self._broker = user_input
+                    return await self.async_step_pick_device()
+                errors["base"] = "no_devices_found"
 
+        return self.async_show_form(
+            step_id="discover", data_schema=vol.Schema(_broker_schema()), errors=errors
+        )
+
+    async def async_step_pick_device(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Choose one of the discovered devices."""
+        if user_input is not None:
+            key = user_input[CONF_DEVICE]
+            return await self._async_create_device_entry(
+                {
+                    **self._broker,
+                    CONF_DEVICE_MODEL: self._discovered[key],
+                    CONF_DEVICE_ID: key.split("/", 1)[1],
+                }
+            )
+
+        devices = {
+            key: f"{model.upper()} ({key.split('/', 1)[1]})"
+            for key, model in sorted(self._discovered.items())
+        }
+        return self.async_show_form(
+            step_id="pick_device",
+            data_schema=vol.Schema({vol.Required(CONF_DEVICE): vol.In(devices)}),
+        )
+
+    async def _async_create_device_entry(self, data: dict[str, Any]) -> FlowResult:
+        """Create the entry of a device unless it is already configured."""
+        device_id = data[CONF_DEVICE_ID].strip()
+        # Create a unique ID based on the device ID and model
+        await self.async_set_unique_id(f"{device_id}_{data[CONF_DEVICE_MODEL]}")
+        self._abort_if_unique_id_configured()
+
+        return self.async_create_entry(
+            title=f"Zendure {data[CONF_DEVICE_MODEL].upper()} ({device_id})",
+            data=data,
+        )
+
+
+def _broker_schema() -> dict[Any, Any]:
+    """Return the form fields of the broker connection."""
+    return {
+        vol.Required(CONF_MQTT_HOST): str,
+        vol.Optional(CONF_MQTT_PORT, default=DEFAULT_MQTT_PORT): int,
+        vol.Optional(CONF_MQTT_USERNAME, default=""): str,
+        vol.Optional(CONF_MQTT_PASSWORD, default=""): str,
+    }
+
+
+class ZendureMqttOptionsFlow(config_entries.OptionsFlow):
+    """Handle Zendure MQTT options."""
+
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        """Initialize the options flow."""
+        self.entry = config_entry
+        self._property: str | None = None
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Choose which options to change."""
+        return self.async_show_menu(
+            step_id="init", menu_options=["settings", "update_filter"]
+        )
+
+    async def async_step_settings(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Handle the general settings."""
+        if user_input is not None:
+            return self.async_create_entry(
+                title="", data={**self.entry.options, **user_input}
+            )
+
+        data_schema = vol.Schema(
+            {
+                vol.Optional(
+                    CONF_TRANSPORT,
+                    default=self.entry.options.get(CONF_TRANSPORT, DEFAULT_TRANSPORT),
+                ): vol.In(TRANSPORTS),
+                vol.Optional(
+                    CONF_PACK_EXPIRY,
+                    default=self.entry.options.get(
+                        CONF_PACK_EXPIRY, DEFAULT_PACK_EXPIRY
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=60)),
+                vol.Optional(
+                    CONF_COMMAND_INTERVAL,
+                    default=self.entry.options.get(
+                        CONF_COMMAND_INTERVAL, DEFAULT_COMMAND_INTERVAL
+                    ),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                vol.Optional(
+                    CONF_STATE_WRITE_INTERVAL,
+                    default=self.entry.options.get(
+                        CONF_STATE_WRITE_INTERVAL, DEFAULT_STATE_WRITE_INTERVAL
+                    ),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, max=60)),
+                vol.Optional(
+                    CONF_RECORD_TRAFFIC,
+                    default=self.entry.options.get(CONF_RECORD_TRAFFIC, False),
+                ): bool,
+            }
+        )
+        return self.async_show_form(step_id="settings", data_schema=data_schema)
+
+    async def async_step_update_filter(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Choose the property to set an update filter for."""
+        if user_input is not None:
+            self._property = user_input[CONF_PROPERTY]
+            return await self.async_step_update_filter_values()
+
+        properties = {
+            key: f"{definition['name']} ({key})"
+            for key, definition in sorted(filterable_properties().items())
+        }
+        data_schema = vol.Schema({vol.Required(CONF_PROPERTY): vol.In(properties)})
+        return self.async_show_form(step_id="update_filter", data_schema=data_schema)
+
+    async def async_step_update_filter_values(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Set the deadband and minimum interval of a property."""
+        overrides = dict(self.entry.options.get(CONF_UPDATE_FILTERS, {}))
+        if user_input is not None:
+            overrides[self._property] = user_input
+            return self.async_create_entry(
+                title="",
+                data={**self.entry.options, CONF_UPDATE_FILTERS: overrides},
+            )
+
+        current = build_update_filters(overrides).get(self._property, UpdateFilter())
+        non_negative = vol.All(vol.Coerce(float), vol.Range(min=0))
+        data_schema = vol.Schema(
+            {
+                vol.Optional(CONF_DEADBAND, default=current.deadband): non_negative,
+                vol.Optional(
+                    CONF_DEADBAND_PERCENT, default=current.deadband_percent
+                ): non_negative,
+                vol.Optional(
+                    CONF_MIN_INTERVAL, default=current.min_interval
+                ): non_negative,
+            }
+        )
+        return self.async_show_form(
+            step_id="update_filter_values",
+            data_schema=data_schema,
+            description_placeholders={"property": self._property},
+        )
 
-class InvalidAuth(HomeAssistantError):
-    """Error to indicate there is invalid auth."""
@@ -0,0 +1,488 @@
+"""Shared MQTT broker connections for Zendure devices."""
+import asyncio
+from collections import deque
+from collections.abc import Callable, Iterable
+import logging
+import random
+import re
+import time
+from typing import Any
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
+
+from homeassistant.core import HomeAssistant
+
+from .const import TRANSPORT_ASYNCIO
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds between keepalive checks when the event loop drives the socket
+MISC_INTERVAL = 1
+# Wait before the first reconnect attempt, doubled after every failure
+RECONNECT_MIN = 2
+# Longest wait between reconnect attempts
+RECONNECT_MAX = 300
+
+# Most recent messageIds remembered per topic to drop duplicate deliveries
+DUPLICATE_WINDOW = 16
+# Seconds after which a messageId no longer counts as a duplicate, so the
+# reports of a device whose counter restarted are not dropped
+DUPLICATE_MAX_AGE = 30
+
+_MESSAGE_ID = re.compile(rb'"messageId"\s*:\s*"?([^",}\s]+)')
+
+MessageCallback = Callable[[Any], None]
+ConnectionCallback = Callable[[bool], None]
+BrokerKey = tuple[str, int, str | None, str | None]
+
+
+def filter_covers(general: str, specific: str) -> bool:
+    """Return True if every topic matched by specific is matched by general."""
+    general_levels = general.split("/")
+    specific_levels = specific.split("/")
+    for index, level in enumerate(general_levels):
+        if level == "#":
+            # "a/#" also matches the parent topic "a"
+            return len(specific_levels) >= index
+        if index >= len(specific_levels):
+            return False
+        specific_level = specific_levels[index]
+        if specific_level == "#":
+            return False
+        if level == "+":
+            continue
+        if level != specific_level:
+            return False
+    return len(general_levels) == len(specific_levels)
+
+
+def plan_subscriptions(topics: Iterable[str]) -> list[str]:
+    """Return the minimal set of topic filters without overlaps.
+
+    Filters covered by another filter are dropped, so the broker delivers
+    each message once.
+    """
+    unique = list(dict.fromkeys(topics))
+    return [
+        topic
+        for topic in unique
+        if not any(
+            other != topic and filter_covers(other, topic) for other in unique
+        )
+    ]
+
+
+def reconnect_delay(failures: int) -> float:
+    """Return the wait before the next connect attempt after failed ones.
+
+    The wait doubles with every failure up to RECONNECT_MAX and is spread
+    over its upper half, so clients of a restarted broker do not return at once.
+    """
+    delay = min(RECONNECT_MAX, RECONNECT_MIN * 2 ** (failures - 1))
+    return random.uniform(delay / 2, delay)
+
+
+class MessageIdGuard:
+    """Drop repeated deliveries of the same message before it is parsed."""
+
+    def __init__(
+        self, size: int = DUPLICATE_WINDOW, max_age: float = DUPLICATE_MAX_AGE
+    ) -> None:
+        """Initialize the guard."""
+        # Topic -> (messageId, monotonic time received) of its latest messages
+        self._recent: dict[str, deque[tuple[bytes, float]]] = {}
+        self._size = size
+        self._max_age = max_age
+        self.duplicates = 0
+
+    def is_duplicate(
+        self, topic: str, payload: bytes, now: float | None = None
+    ) -> bool:
+        """Return True if the payload's messageId was seen on the topic lately."""
+        if (match := _MESSAGE_ID.search(payload)) is None:
+            return False
+        message_id = match.group(1)
+        if now is None:
+            now = time.monotonic()
+        if (recent := self._recent.get(topic)) is None:
+            recent = self._recent[topic] = deque(maxlen=self._size)
+        since = now - self._max_age
+        for seen_id, seen in recent:
+            if seen_id == message_id and seen >= since:
+                self.duplicates += 1
+                return True
+        recent.append((message_id, now))
+        return False
+
+
+class ZendureMqttConnection:
+    """A single MQTT client shared by every Zendure device on one broker."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        host: str,
+        port: int,
+        username: str | None,
+        password: str | None,
+        transport: str,
+    ) -> None:
+        """Initialize the connection."""
+        self.hass = hass
+        self.host = host
+        self.port = port
+        self.transport = transport
+        self.connected = False
+        self._sock = None
+        self._supervisor: asyncio.Task | None = None
+        self._stopped = False
+        # Connect attempts since the last accepted connection
+        self._failures = 0
+        self._ever_connected = False
+        self.reconnects = 0
+        # Planned topic filter -> number of devices using it. Filters of
+        # different devices never overlap, so each device is planned on its own
+        self._subscriptions: dict[str, int] = {}
+        self._guard = MessageIdGuard()
+        # (product_id, device_id) -> listeners; replaced, never mutated, so
+        # the network thread can read it without locking
+        self._devices: dict[
+            tuple[str, str], tuple[tuple[MessageCallback, ConnectionCallback], ...]
+        ] = {}
+
+        self._client = mqtt.Client()
+        if username and password:
+            self._client.username_pw_set(username, password)
+        elif username:
+            self._client.username_pw_set(username)
+
+        self._client.on_connect = self._on_connect
+        self._client.on_message = self._on_message
+        self._client.on_disconnect = self._on_disconnect
+        if transport == TRANSPORT_ASYNCIO:
+            self._client.on_socket_open = self._on_socket_open
+            self._client.on_socket_close = self._on_socket_close
+            self._client.on_socket_register_write = self._on_socket_register_write
+            self._client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    @property
+    def in_event_loop(self) -> bool:
+        """Return True if callbacks run in the event loop instead of a thread."""
+        return self.transport == TRANSPORT_ASYNCIO
+
+    @property
+    def duplicates(self) -> int:
+        """Return the repeated deliveries dropped before parsing."""
+        return self._guard.duplicates
+
+    def add_device(
+        self,
+        product_id: str,
+        device_id: str,
+        topics: list[str],
+        on_message: MessageCallback,
+        on_connection: ConnectionCallback,
+    ) -> Callable[[], None]:
+        """Route messages of a device to its callbacks and subscribe its topics.
+
+        Returns a callable that removes the device again.
+        """
+        key = (product_id, device_id)
+        listener = (on_message, on_connection)
+        devices = dict(self._devices)
+        devices[key] = devices.get(key, ()) + (listener,)
+        self._devices = devices
+
+        # Topics under another device's prefix cannot cover these, so the
+        # device's own filters are all that need planning
+        planned = plan_subscriptions(topics)
+        self._subscribe(
+            [topic for topic in planned if self._acquire_topic(topic)]
+        )
+
+        on_connection(self.connected)
+
+        def remove_device() -> None:
+            """Remove the device from the connection."""
+            devices = dict(self._devices)
+            remaining = tuple(item for item in devices.get(key, ()) if item is not listener)
+            if remaining:
+                devices[key] = remaining
+            else:
+                devices.pop(key, None)
+            self._devices = devices
+
+            self._unsubscribe(
+                [topic for topic in planned if self._release_topic(topic)]
+            )
+
+        return remove_device
+
+    def _acquire_topic(self, topic: str) -> bool:
+        """Count a device using a filter; returns True if it is a new one."""
+        count = self._subscriptions.get(topic, 0)
+        self._subscriptions[topic] = count + 1
+        return count == 0
+
+    def _release_topic(self, topic: str) -> bool:
+        """Uncount a device using a filter; returns True if none is left."""
+        count = self._subscriptions.get(topic, 0) - 1
+        if count > 0:
+            self._subscriptions[topic] = count
+            return False
+        self._subscriptions.pop(topic, None)
+        return True
+
+    def _subscribe(self, topics: list[str]) -> None:
+        """Subscribe filters at the broker while connected."""
+        if topics and self.connected:
+            self._client.subscribe([(topic, 0) for topic in topics])
+            _LOGGER.info("Subscribed to topics on %s: %s", self.host, topics)
+
+    def _unsubscribe(self, topics: list[str]) -> None:
+        """Unsubscribe filters at the broker while connected."""
+        if topics and self.connected:
+            self._client.unsubscribe(topics)
+            _LOGGER.info("Unsubscribed from topics on %s: %s", self.host, topics)
+
+    def _resubscribe(self) -> None:
+        """Subscribe the planned filters of all devices after connecting."""
+        self._subscribe(list(self._subscriptions))
+
+    def _on_connect(self, client, userdata, flags, rc):
+        """Handle MQTT connection."""
+        if rc == 0:
+            _LOGGER.info("Connected to MQTT broker %s:%s", self.host, self.port)
+            if self._ever_connected:
+                self.reconnects += 1
+            self._ever_connected = True
+            self._failures = 0
+            self.connected = True
+            # A new session starts without subscriptions. Devices change the
+            # plan in the event loop, so it is only read there
+            if self.in_event_loop:
+                self._resubscribe()
+            else:
+                self.hass.loop.call_soon_threadsafe(self._resubscribe)
+        else:
+            _LOGGER.error("Failed to connect to MQTT broker with code: %s", rc)
+            self.connected = False
+        self._notify_connection()
+
+    def _on_disconnect(self, client, userdata, rc):
+        """Handle MQTT disconnection."""
+        _LOGGER.warning("Disconnected from MQTT broker with code: %s", rc)
+        self.connected = False
+        self._notify_connection()
+
+    def _notify_connection(self) -> None:
+        """Tell every device about the current connection state."""
+        for listeners in self._devices.values():
+            for _, on_connection in listeners:
+                on_connection(self.connected)
+
+    def _on_message(self, client, userdata, msg):
+        """Route an incoming MQTT message to the device it belongs to."""
+        # Device topics look like /{product_id}/{device_id}/...
+        parts = msg.topic.split("/", 3)
+        if len(parts) < 3:
+            _LOGGER.debug("Ignoring message on topic %s", msg.topic)
+            return
+        listeners = self._devices.get((parts[1], parts[2]))
+        if not listeners:
+            _LOGGER.debug("No device registered for topic %s", msg.topic)
+            return
+        if self._guard.is_duplicate(msg.topic, msg.payload):
+            _LOGGER.debug("Dropping duplicate delivery on topic %s", msg.topic)
+            return
+        for on_message, _ in listeners:
+            on_message(msg)
+
+    def publish(self, topic: str, payload: str) -> bool:
+        """Publish a message to an MQTT topic."""
+        try:
+            result = self._client.publish(topic, payload)
+            return result.rc == mqtt.MQTT_ERR_SUCCESS
+        except Exception as err:
+            _LOGGER.error("Failed to publish MQTT message: %s", err)
+            return False
+
+    def _on_socket_open(self, client, userdata, sock):
+        """Start reading the socket from the event loop.
+
+        Called from the executor job that opens the socket.
+        """
+        self.hass.loop.call_soon_threadsafe(self._async_socket_open, sock)
+
+    def _async_socket_open(self, sock) -> None:
+        """Register a newly opened socket for reading."""
+        if sock.fileno() == -1:
+            return
+        if self._stopped:
+            # A connect attempt finished after the connection was stopped
+            sock.close()
+            return
+        self._sock = sock
+        self.hass.loop.add_reader(sock, self._async_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        """Stop watching a socket that is about to be closed."""
+        self._sock = None
+        if sock.fileno() > -1:
+            self.hass.loop.remove_reader(sock)
+            self.hass.loop.remove_writer(sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        """Watch the socket for writability while packets are queued."""
+        self.hass.loop.call_soon_threadsafe(self._async_register_write, sock)
+
+    def _async_register_write(self, sock) -> None:
+        """Register the socket for writing."""
+        if sock.fileno() > -1:
+            self.hass.loop.add_writer(sock, self._async_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        """Stop watching the socket for writability."""
+        if sock.fileno() > -1:
+            self.hass.loop.remove_writer(sock)
+
+    def _async_read(self) -> None:
+        """Read incoming packets; callbacks fire in the event loop."""
+        self._client.loop_read()
+
+    def _async_write(self) -> None:
+        """Write queued packets."""
+        self._client.loop_write()
+
+    async def _async_supervise(self) -> None:
+        """Connect, keep the connection alive and reconnect with backoff.
+
+        Runs as a background task so setup never waits for the broker.
+        """
+        while True:
+            if self._sock is None:
+                if self._failures:
+                    await asyncio.sleep(reconnect_delay(self._failures))
+                # Reset by the broker accepting the connection
+                self._failures += 1
+                await self._async_connect()
+            await asyncio.sleep(MISC_INTERVAL)
+            if self._sock is not None:
+                self._client.loop_misc()
+
+    async def _async_connect(self) -> bool:
+        """Open the connection to the broker."""
+        try:
+            await self.hass.async_add_executor_job(
+                self._client.connect, self.host, self.port, 60
+            )
+        except Exception as err:
+            _LOGGER.warning(
+                "Failed to connect to MQTT broker %s:%s: %s", self.host, self.port, err
+            )
+            return False
+        return True
+
+    async def async_start(self) -> None:
+        """Start connecting to the broker in the background."""
+        if self.in_event_loop:
+            self._supervisor = self.hass.async_create_background_task(
+                self._async_supervise(), f"zendure_mqtt {self.host}:{self.port}"
+            )
+        else:
+            # paho's thread connects and reconnects with exponential backoff
+            self._client.reconnect_delay_set(RECONNECT_MIN, RECONNECT_MAX)
+            self._client.connect_async(self.host, self.port, 60)
+            self._client.loop_start()
+        _LOGGER.info("MQTT client started for %s:%s", self.host, self.port)
+
+    async def async_stop(self) -> None:
+        """Stop the network loop and disconnect from the broker.
+
+        Returns without waiting for a connect attempt or paho's thread.
+        """
+        self._stopped = True
+        if self.in_event_loop:
+            if self._supervisor is not None:
+                self._supervisor.cancel()
+                self._supervisor = None
+            if self._sock is not None:
+                # Sends DISCONNECT and closes the socket without blocking
+                self._client.disconnect()
+                self._client.loop_write()
+            _LOGGER.info("MQTT client stopped for %s:%s", self.host, self.port)
+            return
+
+        try:
+            self._client.disconnect()
+        except Exception as err:
+            _LOGGER.error("Failed to disconnect from MQTT broker: %s", err)
+        # The thread exits on its own once disconnected
+        self.hass.async_add_executor_job(self._client.loop_stop)
+        _LOGGER.info("MQTT client stopped for %s:%s", self.host, self.port)
+
+
+class ZendureMqttConnectionPool:
+    """Reference counted broker connections shared between config entries."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the pool."""
+        self.hass = hass
+        self._connections: dict[BrokerKey, ZendureMqttConnection] = {}
+        self._entries: dict[str, BrokerKey] = {}
+        self._lock = asyncio.Lock()
+
+    async def async_acquire(
+        self,
+        entry_id: str,
+        host: str,
+        port: int,
+        username: str | None,
+        password: str | None,
+        transport: str,
+    ) -> ZendureMqttConnection:
+        """Return the connection for a broker, starting it if needed.
+
+        The transport is a setting of the connection, so the entry that opens
+        it decides; entries joining later keep its transport.
+        """
+        key = (host, port, username or None, password or None)
+        async with self._lock:
+            self._entries[entry_id] = key
+            if (connection := self._connections.get(key)) is None:
+                connection = ZendureMqttConnection(
+                    self.hass, host, port, username, password, transport
+                )
+                self._connections[key] = connection
+                await connection.async_start()
+            elif connection.transport != transport:
+                _LOGGER.warning(
+                    "Using the %s transport of the open connection to %s:%s "
+                    "instead of %s; the transport applies to all devices on a broker",
+                    connection.transport,
+                    host,
+                    port,
+                    transport,
+                )
+            return connection
+
+    async def async_release(self, entry_id: str) -> None:
+        """Release the connection of an entry, stopping it when unused."""
+        async with self._lock:
+            if (key := self._entries.pop(entry_id, None)) is None:
+                return
+            if key in self._entries.values():
+                return
+            if (connection := self._connections.pop(key, None)) is not None:
+                await connection.async_stop()
+
+    def get(self, entry_id: str) -> ZendureMqttConnection:
+        """Return the connection acquired for an entry."""
+        return self._connections[self._entries[entry_id]]
+
+    def __len__(self) -> int:
+        """Return the number of open broker connections."""
+        return len(self._connections)
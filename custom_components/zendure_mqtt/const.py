@@ -9,9 +9,43 @@ CONF_MQTT_USERNAME = "mqtt_username"
 CONF_MQTT_PASSWORD = "mqtt_password"
 CONF_DEVICE_MODEL = "device_model"
 CONF_DEVICE_ID = "device_id"
+CONF_TRANSPORT = "transport"
+CONF_UPDATE_FILTERS = "update_filters"
+CONF_PROPERTY = "property"
+CONF_DEADBAND = "deadband"
+CONF_DEADBAND_PERCENT = "deadband_percent"
+CONF_MIN_INTERVAL = "min_interval"
+CONF_PACK_EXPIRY = "pack_expiry"
+CONF_COMMAND_INTERVAL = "command_interval"
+CONF_RECORD_TRAFFIC = "record_traffic"
+CONF_STATE_WRITE_INTERVAL = "state_write_interval"
+# Discovered device picked in the config flow
+CONF_DEVICE = "device"
+
+# Keys in hass.data[DOMAIN] besides config entry IDs
+DATA_CONNECTIONS = "connections"
+DATA_BATCHER = "batcher"
+# Snapshot stores of unloaded entries, by entry ID
+DATA_SNAPSHOTS = "snapshots"
+
+# Dispatcher signal sent when a device reports properties for the first time
+SIGNAL_NEW_PROPERTIES = f"{DOMAIN}_new_properties_{{entry_id}}"
 
 # Default values
 DEFAULT_MQTT_PORT = 1883
+# Seconds without a report before a battery pack is forgotten
+DEFAULT_PACK_EXPIRY = 86400
+# Minimum seconds between two write commands to a device
+DEFAULT_COMMAND_INTERVAL = 1.0
+# Seconds entity state writes are collected before they are written together;
+# 0 writes them once per event loop iteration
+DEFAULT_STATE_WRITE_INTERVAL = 0.0
+
+# MQTT transports: paho's network thread or sockets driven by the event loop
+TRANSPORT_THREAD = "thread"
+TRANSPORT_ASYNCIO = "asyncio"
+TRANSPORTS = [TRANSPORT_ASYNCIO, TRANSPORT_THREAD]
+DEFAULT_TRANSPORT = TRANSPORT_ASYNCIO
 
 # Supported device models
 MODEL_HUB1200 = "hub1200"
@@ -36,9 +70,13 @@ DEVICE_PRODUCT_IDS = {
     MODEL_ACE1500: "8bM93H",
     MODEL_HYPER2000: "gDa3tb",
 }
+# Device model of each product ID
+PRODUCT_MODELS = {product_id: model for model, product_id in DEVICE_PRODUCT_IDS.items()}
 
 # MQTT Topics
 TOPIC_PREFIX = "zendure"
+MQTT_TOPIC_DEVICE = "/{product_id}/{device_id}/#"
 MQTT_TOPIC_REPORT = "/{product_id}/{device_id}/properties/report"
+MQTT_TOPIC_READ = "iot/{product_id}/{device_id}/properties/read"
 MQTT_TOPIC_WRITE = "iot/{product_id}/{device_id}/properties/write"
 MQTT_TOPIC_WRITE_REPLY = "/{product_id}/{device_id}/properties/write/reply"
@@ -0,0 +1,30 @@
+"""JSON decoders for raw MQTT payloads."""
+from collections.abc import Callable
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Parses a raw payload; raises ValueError if it is not valid UTF-8 JSON
+Decoder = Callable[[bytes], Any]
+
+
+def _stdlib_loads(payload: bytes) -> Any:
+    """Parse a payload with the standard library."""
+    return json.loads(payload)
+
+
+# Available decoders by name; all parse bytes without decoding them first
+DECODERS: dict[str, Decoder] = {"json": _stdlib_loads}
+if orjson is not None:
+    DECODERS["orjson"] = orjson.loads
+
+DEFAULT_DECODER = "orjson" if orjson is not None else "json"
+
+
+def get_decoder(name: str | None = None) -> Decoder:
+    """Return a decoder by name, or the fastest one installed."""
+    return DECODERS[name or DEFAULT_DECODER]
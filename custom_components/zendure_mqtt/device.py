@@ -0,0 +1,657 @@
+"""Zendure device state shared by all entities of a config entry."""
+import json
+import logging
+import random
+import time
+from collections.abc import Callable, Iterable, Mapping
+from typing import Any
+
+from homeassistant.core import HassJob, HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_call_later
+
+from .batcher import StateWriteBatcher
+from .commands import CommandQueue
+from .connection import ZendureMqttConnection, plan_subscriptions
+from .const import (
+    DEFAULT_COMMAND_INTERVAL,
+    DEFAULT_PACK_EXPIRY,
+    DEFAULT_STATE_WRITE_INTERVAL,
+    DOMAIN,
+    MQTT_TOPIC_DEVICE,
+    MQTT_TOPIC_READ,
+    MQTT_TOPIC_REPORT,
+    MQTT_TOPIC_WRITE,
+    MQTT_TOPIC_WRITE_REPLY,
+    SIGNAL_NEW_PROPERTIES,
+)
+from .decoder import Decoder, get_decoder
+from .handoff import ReportHandoff
+from .metrics import MessageMetrics
+from .properties import (
+    DEVICE_CONVERTERS,
+    DEVICE_PROPERTIES,
+    PACK_CONVERTERS,
+    PACK_PROPERTIES,
+    Converter,
+    PropertyDefinition,
+    UpdateFilter,
+    encode_writes,
+)
+from .recording import TrafficRecorder
+from .resync import ResyncScheduler
+from .snapshot import SnapshotStore
+from .store import DEVICE_SLOTS, PACK_SLOTS, UNSET, DeviceStore
+
+_LOGGER = logging.getLogger(__name__)
+
+# (pack serial number or None for the device itself, property key)
+PropertyKey = tuple[str | None, str]
+# A converted value with the store slot it goes to
+SlotValue = tuple[PropertyKey, int, Any]
+
+# Converter and store slot of each known property, looked up once per value
+DEVICE_DISPATCH: dict[str, tuple[Converter | None, int]] = {
+    key: (DEVICE_CONVERTERS[key], slot) for key, slot in DEVICE_SLOTS.items()
+}
+PACK_DISPATCH: dict[str, tuple[Converter | None, int]] = {
+    key: (PACK_CONVERTERS[key], slot) for key, slot in PACK_SLOTS.items()
+}
+
+# Summary state for packState when electricLevel is not reported
+PACK_STATES = {0: "idle", 1: "charging", 2: "discharging"}
+# Store slots the summary state is derived from
+ELECTRIC_LEVEL_SLOT = DEVICE_SLOTS["electricLevel"]
+PACK_STATE_SLOT = DEVICE_SLOTS["packState"]
+
+# Seconds between checks for packs that stopped reporting
+PACK_EXPIRY_CHECK_INTERVAL = 60
+
+
+def parse_report(
+    data: Any,
+) -> tuple[list[SlotValue], dict[PropertyKey, Any], int | None]:
+    """Split a decoded report into values, unknown properties and pack count."""
+    values: list[SlotValue] = []
+    extras: dict[PropertyKey, Any] = {}
+    pack_count: int | None = None
+    if not isinstance(data, dict):
+        return values, extras, pack_count
+
+    properties = data.get("properties")
+    if isinstance(properties, dict):
+        for prop_key, prop_value in properties.items():
+            if (entry := DEVICE_DISPATCH.get(prop_key)) is None:
+                # Store unknown properties as-is
+                extras[(None, prop_key)] = prop_value
+                continue
+            converter, slot = entry
+            if converter is not None:
+                prop_value = converter(prop_value)
+            values.append(((None, prop_key), slot, prop_value))
+
+    pack_data = data.get("packData")
+    if isinstance(pack_data, list):
+        pack_count = len(pack_data)
+        for pack in pack_data:
+            if not isinstance(pack, dict) or (pack_sn := pack.get("sn")) is None:
+                continue
+            for prop_key, prop_value in pack.items():
+                if (entry := PACK_DISPATCH.get(prop_key)) is None:
+                    if prop_key != "sn":
+                        # Store unknown pack properties as-is
+                        extras[(pack_sn, prop_key)] = prop_value
+                    continue
+                converter, slot = entry
+                if converter is not None:
+                    prop_value = converter(prop_value)
+                values.append(((pack_sn, prop_key), slot, prop_value))
+
+    return values, extras, pack_count
+
+
+def summary_state(store: DeviceStore, status: str) -> str:
+    """Return the battery level, else the pack state, else the status."""
+    if (level := store.values[ELECTRIC_LEVEL_SLOT]) is not UNSET:
+        return str(level)
+    if (pack_state := store.values[PACK_STATE_SLOT]) is not UNSET:
+        # Devices may send anything, so only integers are looked up
+        if isinstance(pack_state, int) and pack_state in PACK_STATES:
+            return PACK_STATES[pack_state]
+        return str(pack_state)
+    return status
+
+
+class ZendureDevice:
+    """Decoded state of one Zendure device, fed by its MQTT reports."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        connection: ZendureMqttConnection,
+        entry_id: str,
+        device_model: str,
+        device_id: str,
+        product_id: str,
+        update_filters: dict[str, UpdateFilter] | None = None,
+        pack_expiry: float = DEFAULT_PACK_EXPIRY,
+        command_interval: float = DEFAULT_COMMAND_INTERVAL,
+        recorder: TrafficRecorder | None = None,
+        decoder: Decoder | None = None,
+        batcher: StateWriteBatcher | None = None,
+        state_write_interval: float = DEFAULT_STATE_WRITE_INTERVAL,
+    ) -> None:
+        """Initialize the device."""
+        self.hass = hass
+        self.connection = connection
+        self.entry_id = entry_id
+        self.device_model = device_model
+        self.device_id = device_id
+        self.product_id = product_id
+        self.available = False
+        # Summary state shown by the main sensor, derived from the stored values
+        self.state: str | None = None
+        # Shown until electricLevel or packState is known: the last non-JSON
+        # payload, or "online"
+        self._status = "online"
+        # Property values, and values without a definition shown as
+        # attributes of the main sensor
+        self.store = DeviceStore(pack_expiry)
+        self._last_expiry_check = time.monotonic()
+        self._listeners: dict[PropertyKey | None, list[Callable[[], None]]] = {}
+        self.messages_received = 0
+        # Message rate, bytes and parse times for the diagnostics
+        self.metrics = MessageMetrics(time.monotonic())
+        self.state_writes = 0
+        self.filtered_updates = 0
+        # Deadband and minimum interval per property key
+        self._update_filters = update_filters or {}
+        # Values held back by a minimum interval, written when it passes
+        self._pending: dict[PropertyKey, Any] = {}
+        self._last_write: dict[PropertyKey, float] = {}
+        self._cancel_flush: Callable[[], None] | None = None
+        self._flush_job = HassJob(
+            self._async_flush_pending, "zendure_mqtt flush", cancel_on_shutdown=True
+        )
+        # Property writes merged into rate limited commands
+        self._commands = CommandQueue(hass, self._publish_write, command_interval)
+        # Last known state, saved across restarts
+        self.snapshot = SnapshotStore(hass, entry_id, self._snapshot_data)
+        # True while the state comes from the snapshot, until the first report
+        self.restored = False
+        # Full state requests after (re)connects and quiet periods
+        self._resync = ResyncScheduler(hass, self._request_full_state)
+        self._reply_topic = MQTT_TOPIC_WRITE_REPLY.format(
+            product_id=product_id, device_id=device_id
+        )
+        # Capture of the raw messages, when enabled in the options
+        self._recorder = recorder
+        self._decode = decoder or get_decoder()
+        # Reports parsed on paho's thread wait here for the event loop
+        self._handoff = ReportHandoff(hass, self._apply_updates)
+        # Entity state writes, batched with those of the other devices
+        self._batcher = batcher or StateWriteBatcher(hass)
+        self._state_write_interval = state_write_interval
+        self._remove_device: Callable[[], None] | None = None
+
+    @property
+    def name(self) -> str:
+        """Return the device name."""
+        return f"Zendure {self.device_model.upper()} ({self.device_id})"
+
+    @property
+    def device_info(self) -> dict[str, Any]:
+        """Return device information."""
+        return {
+            "identifiers": {(DOMAIN, self.device_id)},
+            "name": self.name,
+            "manufacturer": "Zendure",
+            "model": self.device_model.upper(),
+            "sw_version": self.product_id,
+        }
+
+    @property
+    def signal_new_properties(self) -> str:
+        """Return the dispatcher signal sent when new properties appear."""
+        return SIGNAL_NEW_PROPERTIES.format(entry_id=self.entry_id)
+
+    @property
+    def topics(self) -> list[str]:
+        """Return the minimal set of topics this device subscribes to."""
+        topic_args = {"product_id": self.product_id, "device_id": self.device_id}
+        return plan_subscriptions(
+            [
+                # Device report topic
+                MQTT_TOPIC_REPORT.format(**topic_args),
+                # Write reply topic for command responses
+                MQTT_TOPIC_WRITE_REPLY.format(**topic_args),
+                # Also subscribe to all device topics for compatibility
+                MQTT_TOPIC_DEVICE.format(**topic_args),
+            ]
+        )
+
+    @staticmethod
+    def definition(key: PropertyKey) -> PropertyDefinition:
+        """Return the definition of a property."""
+        pack_sn, prop_key = key
+        if pack_sn is None:
+            return DEVICE_PROPERTIES[prop_key]
+        return PACK_PROPERTIES[prop_key]
+
+    @property
+    def attributes(self) -> Mapping[str, Any]:
+        """Return the read-only snapshot of the values without an entity."""
+        return self.store.attributes()
+
+    def keys(self) -> list[PropertyKey]:
+        """Return the keys of all properties with a value."""
+        return self.store.keys()
+
+    def get_value(self, key: PropertyKey) -> Any:
+        """Return the converted value of a property, or None if unknown."""
+        return self.store.get(*key)
+
+    def has_pack(self, pack_sn: str | None) -> bool:
+        """Return True if a pack is reporting; None stands for the device."""
+        return pack_sn is None or pack_sn in self.store.packs
+
+    async def async_restore(self) -> None:
+        """Load the state saved before the last restart."""
+        if not (data := await self.snapshot.async_load()):
+            return
+        self.store.restore(data, time.monotonic())
+        self.state = data.get("state")
+        self.restored = True
+        _LOGGER.debug("Restored state of %s", self.device_id)
+
+    def _snapshot_data(self) -> dict[str, Any]:
+        """Return the state to save."""
+        return {"state": self.state, **self.store.as_dict()}
+
+    @callback
+    def _async_save_snapshot(self) -> None:
+        """Schedule a save of the state."""
+        self.snapshot.async_schedule_save()
+
+    def start(self) -> None:
+        """Start receiving messages for the device."""
+        self._resync.async_start()
+        if self._recorder is not None:
+            self._recorder.async_start()
+        self._remove_device = self.connection.add_device(
+            self.product_id,
+            self.device_id,
+            self.topics,
+            self._on_message,
+            self._on_connection,
+        )
+
+    def stop(self) -> None:
+        """Stop receiving messages for the device."""
+        if self._remove_device is not None:
+            self._remove_device()
+            self._remove_device = None
+        self._resync.async_stop()
+        if self._cancel_flush is not None:
+            self._cancel_flush()
+            self._cancel_flush = None
+        # Writes already accepted are still sent
+        self._commands.async_stop()
+        if self._recorder is not None:
+            self._recorder.async_stop()
+
+    def add_listener(
+        self, key: PropertyKey | None, update_callback: Callable[[], None]
+    ) -> Callable[[], None]:
+        """Call update_callback when a property changes; returns a remove callable.
+
+        The key None listens to the summary state and attributes.
+        """
+        self._listeners.setdefault(key, []).append(update_callback)
+
+        def remove_listener() -> None:
+            """Remove the listener."""
+            self._listeners[key].remove(update_callback)
+
+        return remove_listener
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Return message and state write counters and the store size."""
+        return {
+            "messages_received": self.messages_received,
+            "state_writes": self.state_writes,
+            "filtered_updates": self.filtered_updates,
+            "resync_requests": self._resync.requests_sent,
+            "snapshot_saves": self.snapshot.saves,
+            **self._commands.stats,
+            **self._handoff.stats,
+            **self.store.size,
+        }
+
+    def _notify(self, keys: Iterable[PropertyKey | None]) -> None:
+        """Tell the entities of the changed keys about the update."""
+        for key in keys:
+            for update_callback in self._listeners.get(key, ()):
+                self.state_writes += 1
+                update_callback()
+
+    def runtime_metrics(self) -> dict[str, Any]:
+        """Return the metrics shown by the diagnostic sensors."""
+        return self.metrics.as_dict(time.monotonic())
+
+    @callback
+    def async_schedule_write(self, write_state: Callable[[], None]) -> None:
+        """Write an entity state with the next batch."""
+        self._batcher.async_schedule(write_state, self._state_write_interval)
+
+    def _send_new_properties(self, keys: list[PropertyKey]) -> None:
+        """Ask the platforms to create entities for new properties."""
+        async_dispatcher_send(self.hass, self.signal_new_properties, keys)
+
+    def _on_connection(self, connected: bool) -> None:
+        """Handle a change of the shared broker connection."""
+        if self.connection.in_event_loop:
+            self._async_connection_changed(connected)
+        else:
+            self.hass.loop.call_soon_threadsafe(self._async_connection_changed, connected)
+
+    @callback
+    def _async_connection_changed(self, connected: bool) -> None:
+        """Update availability and resync after a reconnect."""
+        if connected == self.available:
+            return
+        self.available = connected
+        self._notify(list(self._listeners))
+        if connected:
+            # Reports missed while disconnected are not replayed
+            self._resync.async_schedule()
+
+    def _request_full_state(self) -> bool:
+        """Ask the device to report all of its properties."""
+        if not self.connection.connected:
+            return False
+        topic = MQTT_TOPIC_READ.format(
+            product_id=self.product_id, device_id=self.device_id
+        )
+        payload = {
+            "messageId": str(random.randrange(1, 1 << 30)),
+            "deviceId": self.device_id,
+            "timestamp": int(time.time()),
+            "properties": ["getAll"],
+        }
+        _LOGGER.debug("Requesting full state of %s", self.device_id)
+        return self.connection.publish(topic, json.dumps(payload))
+
+    def _on_message(self, msg):
+        """Handle incoming MQTT messages."""
+        self.messages_received += 1
+        now = time.monotonic()
+        self._resync.last_report = now
+        self.metrics.record_message(len(msg.payload), now)
+        if self._recorder is not None:
+            self._recorder.record(msg.topic, msg.payload)
+        try:
+            topic = msg.topic
+            _LOGGER.debug("Received message on topic %s: %s", topic, msg.payload)
+            start = time.perf_counter()
+            try:
+                # Parsed straight from the bytes, without decoding to str first
+                data = self._decode(msg.payload)
+            except ValueError:
+                # Not JSON, store as raw payload
+                _LOGGER.debug("Payload is not JSON, storing as raw")
+                payload = msg.payload.decode("utf-8")
+                self._hand_over([], {}, None, {topic: payload}, payload)
+                return
+            decoded = time.perf_counter()
+            if topic == self._reply_topic and isinstance(data, dict):
+                self._on_write_reply(data)
+            values, extras, pack_count = parse_report(data)
+            self.metrics.record_timing(decoded - start, time.perf_counter() - decoded)
+            # Applied right here with the asyncio transport, so errors while
+            # updating the state are logged too instead of reaching paho
+            self._hand_over(values, extras, pack_count, {}, None)
+        except Exception as err:
+            _LOGGER.error("Error processing MQTT message: %s", err)
+
+    def _hand_over(
+        self,
+        values: list[SlotValue],
+        extras: dict[PropertyKey, Any],
+        pack_count: int | None,
+        raw: dict[str, str],
+        status: str | None,
+    ) -> None:
+        """Apply a parsed report, via the handoff when on paho's thread."""
+        if self.connection.in_event_loop:
+            self._apply_updates(values, extras, pack_count, raw, status)
+        else:
+            self._handoff.put(values, extras, pack_count, raw, status)
+
+    def _on_write_reply(self, data: dict[str, Any]) -> None:
+        """Match a write reply to the command it answers."""
+        if (message_id := data.get("messageId")) is None:
+            return
+        if self.connection.in_event_loop:
+            self._commands.async_acknowledge(str(message_id))
+        else:
+            self.hass.loop.call_soon_threadsafe(
+                self._commands.async_acknowledge, str(message_id)
+            )
+
+    @callback
+    def _apply_updates(
+        self,
+        values: list[SlotValue],
+        extras: dict[PropertyKey, Any],
+        pack_count: int | None,
+        raw: dict[str, str],
+        status: str | None,
+    ) -> None:
+        """Merge a parsed report and notify only the entities that changed."""
+        changed: list[PropertyKey | None] = []
+        new_keys: list[PropertyKey] = []
+        store = self.store
+        filters = self._update_filters
+        now = time.monotonic()
+        next_flush: float | None = None
+        # Values arrive grouped by pack, so look each pack up once
+        current_sn: str | None = None
+        current = store.values
+        for key, slot, value in values:
+            if (pack_sn := key[0]) != current_sn:
+                current_sn = pack_sn
+                current = store.values if pack_sn is None else store.pack(pack_sn, now).values
+            old = current[slot]
+            if old is UNSET:
+                new_keys.append(key)
+            else:
+                if old == value:
+                    self._pending.pop(key, None)
+                    continue
+                if (update_filter := filters.get(key[1])) is not None:
+                    if update_filter.within_deadband(old, value):
+                        self._pending.pop(key, None)
+                        self.filtered_updates += 1
+                        continue
+                    if update_filter.min_interval:
+                        wait = update_filter.min_interval - (
+                            now - self._last_write.get(key, 0)
+                        )
+                        if wait > 0:
+                            self._pending[key] = value
+                            self.filtered_updates += 1
+                            if next_flush is None or wait < next_flush:
+                                next_flush = wait
+                            continue
+                        self._last_write[key] = now
+            current[slot] = value
+            changed.append(key)
+
+        if status is not None:
+            self._status = status
+        summary_changed = self._update_summary()
+        for (pack_sn, attr_key), value in extras.items():
+            extra = store.extra if pack_sn is None else store.pack(pack_sn, now).extra
+            if store.set_extra(extra, attr_key, value):
+                summary_changed = True
+        if pack_count is not None and store.set_pack_count(pack_count):
+            summary_changed = True
+        for topic, payload in raw.items():
+            if store.set_raw(topic, payload):
+                summary_changed = True
+        # After merging, so the packs in this report count as seen
+        if now - self._last_expiry_check >= PACK_EXPIRY_CHECK_INTERVAL:
+            self._last_expiry_check = now
+            store.expire_packs(now)
+        if removed := store.pop_removed_packs():
+            changed.extend(self._forget_packs(removed))
+            summary_changed = True
+        if summary_changed:
+            changed.append(None)
+        if changed and not self.snapshot.save_scheduled:
+            self._async_save_snapshot()
+        if self.restored:
+            # Fresh data: no entity is marked as restored any more
+            self.restored = False
+            changed = list(self._listeners)
+
+        if new_keys:
+            self._send_new_properties(new_keys)
+        self._notify(changed)
+        if next_flush is not None:
+            self._async_schedule_flush(next_flush)
+
+    @callback
+    def _async_schedule_flush(self, delay: float) -> None:
+        """Write held back values once their minimum interval has passed."""
+        if self._cancel_flush is None:
+            self._cancel_flush = async_call_later(self.hass, delay, self._flush_job)
+
+    @callback
+    def _async_flush_pending(self, _now: Any) -> None:
+        """Write the held back values that are due."""
+        self._cancel_flush = None
+        now = time.monotonic()
+        changed: list[PropertyKey | None] = []
+        next_flush: float | None = None
+        for key, value in list(self._pending.items()):
+            wait = self._update_filters[key[1]].min_interval - (
+                now - self._last_write.get(key, 0)
+            )
+            if wait > 0:
+                if next_flush is None or wait < next_flush:
+                    next_flush = wait
+                continue
+            del self._pending[key]
+            self._last_write[key] = now
+            pack_sn, prop_key = key
+            if pack_sn is None:
+                current = self.store.values
+                slot = DEVICE_SLOTS[prop_key]
+            elif (pack := self.store.packs.get(pack_sn)) is not None:
+                current = pack.values
+                slot = PACK_SLOTS[prop_key]
+            else:
+                continue
+            if current[slot] != value:
+                current[slot] = value
+                changed.append(key)
+        if changed:
+            if self._update_summary():
+                changed.append(None)
+            self._async_save_snapshot()
+        self._notify(changed)
+        if next_flush is not None:
+            self._async_schedule_flush(next_flush)
+
+    def _update_summary(self) -> bool:
+        """Derive the summary state from the store; returns True if it changed."""
+        state = summary_state(self.store, self._status)
+        if state == self.state:
+            return False
+        self.state = state
+        return True
+
+    def _forget_packs(self, removed: list[str]) -> list[PropertyKey]:
+        """Drop the held back values of removed packs; returns their keys."""
+        _LOGGER.debug("Removed packs %s that stopped reporting", removed)
+        serials = set(removed)
+        for held in (self._pending, self._last_write):
+            for key in [key for key in held if key[0] in serials]:
+                del held[key]
+        # Their entities become unavailable
+        return [key for key in self._listeners if key is not None and key[0] in serials]
+
+    def publish_mqtt(self, topic: str, payload: str) -> bool:
+        """Publish a message to an MQTT topic."""
+        return self.connection.publish(topic, payload)
+
+    async def async_write_property(self, properties: dict[str, Any]) -> bool:
+        """Write properties to the device; returns True once the device replies.
+
+        Values are given in the units of the entities and converted to raw
+        device values. Raises ValueError for read-only properties and values
+        out of range. Writes made in quick succession are merged into one
+        command. Returns False if the command could not be published or was
+        not acknowledged.
+        """
+        encoded = encode_writes(properties)
+        if not self.connection.connected:
+            _LOGGER.error("Cannot write %s, not connected", list(properties))
+            return False
+        return await self._commands.async_submit(encoded)
+
+    def write_property(self, properties: dict[str, Any]) -> bool:
+        """Queue properties to write to device using the command topic.
+
+        Args:
+            properties: Dictionary of property names and values to write, in
+                the units of the entities
+
+        Returns:
+            True if the write was queued, False if a value is invalid or the
+            broker is not connected
+
+        Example:
+            device.write_property({"outputLimit": 1000, "socSet": 90})
+        """
+        try:
+            encoded = encode_writes(properties)
+        except ValueError as err:
+            _LOGGER.error("Rejected write: %s", err)
+            return False
+        if not self.connection.connected:
+            _LOGGER.error("Cannot write %s, not connected", list(properties))
+            return False
+        self.hass.loop.call_soon_threadsafe(self._commands.async_submit, encoded)
+        return True
+
+    def _publish_write(self, message_id: str, properties: dict[str, Any]) -> bool:
+        """Publish one write command with the given properties."""
+        try:
+            # Build command topic
+            command_topic = MQTT_TOPIC_WRITE.format(
+                product_id=self.product_id, device_id=self.device_id
+            )
+
+            # Build payload with properties
+            payload = {
+                "messageId": message_id,
+                "deviceId": self.device_id,
+                "timestamp": int(time.time()),
+                "properties": properties,
+            }
+
+            # Publish command
+            if self.connection.publish(command_topic, json.dumps(payload)):
+                _LOGGER.info("Published write command to %s: %s", command_topic, properties)
+                return True
+            else:
+                _LOGGER.error("Failed to publish write command to %s", command_topic)
+                return False
+
+        except Exception as err:
+            _LOGGER.error("Failed to write property: %s", err)
+            return False
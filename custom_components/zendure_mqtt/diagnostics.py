@@ -0,0 +1,39 @@
+"""Diagnostics support for Zendure MQTT."""
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import CONF_MQTT_PASSWORD, CONF_MQTT_USERNAME, DATA_BATCHER, DOMAIN
+from .device import ZendureDevice
+
+TO_REDACT = {CONF_MQTT_PASSWORD, CONF_MQTT_USERNAME}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return runtime counters and the decoded state of a config entry."""
+    device: ZendureDevice = hass.data[DOMAIN][entry.entry_id]
+    connection = device.connection
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "connection": {
+            "host": connection.host,
+            "port": connection.port,
+            "transport": connection.transport,
+            "connected": connection.connected,
+            "reconnects": connection.reconnects,
+            "duplicates": connection.duplicates,
+        },
+        "device": {
+            "available": device.available,
+            "restored": device.restored,
+            "state": device.state,
+            "metrics": device.runtime_metrics(),
+            "stats": device.stats,
+        },
+        "state_writes": hass.data[DOMAIN][DATA_BATCHER].stats,
+        "values": device.store.as_dict(),
+    }
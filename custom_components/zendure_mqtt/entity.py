@@ -0,0 +1,101 @@
+"""Base entity for Zendure MQTT property entities."""
+from collections.abc import Callable, Mapping
+from types import MappingProxyType
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .const import DOMAIN
+from .device import PropertyKey, ZendureDevice
+from .properties import PropertyDefinition
+
+# Attributes of an entity whose state was restored from before the last restart
+RESTORED_ATTRIBUTES: Mapping[str, Any] = MappingProxyType({"restored": True})
+
+
+def async_setup_property_entities(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+    platform: str,
+    entity_factory: Callable[[ZendureDevice, PropertyKey, PropertyDefinition], Entity],
+) -> None:
+    """Add entities for the properties of a platform as they are reported."""
+    device: ZendureDevice = hass.data[DOMAIN][config_entry.entry_id]
+    created: set[PropertyKey] = set()
+
+    @callback
+    def async_add_properties(keys: list[PropertyKey]) -> None:
+        """Create entities for newly reported properties."""
+        entities = []
+        for key in keys:
+            definition = device.definition(key)
+            if key in created or definition["ha_entity"] != platform:
+                continue
+            created.add(key)
+            entities.append(entity_factory(device, key, definition))
+        if entities:
+            async_add_entities(entities)
+
+    config_entry.async_on_unload(
+        async_dispatcher_connect(hass, device.signal_new_properties, async_add_properties)
+    )
+    async_add_properties(device.keys())
+
+
+class ZendureEntity(Entity):
+    """An entity for a single device or battery pack property."""
+
+    _attr_should_poll = False
+    _attr_has_entity_name = True
+
+    def __init__(
+        self,
+        device: ZendureDevice,
+        key: PropertyKey,
+        definition: PropertyDefinition,
+    ) -> None:
+        """Initialize the entity."""
+        self._device = device
+        self._key = key
+        pack_sn, prop_key = key
+        if pack_sn is None:
+            self._attr_name = definition["name"]
+            self._attr_unique_id = f"{DOMAIN}_{device.entry_id}_{prop_key}"
+        else:
+            self._attr_name = f"Pack {pack_sn} {definition['name']}"
+            self._attr_unique_id = f"{DOMAIN}_{device.entry_id}_pack_{pack_sn}_{prop_key}"
+        self._attr_device_class = definition["device_class"]
+        self._attr_device_info = device.device_info
+
+    @property
+    def available(self) -> bool:
+        """Return True if entity is available."""
+        device = self._device
+        return (device.available or device.restored) and device.has_pack(self._key[0])
+
+    @property
+    def extra_state_attributes(self) -> Mapping[str, Any] | None:
+        """Mark a state restored from before the last restart."""
+        if self._device.restored:
+            return RESTORED_ATTRIBUTES
+        return None
+
+    @property
+    def value(self) -> Any:
+        """Return the current value of the property."""
+        return self._device.get_value(self._key)
+
+    async def async_added_to_hass(self) -> None:
+        """Run when entity about to be added to hass."""
+        await super().async_added_to_hass()
+        self.async_on_remove(self._device.add_listener(self._key, self._handle_update))
+
+    @callback
+    def _handle_update(self) -> None:
+        """Queue a state write; the device always calls this in the event loop."""
+        self._device.async_schedule_write(self.async_write_ha_state)
@@ -0,0 +1,119 @@
+"""Handoff of parsed reports from paho's network thread to the event loop."""
+from collections.abc import Callable
+import threading
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+
+# Distinct values, unknown properties and raw topics waiting at most; values
+# for further keys are dropped until the event loop catches up
+MAX_PENDING_VALUES = 1024
+
+# (pack serial number or None, property key), as in device.py
+_Key = tuple[str | None, str]
+
+
+class ReportHandoff:
+    """Merge reports parsed on the network thread into one pending update.
+
+    The newest value of each key wins, so a burst of reports costs one
+    callback in the event loop, scheduled once per loop iteration, instead of
+    one job per report and entity. Memory is bounded by the number of keys.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        apply: Callable[..., None],
+        max_pending: int = MAX_PENDING_VALUES,
+    ) -> None:
+        """Initialize the handoff."""
+        self.hass = hass
+        self._apply = apply
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        # Key -> (store slot, value)
+        self._values: dict[_Key, tuple[int, Any]] = {}
+        self._extras: dict[_Key, Any] = {}
+        self._raw: dict[str, str] = {}
+        self._pack_count: int | None = None
+        # Newest non-JSON status payload
+        self._status: str | None = None
+        # Reports merged into the pending update
+        self._depth = 0
+        self._scheduled = False
+        self.max_depth = 0
+        self.superseded = 0
+        self.dropped = 0
+        self.drains = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Return backpressure counters."""
+        return {
+            "handoff_depth": self._depth,
+            "handoff_max_depth": self.max_depth,
+            "handoff_superseded": self.superseded,
+            "handoff_dropped": self.dropped,
+            "handoff_drains": self.drains,
+        }
+
+    def put(
+        self,
+        values: list[tuple[_Key, int, Any]],
+        extras: dict[_Key, Any],
+        pack_count: int | None,
+        raw: dict[str, str],
+        status: str | None,
+    ) -> None:
+        """Merge a parsed report; called from the network thread."""
+        with self._lock:
+            for key, slot, value in values:
+                if self._admit(self._values, key):
+                    self._values[key] = (slot, value)
+            for key, value in extras.items():
+                if self._admit(self._extras, key):
+                    self._extras[key] = value
+            for topic, payload in raw.items():
+                if self._admit(self._raw, topic):
+                    self._raw[topic] = payload
+            if pack_count is not None:
+                self._pack_count = pack_count
+            if status is not None:
+                self._status = status
+            self._depth += 1
+            self.max_depth = max(self.max_depth, self._depth)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.hass.loop.call_soon_threadsafe(self._async_drain)
+
+    def _admit(self, pending: dict[Any, Any], key: Any) -> bool:
+        """Return True if a value for the key may be kept; called with the lock."""
+        if key in pending:
+            self.superseded += 1
+            return True
+        if len(self._values) + len(self._extras) + len(self._raw) >= self.max_pending:
+            self.dropped += 1
+            return False
+        return True
+
+    @callback
+    def _async_drain(self) -> None:
+        """Apply the pending update in the event loop."""
+        with self._lock:
+            values, self._values = self._values, {}
+            extras, self._extras = self._extras, {}
+            raw, self._raw = self._raw, {}
+            pack_count, self._pack_count = self._pack_count, None
+            status, self._status = self._status, None
+            self._depth = 0
+            self._scheduled = False
+        self.drains += 1
+        self._apply(
+            [(key, slot, value) for key, (slot, value) in values.items()],
+            extras,
+            pack_count,
+            raw,
+            status,
+        )
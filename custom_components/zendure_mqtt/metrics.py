@@ -0,0 +1,101 @@
+"""Low-overhead runtime metrics of a device's message path."""
+from array import array
+from collections.abc import Iterable
+from typing import Any
+
+# Seconds over which the message rate is averaged
+RATE_WINDOW = 60
+# Most recent parse and convert times kept for the percentiles
+TIMING_SAMPLES = 256
+# Percentiles reported for the parse and convert times
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    """Return the value below which `percent` % of the sorted samples stay."""
+    if not samples:
+        return 0.0
+    return samples[round(percent / 100 * (len(samples) - 1))]
+
+
+class MessageMetrics:
+    """Counters updated for every message, summarized only when read.
+
+    All storage is allocated up front and recording costs a few array
+    stores, so it can stay on in production without growing; it may happen
+    on paho's thread while the event loop reads.
+    """
+
+    __slots__ = (
+        "bytes_received",
+        "started",
+        "timings",
+        "_seconds",
+        "_counts",
+        "_parse_times",
+        "_convert_times",
+    )
+
+    def __init__(self, now: float) -> None:
+        """Initialize the metrics."""
+        self.bytes_received = 0
+        self.started = now
+        # Reports timed so far; the last TIMING_SAMPLES are kept
+        self.timings = 0
+        # Messages per second of the last RATE_WINDOW seconds, by second modulo
+        # RATE_WINDOW, with the second each slot counts
+        self._seconds = array("q", [-1]) * RATE_WINDOW
+        self._counts = array("Q", [0]) * RATE_WINDOW
+        # Seconds spent decoding the payload, and converting the parsed report
+        self._parse_times = array("d", [0.0]) * TIMING_SAMPLES
+        self._convert_times = array("d", [0.0]) * TIMING_SAMPLES
+
+    def record_message(self, size: int, now: float) -> None:
+        """Count a received message of `size` bytes."""
+        self.bytes_received += size
+        second = int(now)
+        slot = second % RATE_WINDOW
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._counts[slot] = 0
+        self._counts[slot] += 1
+
+    def record_timing(self, parse_time: float, convert_time: float) -> None:
+        """Keep the decode and conversion time of a report."""
+        slot = self.timings % TIMING_SAMPLES
+        self._parse_times[slot] = parse_time
+        self._convert_times[slot] = convert_time
+        self.timings += 1
+
+    def message_rate(self, now: float) -> float:
+        """Return the messages per second over the last RATE_WINDOW seconds."""
+        # Whole seconds, so the window runs from a second boundary to now
+        since = int(now) - RATE_WINDOW + 1
+        messages = sum(
+            count
+            for second, count in zip(self._seconds, self._counts)
+            if second >= since
+        )
+        window = min(now - since, now - self.started)
+        return messages / window if window > 0 else 0.0
+
+    def as_dict(self, now: float) -> dict[str, Any]:
+        """Return the message rate, bytes and timing percentiles in ms."""
+        samples = min(self.timings, TIMING_SAMPLES)
+        return {
+            "message_rate": round(self.message_rate(now), 2),
+            "bytes_received": self.bytes_received,
+            **_timing("parse_time", self._parse_times[:samples]),
+            **_timing("convert_time", self._convert_times[:samples]),
+        }
+
+
+def _timing(name: str, samples: Iterable[float]) -> dict[str, float]:
+    """Return the percentiles and maximum of timing samples in ms."""
+    ordered = sorted(samples)
+    timing = {
+        f"{name}_p{percent}": round(percentile(ordered, percent) * 1000, 3)
+        for percent in PERCENTILES
+    }
+    timing[f"{name}_max"] = round(ordered[-1] * 1000, 3) if ordered else 0.0
+    return timing
@@ -0,0 +1,52 @@
+"""Platform for Zendure MQTT number integration."""
+from homeassistant.components.number import NumberEntity
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .device import PropertyKey, ZendureDevice
+from .entity import ZendureEntity, async_setup_property_entities
+from .properties import PropertyDefinition
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up Zendure MQTT numbers based on a config entry."""
+    async_setup_property_entities(
+        hass, config_entry, async_add_entities, "number", ZendureNumber
+    )
+
+
+class ZendureNumber(ZendureEntity, NumberEntity):
+    """A number for a writable device property."""
+
+    def __init__(
+        self,
+        device: ZendureDevice,
+        key: PropertyKey,
+        definition: PropertyDefinition,
+    ) -> None:
+        """Initialize the number."""
+        super().__init__(device, key, definition)
+        self._attr_native_unit_of_measurement = definition["unit"]
+        self._attr_native_min_value = definition["min_value"]
+        self._attr_native_max_value = definition["max_value"]
+        self._attr_native_step = definition["step"]
+
+    @property
+    def native_value(self) -> float | None:
+        """Return the current value."""
+        return self.value
+
+    async def async_set_native_value(self, value: float) -> None:
+        """Write a new value to the device."""
+        try:
+            written = await self._device.async_write_property({self._key[1]: value})
+        except ValueError as err:
+            raise HomeAssistantError(str(err)) from err
+        if not written:
+            raise HomeAssistantError(f"Failed to write {self._key[1]}")
@@ -0,0 +1,255 @@
+"""Fast MQTT broker check and device discovery for the config flow."""
+import asyncio
+import logging
+import secrets
+import struct
+import time
+
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import PRODUCT_MODELS
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds allowed from opening the socket until the broker accepts the session
+PROBE_TIMEOUT = 5
+# Seconds to wait for a report from the device once connected
+REPORT_WAIT = 3
+# Seconds to listen for reports when discovering devices
+DISCOVERY_TIME = 10
+# Devices collected by one discovery scan at most
+MAX_DISCOVERED = 64
+# Report topic of every device on the broker
+DISCOVERY_TOPIC = "/+/+/properties/report"
+
+# CONNACK return codes that mean the credentials were refused
+_AUTH_REFUSED = (4, 5)
+_CONNACK = 0x20
+_PUBLISH = 0x30
+
+
+class CannotConnect(HomeAssistantError):
+    """Error to indicate we cannot connect."""
+
+
+class InvalidAuth(HomeAssistantError):
+    """Error to indicate there is invalid auth."""
+
+
+class ProbeResult:
+    """Outcome of a successful broker probe."""
+
+    __slots__ = ("rtt", "report_seen")
+
+    def __init__(self, rtt: float, report_seen: bool | None) -> None:
+        """Initialize the result."""
+        # Seconds from sending CONNECT until CONNACK arrived
+        self.rtt = rtt
+        # Whether a report arrived; None when no report topic was checked
+        self.report_seen = report_seen
+
+
+def encode_string(value: str) -> bytes:
+    """Encode an MQTT UTF-8 string."""
+    data = value.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+
+def encode_packet(packet_type: int, body: bytes) -> bytes:
+    """Add the fixed header with its variable length remaining length."""
+    header = bytearray([packet_type])
+    length = len(body)
+    while True:
+        byte, length = length % 128, length // 128
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(header) + body
+
+
+def connect_packet(
+    client_id: str, username: str | None, password: str | None, keepalive: int
+) -> bytes:
+    """Build an MQTT 3.1.1 CONNECT packet with a clean session."""
+    flags = 0x02
+    payload = encode_string(client_id)
+    if username:
+        flags |= 0x80
+        payload += encode_string(username)
+        if password:
+            flags |= 0x40
+            payload += encode_string(password)
+    header = encode_string("MQTT") + struct.pack("!BBH", 4, flags, keepalive)
+    return encode_packet(0x10, header + payload)
+
+
+def subscribe_packet(packet_id: int, topic: str) -> bytes:
+    """Build a SUBSCRIBE packet for one topic at QoS 0."""
+    return encode_packet(
+        0x82, struct.pack("!H", packet_id) + encode_string(topic) + b"\x00"
+    )
+
+
+async def _read_packet(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    """Read one packet; returns its type and body."""
+    packet_type = (await reader.readexactly(1))[0]
+    length = 0
+    for shift in range(0, 28, 7):
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+    return packet_type & 0xF0, await reader.readexactly(length)
+
+
+async def _wait_for_publish(reader: asyncio.StreamReader) -> None:
+    """Return once the broker delivers a message."""
+    while (await _read_packet(reader))[0] != _PUBLISH:
+        pass
+
+
+def _publish_topic(body: bytes) -> str:
+    """Return the topic of a QoS 0 PUBLISH packet."""
+    (length,) = struct.unpack_from("!H", body)
+    return body[2 : 2 + length].decode("utf-8", "replace")
+
+
+def _connection_error(host: str, port: int, timeout: float, err: Exception) -> CannotConnect:
+    """Describe a failed or timed out connection attempt."""
+    if isinstance(err, TimeoutError):
+        return CannotConnect(f"{host}:{port} did not answer within {timeout} s")
+    return CannotConnect(f"Failed to connect to {host}:{port}: {err}")
+
+
+def _connack_error(
+    host: str, port: int, packet_type: int, body: bytes
+) -> HomeAssistantError | None:
+    """Return the error for a CONNACK that refuses the session, if any."""
+    if packet_type != _CONNACK or len(body) < 2:
+        return CannotConnect(f"Unexpected reply from {host}:{port}")
+    if body[1] in _AUTH_REFUSED:
+        return InvalidAuth(f"{host}:{port} refused the credentials")
+    if body[1]:
+        return CannotConnect(f"{host}:{port} refused the connection ({body[1]})")
+    return None
+
+
+async def _async_open_session(
+    host: str,
+    port: int,
+    username: str | None,
+    password: str | None,
+    timeout: float,
+    keepalive: int,
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, float]:
+    """Connect and wait for CONNACK; returns the streams and the round-trip time."""
+    # One deadline covers the TCP connect and the MQTT handshake
+    deadline = asyncio.get_running_loop().time() + timeout
+    try:
+        async with asyncio.timeout_at(deadline):
+            reader, writer = await asyncio.open_connection(host, port)
+    except (TimeoutError, OSError) as err:
+        raise _connection_error(host, port, timeout, err) from err
+
+    try:
+        async with asyncio.timeout_at(deadline):
+            started = time.monotonic()
+            writer.write(
+                connect_packet(
+                    f"zendure_mqtt-probe-{secrets.token_hex(4)}",
+                    username,
+                    password,
+                    keepalive=keepalive,
+                )
+            )
+            await writer.drain()
+            packet_type, body = await _read_packet(reader)
+            rtt = time.monotonic() - started
+    except (TimeoutError, OSError, asyncio.IncompleteReadError) as err:
+        writer.close()
+        raise _connection_error(host, port, timeout, err) from err
+    if (error := _connack_error(host, port, packet_type, body)) is not None:
+        writer.close()
+        raise error
+    return reader, writer, rtt
+
+
+def _close_session(writer: asyncio.StreamWriter) -> None:
+    """Send DISCONNECT and close the connection."""
+    writer.write(b"\xe0\x00")
+    writer.close()
+
+
+async def async_probe_broker(
+    host: str,
+    port: int,
+    username: str | None,
+    password: str | None,
+    report_topic: str | None = None,
+    timeout: float = PROBE_TIMEOUT,
+    report_wait: float = REPORT_WAIT,
+) -> ProbeResult:
+    """Complete an MQTT handshake with the broker within `timeout` seconds.
+
+    Raises CannotConnect if the broker is unreachable, does not answer in time
+    or refuses the session, and InvalidAuth if it refuses the credentials. With
+    a `report_topic`, also waits up to `report_wait` seconds for a message on it.
+    """
+    reader, writer, rtt = await _async_open_session(
+        host, port, username, password, timeout, max(int(timeout + report_wait) * 2, 10)
+    )
+    try:
+        report_seen: bool | None = None
+        if report_topic is not None:
+            writer.write(subscribe_packet(1, report_topic))
+            try:
+                async with asyncio.timeout(report_wait):
+                    await writer.drain()
+                    await _wait_for_publish(reader)
+                report_seen = True
+            except (TimeoutError, OSError, asyncio.IncompleteReadError):
+                report_seen = False
+        return ProbeResult(rtt, report_seen)
+    finally:
+        _close_session(writer)
+
+
+async def async_discover_devices(
+    host: str,
+    port: int,
+    username: str | None,
+    password: str | None,
+    duration: float = DISCOVERY_TIME,
+    limit: int = MAX_DISCOVERED,
+    timeout: float = PROBE_TIMEOUT,
+) -> dict[tuple[str, str], str]:
+    """Listen for reports of all devices on the broker.
+
+    Subscribes once to DISCOVERY_TOPIC and returns the model of each
+    (product ID, device ID) that reported within `duration` seconds, stopping
+    early once `limit` devices were found. Only known product IDs are kept
+    and payloads are discarded unparsed. Raises like async_probe_broker.
+    """
+    reader, writer, _ = await _async_open_session(
+        host, port, username, password, timeout, max(int(duration) * 2, 10)
+    )
+    found: dict[tuple[str, str], str] = {}
+    try:
+        writer.write(subscribe_packet(1, DISCOVERY_TOPIC))
+        async with asyncio.timeout(duration):
+            await writer.drain()
+            while len(found) < limit:
+                packet_type, body = await _read_packet(reader)
+                if packet_type != _PUBLISH:
+                    continue
+                # Topics look like /{product_id}/{device_id}/properties/report
+                parts = _publish_topic(body).split("/")
+                if len(parts) != 5 or (model := PRODUCT_MODELS.get(parts[1])) is None:
+                    continue
+                found.setdefault((parts[1], parts[2]), model)
+    except (TimeoutError, OSError, asyncio.IncompleteReadError):
+        # The scan ends at the deadline or when the broker goes away
+        pass
+    finally:
+        _close_session(writer)
+    _LOGGER.debug("Discovered %s Zendure devices on %s:%s", len(found), host, port)
+    return found
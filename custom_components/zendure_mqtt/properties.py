@@ -1,6 +1,8 @@
 """Property definitions for Zendure devices."""
-
-from typing import TypedDict, Literal
+import ast
+from collections.abc import Callable
+from functools import lru_cache
+from typing import Any, Literal, NotRequired, TypedDict
 
 
 class PropertyDefinition(TypedDict):
@@ -16,6 +18,10 @@ class PropertyDefinition(TypedDict):
     min_value: float | None
     max_value: float | None
     step: float | None
+    # Update filtering defaults, see UpdateFilter
+    deadband: NotRequired[float]
+    deadband_percent: NotRequired[float]
+    min_interval: NotRequired[float]
 
 
 # Device properties (67 total)
@@ -33,6 +39,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "solarPower1": {
         "name": "Solar Power 1",
@@ -46,6 +53,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "solarPower2": {
         "name": "Solar Power 2",
@@ -59,6 +67,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "outputPackPower": {
         "name": "Output Pack Power",
@@ -72,6 +81,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "packInputPower": {
         "name": "Pack Input Power",
@@ -85,6 +95,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "gridInputPower": {
         "name": "Grid Input Power",
@@ -98,6 +109,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "outputHomePower": {
         "name": "Output Home Power",
@@ -111,6 +123,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "invOutputPower": {
         "name": "Inverter Output Power",
@@ -124,6 +137,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "energyPower": {
         "name": "Energy Power",
@@ -137,6 +151,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "outputLimit": {
         "name": "Output Limit",
@@ -176,6 +191,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "solarPower2Cycle": {
         "name": "Solar Power 2 Cycle",
@@ -189,6 +205,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "outputPackPowerCycle": {
         "name": "Output Pack Power Cycle",
@@ -202,6 +219,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "gridInputPowerCycle": {
         "name": "Grid Input Power Cycle",
@@ -215,6 +233,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "packInputPowerCycle": {
         "name": "Pack Input Power Cycle",
@@ -228,6 +247,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "outputHomePowerCycle": {
         "name": "Output Home Power Cycle",
@@ -241,6 +261,7 @@ DEVICE_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     
     # Category 2: Battery Management (8 properties)
@@ -973,6 +994,7 @@ PACK_PROPERTIES: dict[str, PropertyDefinition] = {
         "min_value": None,
         "max_value": None,
         "step": None,
+        "deadband": 2,
     },
     "socLevel": {
         "name": "SOC Level",
@@ -1029,13 +1051,280 @@ PACK_PROPERTIES: dict[str, PropertyDefinition] = {
 }
 
 
+Converter = Callable[[Any], Any]
+
+# AST nodes allowed in a conversion formula
+_ALLOWED_NODES = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.USub,
+    ast.UAdd,
+)
+
+
+def _parse_formula(conversion: str) -> ast.Expression:
+    """Parse a conversion formula, allowing only arithmetic on ``value``."""
+    tree = ast.parse(conversion, mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"Unsupported conversion formula: {conversion}")
+        if isinstance(node, ast.Name) and node.id != "value":
+            raise ValueError(f"Unsupported name in conversion formula: {conversion}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError(f"Unsupported constant in conversion formula: {conversion}")
+    return tree
+
+
+def _compile_formula(body: ast.expr, filename: str) -> Callable[[Any], Any]:
+    """Compile an expression of ``value`` into a lambda."""
+    lambda_tree = ast.Expression(
+        body=ast.Lambda(
+            args=ast.arguments(
+                posonlyargs=[],
+                args=[ast.arg(arg="value")],
+                kwonlyargs=[],
+                kw_defaults=[],
+                defaults=[],
+            ),
+            body=body,
+        )
+    )
+    ast.fix_missing_locations(lambda_tree)
+    return eval(  # pylint: disable=eval-used
+        compile(lambda_tree, filename, "eval"),
+        {"__builtins__": {}},
+    )
+
+
+@lru_cache(maxsize=None)
+def compile_conversion(conversion: str | None) -> Converter | None:
+    """Compile a conversion formula into a callable.
+
+    Returns None when no conversion is needed. Formulas may only use the
+    name ``value``, numeric constants and arithmetic operators.
+    """
+    if conversion is None:
+        return None
+
+    tree = _parse_formula(conversion)
+    formula = _compile_formula(tree.body, f"<conversion {conversion}>")
+
+    def convert(value: Any) -> Any:
+        """Convert a raw value, returning it unchanged if it cannot be converted."""
+        if value is None:
+            return value
+        try:
+            return formula(value)
+        except Exception:  # pylint: disable=broad-except
+            return value
+
+    return convert
+
+
+def _uses_value(node: ast.expr) -> bool:
+    """Return True if an expression refers to ``value``."""
+    return any(isinstance(child, ast.Name) for child in ast.walk(node))
+
+
+# Operator that undoes each binary operator when value is its left operand
+_INVERSE_OPERATORS: dict[type[ast.operator], type[ast.operator]] = {
+    ast.Add: ast.Sub,
+    ast.Sub: ast.Add,
+    ast.Mult: ast.Div,
+    ast.Div: ast.Mult,
+}
+
+
+def _invert(node: ast.expr, result: ast.expr, conversion: str) -> ast.expr:
+    """Return the expression of ``value`` that makes node equal result."""
+    if isinstance(node, ast.Name):
+        return result
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, ast.USub):
+            result = ast.UnaryOp(op=ast.USub(), operand=result)
+        return _invert(node.operand, result, conversion)
+    if isinstance(node, ast.BinOp):
+        left, right = _uses_value(node.left), _uses_value(node.right)
+        if left and not right:
+            op = _INVERSE_OPERATORS[type(node.op)]()
+            return _invert(node.left, ast.BinOp(left=result, op=op, right=node.right), conversion)
+        if right and not left:
+            if isinstance(node.op, (ast.Add, ast.Mult)):
+                # c + value and c * value
+                op = _INVERSE_OPERATORS[type(node.op)]()
+                inverse = ast.BinOp(left=result, op=op, right=node.left)
+            else:
+                # c - value and c / value are their own inverse
+                inverse = ast.BinOp(left=node.left, op=node.op, right=result)
+            return _invert(node.right, inverse, conversion)
+    raise ValueError(f"Conversion formula cannot be inverted: {conversion}")
+
+
+@lru_cache(maxsize=None)
+def compile_inverse_conversion(conversion: str | None) -> Converter | None:
+    """Compile the inverse of a conversion formula, from converted to raw value.
+
+    Returns None when no conversion is needed. The formula must use ``value``
+    exactly once.
+    """
+    if conversion is None:
+        return None
+
+    tree = _parse_formula(conversion)
+    if sum(isinstance(node, ast.Name) for node in ast.walk(tree)) != 1:
+        raise ValueError(f"Conversion formula cannot be inverted: {conversion}")
+    body = _invert(tree.body, ast.Name(id="value", ctx=ast.Load()), conversion)
+    return _compile_formula(body, f"<inverse conversion {conversion}>")
+
+
+def _compile_converters(
+    definitions: dict[str, PropertyDefinition]
+) -> dict[str, Converter | None]:
+    """Compile the conversions of a property table."""
+    return {
+        key: compile_conversion(definition["conversion"])
+        for key, definition in definitions.items()
+    }
+
+
+# Precompiled converters, None where the raw value is used as-is
+DEVICE_CONVERTERS: dict[str, Converter | None] = _compile_converters(DEVICE_PROPERTIES)
+PACK_CONVERTERS: dict[str, Converter | None] = _compile_converters(PACK_PROPERTIES)
+
+
 def apply_conversion(value: int | float, conversion: str | None) -> float:
     """Apply conversion formula to a value."""
     if conversion is None or value is None:
         return value
-    
+
     try:
-        # Safely evaluate the conversion formula
-        return eval(conversion, {"__builtins__": {}}, {"value": value})
-    except Exception:
+        converter = compile_conversion(conversion)
+    except (SyntaxError, ValueError):
+        return value
+    return converter(value)
+
+
+class UpdateFilter:
+    """Deadband and minimum interval a value change must pass to be written."""
+
+    __slots__ = ("deadband", "deadband_percent", "min_interval")
+
+    def __init__(
+        self,
+        deadband: float = 0,
+        deadband_percent: float = 0,
+        min_interval: float = 0,
+    ) -> None:
+        """Initialize the filter."""
+        self.deadband = deadband
+        self.deadband_percent = deadband_percent
+        self.min_interval = min_interval
+
+    def within_deadband(self, old: Any, new: Any) -> bool:
+        """Return True if the change from old to new is too small to write."""
+        try:
+            delta = abs(new - old)
+        except TypeError:
+            return False
+        if delta < self.deadband:
+            return True
+        return delta < abs(old) * self.deadband_percent / 100
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the filter settings."""
+        return {
+            "deadband": self.deadband,
+            "deadband_percent": self.deadband_percent,
+            "min_interval": self.min_interval,
+        }
+
+
+def filterable_properties() -> dict[str, PropertyDefinition]:
+    """Return the numeric measurement properties that support update filters."""
+    return {
+        key: definition
+        for definitions in (DEVICE_PROPERTIES, PACK_PROPERTIES)
+        for key, definition in definitions.items()
+        if definition["state_class"] == "measurement"
+        and definition["type"] in ("int", "float")
+    }
+
+
+def build_update_filters(
+    overrides: dict[str, dict[str, float]] | None = None
+) -> dict[str, UpdateFilter]:
+    """Build update filters from the property defaults and option overrides."""
+    filters = {}
+    for key, definition in filterable_properties().items():
+        settings = {
+            name: definition[name]
+            for name in ("deadband", "deadband_percent", "min_interval")
+            if name in definition
+        }
+        if overrides and key in overrides:
+            settings.update(overrides[key])
+        if any(settings.values()):
+            filters[key] = UpdateFilter(**settings)
+    return filters
+
+
+class WriteEncoder:
+    """Turn a value written in converted units into the raw device value."""
+
+    __slots__ = ("key", "type", "min_value", "max_value", "step", "inverse")
+
+    def __init__(self, key: str, definition: PropertyDefinition) -> None:
+        """Initialize the encoder from a writable property definition."""
+        self.key = key
+        self.type = definition["type"]
+        self.min_value = definition["min_value"]
+        self.max_value = definition["max_value"]
+        self.step = definition["step"]
+        self.inverse = compile_inverse_conversion(definition["conversion"])
+
+    def encode(self, value: Any) -> int | float:
+        """Validate, quantize and convert a value; raises ValueError if invalid."""
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)) or value != value:
+            raise ValueError(f"Invalid value for {self.key}: {value!r}")
+        if self.min_value is not None and value < self.min_value:
+            raise ValueError(f"{self.key} must be at least {self.min_value}, got {value}")
+        if self.max_value is not None and value > self.max_value:
+            raise ValueError(f"{self.key} must be at most {self.max_value}, got {value}")
+        if self.step:
+            base = self.min_value or 0
+            value = base + round((value - base) / self.step) * self.step
+            if self.max_value is not None and value > self.max_value:
+                value -= self.step
+        if self.inverse is not None:
+            value = self.inverse(value)
+        if self.type in ("int", "bool"):
+            return int(round(value))
         return value
+
+
+# Encoders of the writable device properties
+WRITE_ENCODERS: dict[str, WriteEncoder] = {
+    key: WriteEncoder(key, definition)
+    for key, definition in DEVICE_PROPERTIES.items()
+    if definition["writable"]
+}
+
+
+def encode_writes(properties: dict[str, Any]) -> dict[str, int | float]:
+    """Encode property writes for the device; raises ValueError if any is invalid."""
+    encoded: dict[str, int | float] = {}
+    for key, value in properties.items():
+        if (encoder := WRITE_ENCODERS.get(key)) is None:
+            raise ValueError(f"{key} is not a writable property")
+        encoded[key] = encoder.encode(value)
+    return encoded
@@ -0,0 +1,209 @@
+"""Capture of raw MQTT traffic and its replay through a device."""
+import asyncio
+from collections.abc import Callable, Iterable, Iterator
+from datetime import timedelta
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+
+_LOGGER = logging.getLogger(__name__)
+
+# Start of every capture file
+MAGIC = b"ZMQR1\n"
+# Wall clock timestamp, topic length and payload length of a record
+_HEADER = struct.Struct("!dHI")
+# Seconds between writes of the captured records
+RECORD_FLUSH_INTERVAL = timedelta(seconds=5)
+# Size at which a capture stops growing
+MAX_RECORDING_BYTES = 50 * 1024 * 1024
+
+# (wall clock timestamp, topic, raw payload)
+Record = tuple[float, str, bytes]
+
+
+def encode_record(timestamp: float, topic: str, payload: bytes) -> bytes:
+    """Return a record as stored in a capture file."""
+    topic_bytes = topic.encode("utf-8")
+    return _HEADER.pack(timestamp, len(topic_bytes), len(payload)) + topic_bytes + payload
+
+
+def read_records(path: str) -> Iterator[Record]:
+    """Yield the records of a capture file; a record cut short ends the file."""
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a Zendure MQTT capture")
+        while len(header := file.read(_HEADER.size)) == _HEADER.size:
+            timestamp, topic_length, payload_length = _HEADER.unpack(header)
+            topic = file.read(topic_length)
+            payload = file.read(payload_length)
+            if len(payload) != payload_length:
+                return
+            yield timestamp, topic.decode("utf-8"), payload
+
+
+class TrafficRecorder:
+    """Append the raw messages of a device to a capture file.
+
+    `record` may be called from any thread; records are buffered in memory
+    and written from the executor every RECORD_FLUSH_INTERVAL. Recording stops
+    once the file reaches `max_bytes`.
+    """
+
+    def __init__(
+        self, hass: HomeAssistant, path: str, max_bytes: int = MAX_RECORDING_BYTES
+    ) -> None:
+        """Initialize the recorder."""
+        self.hass = hass
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._buffer: list[bytes] = []
+        # Bytes written or buffered so far, including an existing file
+        self._size: int | None = None
+        self._cancel_flush: Callable[[], None] | None = None
+        self.records = 0
+        self.dropped = 0
+
+    @callback
+    def async_start(self) -> None:
+        """Start writing captured records periodically."""
+        self._cancel_flush = async_track_time_interval(
+            self.hass,
+            self._async_flush,
+            RECORD_FLUSH_INTERVAL,
+            name="zendure_mqtt capture",
+            cancel_on_shutdown=True,
+        )
+        _LOGGER.info("Recording MQTT traffic to %s", self.path)
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop and write the records still buffered."""
+        if self._cancel_flush is not None:
+            self._cancel_flush()
+            self._cancel_flush = None
+        self._async_flush(None)
+
+    def record(self, topic: str, payload: bytes) -> None:
+        """Capture one message."""
+        data = encode_record(time.time(), topic, payload)
+        with self._lock:
+            if self._size is not None and self._size + len(data) > self.max_bytes:
+                self.dropped += 1
+                return
+            self._buffer.append(data)
+            if self._size is not None:
+                self._size += len(data)
+            self.records += 1
+
+    @callback
+    def _async_flush(self, _now: Any) -> None:
+        """Write the buffered records in the executor."""
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+        if buffer:
+            self.hass.async_add_executor_job(self._write, b"".join(buffer))
+
+    def _write(self, data: bytes) -> None:
+        """Append records to the capture file."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "ab") as file:
+            if file.tell() == 0:
+                file.write(MAGIC)
+            file.write(data)
+            size = file.tell()
+        with self._lock:
+            if self._size is None:
+                # The first write tells how large an existing capture already is
+                self._size = size + sum(len(item) for item in self._buffer)
+
+
+class ReplayMessage:
+    """A captured message in the shape of a paho MQTTMessage."""
+
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic: str, payload: bytes) -> None:
+        """Initialize the message."""
+        self.topic = topic
+        self.payload = payload
+
+
+class ReplayResult:
+    """Throughput, handler latency and final state of a replay."""
+
+    __slots__ = ("messages", "elapsed", "latencies", "state")
+
+    def __init__(
+        self,
+        messages: int,
+        elapsed: float,
+        latencies: list[float],
+        state: dict[str, Any],
+    ) -> None:
+        """Initialize the result."""
+        self.messages = messages
+        # Seconds from the first to the last message handled
+        self.elapsed = elapsed
+        # Seconds spent in the handler per message, sorted
+        self.latencies = latencies
+        # Summary state and decoded values after the last message
+        self.state = state
+
+    @property
+    def throughput(self) -> float:
+        """Return the messages handled per second."""
+        return self.messages / self.elapsed if self.elapsed else 0.0
+
+    def latency(self, percentile: float) -> float:
+        """Return the handler latency below which `percentile` % of messages stay."""
+        if not self.latencies:
+            return 0.0
+        index = round(percentile / 100 * (len(self.latencies) - 1))
+        return self.latencies[index]
+
+    def summary(self) -> str:
+        """Return the result as one line for test output."""
+        return (
+            f"{self.messages} messages in {self.elapsed:.3f} s,"
+            f" {self.throughput:.0f} messages/s, latency p50"
+            f" {self.latency(50) * 1e6:.0f} us, p99 {self.latency(99) * 1e6:.0f} us,"
+            f" max {self.latency(100) * 1e6:.0f} us"
+        )
+
+
+async def async_replay(
+    device: Any, records: Iterable[Record], speed: float = 1.0
+) -> ReplayResult:
+    """Feed captured records through a ZendureDevice's message handler.
+
+    Messages keep their captured spacing divided by `speed`, so 1 replays in
+    real time and 10 ten times faster; 0 replays without pauses.
+    """
+    loop = asyncio.get_running_loop()
+    latencies: list[float] = []
+    start = loop.time()
+    first: float | None = None
+    for timestamp, topic, payload in records:
+        if first is None:
+            first = timestamp
+        if speed > 0 and (delay := start + (timestamp - first) / speed - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        message = ReplayMessage(topic, payload)
+        handler_start = time.perf_counter()
+        device._on_message(message)
+        latencies.append(time.perf_counter() - handler_start)
+    elapsed = loop.time() - start
+    latencies.sort()
+    return ReplayResult(
+        len(latencies),
+        elapsed,
+        latencies,
+        {"state": device.state, **device.store.as_dict()},
+    )
@@ -0,0 +1,98 @@
+"""Full state requests for Zendure devices whose state may be stale."""
+import logging
+import random
+import time
+from collections.abc import Callable
+from datetime import timedelta
+from typing import Any
+
+from homeassistant.core import HassJob, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds over which requests are spread, so a broker restart does not make
+# every device answer at once
+RESYNC_JITTER = 10
+# Seconds without a report before the state counts as stale
+STALE_AFTER = 300
+# Seconds between staleness checks
+STALE_CHECK_INTERVAL = timedelta(seconds=60)
+
+
+class ResyncScheduler:
+    """Ask a device for its full state on (re)connect and when it goes quiet.
+
+    Each request is delayed by a random share of `jitter`. A device that
+    stays quiet is asked again every `stale_after` seconds at most.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        request: Callable[[], bool],
+        stale_after: float = STALE_AFTER,
+        jitter: float = RESYNC_JITTER,
+    ) -> None:
+        """Initialize the scheduler."""
+        self.hass = hass
+        self._request = request
+        self.stale_after = stale_after
+        self.jitter = jitter
+        # Monotonic time of the last report; set from the network thread too
+        self.last_report = time.monotonic()
+        self._last_request: float | None = None
+        self._cancel_request: Callable[[], None] | None = None
+        self._cancel_check: Callable[[], None] | None = None
+        self._request_job = HassJob(
+            self._async_send, "zendure_mqtt resync", cancel_on_shutdown=True
+        )
+        self.requests_sent = 0
+
+    @callback
+    def async_start(self) -> None:
+        """Start checking for stale state."""
+        self._cancel_check = async_track_time_interval(
+            self.hass,
+            self._async_check,
+            STALE_CHECK_INTERVAL,
+            name="zendure_mqtt staleness check",
+            cancel_on_shutdown=True,
+        )
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop checking and drop a scheduled request."""
+        if self._cancel_check is not None:
+            self._cancel_check()
+            self._cancel_check = None
+        if self._cancel_request is not None:
+            self._cancel_request()
+            self._cancel_request = None
+
+    @callback
+    def async_schedule(self) -> None:
+        """Request the full state after a random delay, unless already scheduled."""
+        if self._cancel_request is None:
+            self._cancel_request = async_call_later(
+                self.hass, random.uniform(0, self.jitter), self._request_job
+            )
+
+    @callback
+    def _async_check(self, _now: Any) -> None:
+        """Schedule a request if nothing was reported for too long."""
+        now = time.monotonic()
+        if now - self.last_report < self.stale_after:
+            return
+        if self._last_request is not None and now - self._last_request < self.stale_after:
+            return
+        _LOGGER.debug("No report for %.0f seconds, requesting full state", now - self.last_report)
+        self.async_schedule()
+
+    @callback
+    def _async_send(self, _now: Any) -> None:
+        """Send the full state request."""
+        self._cancel_request = None
+        self._last_request = time.monotonic()
+        if self._request():
+            self.requests_sent += 1
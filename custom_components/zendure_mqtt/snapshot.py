@@ -0,0 +1,68 @@
+"""Persisted snapshot of the decoded state of a Zendure device."""
+from collections.abc import Callable
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+STORAGE_VERSION = 1
+# Seconds from the first change until the snapshot is written; further
+# changes in that time are written with it
+SAVE_DELAY = 60
+
+
+def _storage_key(entry_id: str) -> str:
+    """Return the storage key of a config entry."""
+    return f"{DOMAIN}.{entry_id}"
+
+
+class SnapshotStore:
+    """Save a device snapshot at most once per SAVE_DELAY."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entry_id: str,
+        data_func: Callable[[], dict[str, Any]],
+        delay: float = SAVE_DELAY,
+    ) -> None:
+        """Initialize the snapshot store."""
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, _storage_key(entry_id)
+        )
+        self._data_func = data_func
+        self.delay = delay
+        # True from the first change until the snapshot is written
+        self.save_scheduled = False
+        self.saves = 0
+
+    async def async_load(self) -> dict[str, Any] | None:
+        """Return the saved snapshot, if any."""
+        return await self._store.async_load()
+
+    @callback
+    def async_schedule_save(self) -> None:
+        """Write the snapshot after the delay, unless a write is already due."""
+        if self.save_scheduled:
+            return
+        self.save_scheduled = True
+        self._store.async_delay_save(self._data_to_save, self.delay)
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        """Return the snapshot as it is when the write happens."""
+        self.save_scheduled = False
+        self.saves += 1
+        return self._data_func()
+
+    async def async_flush(self) -> None:
+        """Write a pending snapshot now instead of after the delay."""
+        if self.save_scheduled:
+            await self._store.async_save(self._data_to_save())
+
+    async def async_remove(self) -> None:
+        """Cancel a pending write and delete the snapshot."""
+        self.save_scheduled = False
+        await self._store.async_remove()
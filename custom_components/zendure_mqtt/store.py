@@ -0,0 +1,257 @@
+"""Bounded storage for the decoded state of a Zendure device."""
+from collections import OrderedDict
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any
+
+from .properties import DEVICE_PROPERTIES, PACK_PROPERTIES
+
+# Properties without a definition kept for the device and for each pack
+MAX_EXTRA_ATTRIBUTES = 64
+# Non-JSON payloads kept by topic, least recently updated evicted first
+MAX_RAW_TOPICS = 16
+# Battery packs tracked at once, least recently reported evicted first
+MAX_PACKS = 16
+
+# Property keys in slot order, and the slot of each key
+DEVICE_KEYS: tuple[str, ...] = tuple(DEVICE_PROPERTIES)
+PACK_KEYS: tuple[str, ...] = tuple(PACK_PROPERTIES)
+DEVICE_SLOTS: dict[str, int] = {key: slot for slot, key in enumerate(DEVICE_KEYS)}
+PACK_SLOTS: dict[str, int] = {key: slot for slot, key in enumerate(PACK_KEYS)}
+
+# Marks a slot whose property has not been reported
+UNSET: Any = object()
+
+# Attribute snapshot of a store with nothing to show
+EMPTY_ATTRIBUTES: Mapping[str, Any] = MappingProxyType({})
+
+
+class PackState:
+    """Decoded values of one battery pack."""
+
+    __slots__ = ("serial", "values", "extra", "last_seen")
+
+    def __init__(self, serial: str, now: float) -> None:
+        """Initialize the pack."""
+        self.serial = serial
+        # Converted values of properties that have a definition, by slot
+        self.values: list[Any] = [UNSET] * len(PACK_KEYS)
+        # Values of properties without a definition
+        self.extra: dict[str, Any] = {}
+        self.last_seen = now
+
+
+class DeviceStore:
+    """Decoded values of one device, bounded so it cannot grow without limit."""
+
+    __slots__ = (
+        "pack_expiry",
+        "max_extra",
+        "max_raw",
+        "max_packs",
+        "values",
+        "packs",
+        "extra",
+        "raw",
+        "pack_count",
+        "dropped_extra",
+        "evicted_raw",
+        "evicted_packs",
+        "_removed_packs",
+        "_attributes",
+    )
+
+    def __init__(
+        self,
+        pack_expiry: float,
+        max_extra: int = MAX_EXTRA_ATTRIBUTES,
+        max_raw: int = MAX_RAW_TOPICS,
+        max_packs: int = MAX_PACKS,
+    ) -> None:
+        """Initialize the store."""
+        self.pack_expiry = pack_expiry
+        self.max_extra = max_extra
+        self.max_raw = max_raw
+        self.max_packs = max_packs
+        # Converted values of device properties that have a definition, by slot
+        self.values: list[Any] = [UNSET] * len(DEVICE_KEYS)
+        self.packs: dict[str, PackState] = {}
+        # Device properties without a definition
+        self.extra: dict[str, Any] = {}
+        # Raw non-JSON payloads by topic
+        self.raw: OrderedDict[str, str] = OrderedDict()
+        self.pack_count: int | None = None
+        self.dropped_extra = 0
+        self.evicted_raw = 0
+        self.evicted_packs = 0
+        # Packs removed since the device last asked, to update their entities
+        self._removed_packs: list[str] = []
+        # Read-only attribute snapshot of the main sensor, built when first
+        # needed; replaced as a whole, never changed, when its values change
+        self._attributes: Mapping[str, Any] | None = None
+
+    def get(self, pack_sn: str | None, key: str, default: Any = None) -> Any:
+        """Return a converted property value, or default if unknown."""
+        if pack_sn is None:
+            value = self.values[DEVICE_SLOTS[key]]
+        elif (pack := self.packs.get(pack_sn)) is None:
+            return default
+        else:
+            value = pack.values[PACK_SLOTS[key]]
+        return default if value is UNSET else value
+
+    def keys(self) -> list[tuple[str | None, str]]:
+        """Return the (pack serial or None, key) of all reported properties."""
+        keys: list[tuple[str | None, str]] = [
+            (None, key)
+            for key, value in zip(DEVICE_KEYS, self.values)
+            if value is not UNSET
+        ]
+        for pack in self.packs.values():
+            keys.extend(
+                (pack.serial, key)
+                for key, value in zip(PACK_KEYS, pack.values)
+                if value is not UNSET
+            )
+        return keys
+
+    def pack(self, pack_sn: str, now: float) -> PackState:
+        """Return the state of a pack, adding it if needed."""
+        if (pack := self.packs.get(pack_sn)) is None:
+            if len(self.packs) >= self.max_packs:
+                oldest = min(self.packs.values(), key=lambda item: item.last_seen)
+                self.remove_pack(oldest.serial)
+            pack = self.packs[pack_sn] = PackState(pack_sn, now)
+        else:
+            pack.last_seen = now
+        return pack
+
+    def remove_pack(self, pack_sn: str) -> None:
+        """Forget a pack."""
+        if (pack := self.packs.pop(pack_sn, None)) is not None:
+            self._removed_packs.append(pack_sn)
+            self.evicted_packs += 1
+            if pack.extra:
+                self._attributes = None
+
+    def expire_packs(self, now: float) -> None:
+        """Forget the packs not reported within the expiry time."""
+        for pack in list(self.packs.values()):
+            if now - pack.last_seen > self.pack_expiry:
+                self.remove_pack(pack.serial)
+
+    def pop_removed_packs(self) -> list[str]:
+        """Return and clear the packs removed since the last call."""
+        removed, self._removed_packs = self._removed_packs, []
+        return removed
+
+    def set_extra(self, extra: dict[str, Any], key: str, value: Any) -> bool:
+        """Store a property without a definition; returns True if it changed."""
+        if key not in extra:
+            if len(extra) >= self.max_extra:
+                self.dropped_extra += 1
+                return False
+        elif extra[key] == value:
+            return False
+        extra[key] = value
+        self._attributes = None
+        return True
+
+    def set_pack_count(self, pack_count: int) -> bool:
+        """Store the number of packs reported; returns True if it changed."""
+        if pack_count == self.pack_count:
+            return False
+        self.pack_count = pack_count
+        self._attributes = None
+        return True
+
+    def set_raw(self, topic: str, payload: str) -> bool:
+        """Store a raw payload; returns True if it changed."""
+        if self.raw.get(topic) == payload:
+            return False
+        self.raw[topic] = payload
+        self.raw.move_to_end(topic)
+        while len(self.raw) > self.max_raw:
+            self.raw.popitem(last=False)
+            self.evicted_raw += 1
+        self._attributes = None
+        return True
+
+    def attributes(self) -> Mapping[str, Any]:
+        """Return a read-only snapshot of the values without an entity.
+
+        The same object is returned until one of its values changes, so
+        readers can tell a new snapshot by its identity.
+        """
+        if self._attributes is None:
+            attributes: dict[str, Any] = dict(self.extra)
+            if self.pack_count is not None:
+                attributes["pack_count"] = self.pack_count
+            for pack in self.packs.values():
+                for key, value in pack.extra.items():
+                    attributes[f"pack_{pack.serial}_{key}"] = value
+            attributes.update(self.raw)
+            self._attributes = (
+                MappingProxyType(attributes) if attributes else EMPTY_ATTRIBUTES
+            )
+        return self._attributes
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the values as plain data, keyed by property name."""
+        return {
+            "values": _slots_as_dict(DEVICE_KEYS, self.values),
+            "extra": dict(self.extra),
+            "pack_count": self.pack_count,
+            "packs": {
+                pack.serial: {
+                    "values": _slots_as_dict(PACK_KEYS, pack.values),
+                    "extra": dict(pack.extra),
+                }
+                for pack in self.packs.values()
+            },
+        }
+
+    def restore(self, data: dict[str, Any], now: float) -> None:
+        """Load values saved by as_dict, skipping properties no longer defined."""
+        _restore_slots(DEVICE_SLOTS, self.values, data.get("values", {}))
+        for key, value in data.get("extra", {}).items():
+            self.set_extra(self.extra, key, value)
+        self.pack_count = data.get("pack_count")
+        for pack_sn, pack_data in data.get("packs", {}).items():
+            pack = self.pack(pack_sn, now)
+            _restore_slots(PACK_SLOTS, pack.values, pack_data.get("values", {}))
+            for key, value in pack_data.get("extra", {}).items():
+                self.set_extra(pack.extra, key, value)
+        self._removed_packs.clear()
+        self._attributes = None
+
+    @property
+    def size(self) -> dict[str, int]:
+        """Return the current size of the store."""
+        return {
+            "values": sum(value is not UNSET for value in self.values),
+            "packs": len(self.packs),
+            "pack_values": sum(
+                value is not UNSET
+                for pack in self.packs.values()
+                for value in pack.values
+            ),
+            "extra_attributes": len(self.extra)
+            + sum(len(pack.extra) for pack in self.packs.values()),
+            "raw_topics": len(self.raw),
+            "dropped_extra_attributes": self.dropped_extra,
+            "evicted_raw_topics": self.evicted_raw,
+            "evicted_packs": self.evicted_packs,
+        }
+
+
+def _slots_as_dict(keys: tuple[str, ...], values: list[Any]) -> dict[str, Any]:
+    """Return the set slots keyed by property name."""
+    return {key: value for key, value in zip(keys, values) if value is not UNSET}
+
+
+def _restore_slots(slots: dict[str, int], values: list[Any], data: dict[str, Any]) -> None:
+    """Fill slots from values keyed by property name."""
+    for key, value in data.items():
+        if (slot := slots.get(key)) is not None:
+            values[slot] = value
@@ -0,0 +1,45 @@
+"""Platform for Zendure MQTT switch integration."""
+from typing import Any
+
+from homeassistant.components.switch import SwitchEntity
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .entity import ZendureEntity, async_setup_property_entities
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up Zendure MQTT switches based on a config entry."""
+    async_setup_property_entities(
+        hass, config_entry, async_add_entities, "switch", ZendureSwitch
+    )
+
+
+class ZendureSwitch(ZendureEntity, SwitchEntity):
+    """A switch for a writable device property."""
+
+    @property
+    def is_on(self) -> bool | None:
+        """Return true if the property is set."""
+        if (value := self.value) is None:
+            return None
+        return bool(value)
+
+    async def async_turn_on(self, **kwargs: Any) -> None:
+        """Turn the property on."""
+        await self._async_write(1)
+
+    async def async_turn_off(self, **kwargs: Any) -> None:
+        """Turn the property off."""
+        await self._async_write(0)
+
+    async def _async_write(self, value: int) -> None:
+        """Write the property to the device."""
+        if not await self._device.async_write_property({self._key[1]: value}):
+            raise HomeAssistantError(f"Failed to write {self._key[1]}")
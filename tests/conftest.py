@@ -1,8 +1,30 @@
 """Global fixtures for Zendure MQTT integration tests."""
+import json
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
 
+from .simulator import MqttBroker, ZendureSimulator
+
+
+def pytest_addoption(parser):
+    """Add the option that runs the slow load tests."""
+    parser.addoption(
+        "--run-slow", action="store_true", default=False, help="run slow load tests"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip tests marked slow unless --run-slow is given."""
+    if config.getoption("--run-slow"):
+        return
+    skip_slow = pytest.mark.skip(reason="slow load test, run with --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
+
 @pytest.fixture(autouse=True)
 def auto_enable_custom_integrations(enable_custom_integrations):
     """Enable custom integrations defined in the test dir."""
@@ -15,3 +37,50 @@ def mock_mqtt_client():
         client_instance = mock_client.return_value
         client_instance.connect.return_value = 0
         yield client_instance
+
+
+def load_fixture(filename: str) -> str:
+    """Load a fixture file from the tests/fixtures directory."""
+    return (Path(__file__).parent / "fixtures" / filename).read_text(encoding="utf-8")
+
+
+@pytest.fixture
+def multipack_report() -> dict:
+    """Return a recorded properties report from a device with four packs."""
+    return json.loads(load_fixture("report_multipack.json"))
+
+
+@pytest.fixture
+def mock_write_replies(hass, mock_mqtt_client):
+    """Make the mock broker reply to every write command like a device does."""
+
+    def publish(topic, payload, *args, **kwargs):
+        if topic.startswith("iot/") and topic.endswith("/properties/write"):
+            _, product_id, device_id, _, _ = topic.split("/")
+            reply = MagicMock()
+            reply.topic = f"/{product_id}/{device_id}/properties/write/reply"
+            reply.payload = json.dumps(
+                {"messageId": json.loads(payload)["messageId"], "deviceId": device_id}
+            ).encode("utf-8")
+            hass.loop.call_soon(mock_mqtt_client.on_message, mock_mqtt_client, None, reply)
+        result = MagicMock()
+        result.rc = 0
+        return result
+
+    mock_mqtt_client.publish.side_effect = publish
+    return mock_mqtt_client
+
+
+@pytest.fixture
+async def mqtt_broker(socket_enabled):
+    """Run an in-process MQTT broker on a free local port."""
+    broker = MqttBroker()
+    await broker.start()
+    yield broker
+    await broker.stop()
+
+
+@pytest.fixture
+def zendure_simulator(mqtt_broker) -> ZendureSimulator:
+    """Return a simulator publishing through the local broker."""
+    return ZendureSimulator(mqtt_broker)
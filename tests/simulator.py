@@ -0,0 +1,362 @@
+"""In-process MQTT broker and simulated Zendure devices for load tests."""
+import asyncio
+from collections.abc import Callable
+import json
+import random
+import struct
+import time
+from typing import Any
+
+from custom_components.zendure_mqtt.connection import filter_covers
+from custom_components.zendure_mqtt.const import (
+    DEVICE_MODELS,
+    DEVICE_PRODUCT_IDS,
+    MODEL_ACE1500,
+    MODEL_AIO2400,
+    MODEL_HUB1200,
+    MODEL_HUB2000,
+    MODEL_HYPER2000,
+    MQTT_TOPIC_REPORT,
+    MQTT_TOPIC_WRITE_REPLY,
+)
+from custom_components.zendure_mqtt.probe import encode_packet, encode_string
+
+# Battery packs a device of each model may have
+MODEL_PACKS = {
+    MODEL_HUB1200: (1, 4),
+    MODEL_HUB2000: (1, 4),
+    MODEL_AIO2400: (1, 3),
+    MODEL_ACE1500: (1, 3),
+    MODEL_HYPER2000: (1, 4),
+}
+
+
+class MqttBroker:
+    """Minimal MQTT 3.1.1 broker: QoS 0 delivery, wildcards, no persistence.
+
+    Besides network clients, in-process listeners can subscribe with
+    `subscribe` and messages can be injected with `publish`.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the broker."""
+        self._server: asyncio.Server | None = None
+        self.port = 0
+        # Writer of each client -> its topic filters
+        self._clients: dict[asyncio.StreamWriter, set[str]] = {}
+        self._listeners: list[tuple[str, Callable[[str, bytes], None]]] = []
+        self.connections = 0
+        self.published = 0
+
+    async def start(self) -> None:
+        """Listen on a free local port."""
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        """Disconnect all clients and stop listening."""
+        for writer in list(self._clients):
+            writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def subscribe(
+        self, topic_filter: str, listener: Callable[[str, bytes], None]
+    ) -> None:
+        """Call listener for every message matching the filter."""
+        self._listeners.append((topic_filter, listener))
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        """Deliver a message to every matching subscriber."""
+        self.published += 1
+        packet = encode_packet(0x30, encode_string(topic) + payload)
+        for writer, filters in self._clients.items():
+            if any(filter_covers(topic_filter, topic) for topic_filter in filters):
+                writer.write(packet)
+        for topic_filter, listener in self._listeners:
+            if filter_covers(topic_filter, topic):
+                listener(topic, payload)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve one client connection."""
+        filters: set[str] = set()
+        try:
+            while True:
+                first_byte, body = await self._read_packet(reader)
+                packet_type = first_byte & 0xF0
+                if packet_type == 0x10:
+                    self.connections += 1
+                    self._clients[writer] = filters
+                    writer.write(b"\x20\x02\x00\x00")
+                elif packet_type == 0x30:
+                    self._on_publish(first_byte, body, writer)
+                elif packet_type == 0x80:
+                    packet_id = body[:2]
+                    topics = self._read_topics(body[2:], with_qos=True)
+                    filters.update(topics)
+                    writer.write(encode_packet(0x90, packet_id + b"\x00" * len(topics)))
+                elif packet_type == 0xA0:
+                    topics = self._read_topics(body[2:], with_qos=False)
+                    filters.difference_update(topics)
+                    writer.write(encode_packet(0xB0, body[:2]))
+                elif packet_type == 0xC0:
+                    writer.write(b"\xd0\x00")
+                elif packet_type == 0xE0:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+    def _on_publish(
+        self, first_byte: int, body: bytes, writer: asyncio.StreamWriter
+    ) -> None:
+        """Acknowledge and route a message published by a client."""
+        (length,) = struct.unpack_from("!H", body)
+        topic = body[2 : 2 + length].decode("utf-8")
+        offset = 2 + length
+        qos = (first_byte >> 1) & 0x03
+        if qos:
+            packet_id = body[offset : offset + 2]
+            offset += 2
+            # PUBACK, or PUBREC for QoS 2
+            writer.write(encode_packet(0x40 if qos == 1 else 0x50, packet_id))
+        self.publish(topic, body[offset:])
+
+    @staticmethod
+    def _read_topics(body: bytes, with_qos: bool) -> list[str]:
+        """Return the topic filters of a SUBSCRIBE or UNSUBSCRIBE packet."""
+        topics = []
+        offset = 0
+        while offset < len(body):
+            (length,) = struct.unpack_from("!H", body, offset)
+            topics.append(body[offset + 2 : offset + 2 + length].decode("utf-8"))
+            offset += 2 + length + (1 if with_qos else 0)
+        return topics
+
+    @staticmethod
+    async def _read_packet(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+        """Read one packet; returns its first byte and body."""
+        first_byte = (await reader.readexactly(1))[0]
+        length = 0
+        for shift in range(0, 28, 7):
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+        return first_byte, await reader.readexactly(length)
+
+
+class SimulatedDevice:
+    """State of one simulated Zendure device and the reports it sends."""
+
+    def __init__(self, model: str, device_id: str, rng: random.Random) -> None:
+        """Initialize the device with a random number of packs."""
+        self.model = model
+        self.product_id = DEVICE_PRODUCT_IDS[model]
+        self.device_id = device_id
+        self._rng = rng
+        self._message_id = rng.randrange(1, 1 << 20)
+        self.writes: list[dict[str, Any]] = []
+        self.properties: dict[str, Any] = {
+            "solarInputPower": 0,
+            "solarPower1": 0,
+            "solarPower2": 0,
+            "outputPackPower": 0,
+            "packInputPower": 0,
+            "outputHomePower": 0,
+            "outputLimit": 600,
+            "inputLimit": 0,
+            "electricLevel": rng.randrange(10, 100),
+            "packState": 0,
+            "remainOutTime": 0,
+            "socSet": 1000,
+            "minSoc": 100,
+            "acMode": 2,
+            "masterSwitch": 1,
+            "buzzerSwitch": 0,
+            "hyperTmp": 2900 + rng.randrange(200),
+            "heatState": 0,
+        }
+        low, high = MODEL_PACKS[model]
+        self.packs: list[dict[str, Any]] = [
+            {
+                "sn": f"SIM{device_id[-6:]}{index:02d}",
+                "socLevel": self.properties["electricLevel"],
+                "state": 0,
+                "power": 0,
+                "maxTemp": 2900 + rng.randrange(100),
+                "totalVol": 4900 + rng.randrange(50),
+                "batcur": 0,
+                "maxVol": 329,
+                "minVol": 327,
+                "softVersion": 4120,
+            }
+            for index in range(rng.randint(low, high))
+        ]
+        self.properties["packNum"] = len(self.packs)
+
+    def step(self) -> None:
+        """Move the values on like a device under changing sun and load."""
+        rng = self._rng
+        props = self.properties
+        solar1 = max(0, props["solarPower1"] + rng.randint(-25, 25))
+        solar2 = max(0, props["solarPower2"] + rng.randint(-25, 25))
+        home = min(
+            props["outputLimit"],
+            max(0, props["outputHomePower"] + rng.randint(-40, 40)),
+        )
+        surplus = solar1 + solar2 - home
+        props.update(
+            solarPower1=solar1,
+            solarPower2=solar2,
+            solarInputPower=solar1 + solar2,
+            outputHomePower=home,
+            packInputPower=max(0, -surplus),
+            outputPackPower=max(0, surplus),
+            packState=1 if surplus > 0 else 2 if surplus < 0 else 0,
+            hyperTmp=props["hyperTmp"] + rng.randint(-2, 2),
+        )
+        if rng.random() < 0.2:
+            level = props["electricLevel"] + (1 if surplus > 0 else -1)
+            props["electricLevel"] = min(100, max(0, level))
+        share = surplus // max(1, len(self.packs))
+        for pack in self.packs:
+            pack.update(
+                power=abs(share) + rng.randint(-3, 3),
+                state=props["packState"],
+                socLevel=props["electricLevel"] + rng.randint(-1, 1),
+                maxTemp=pack["maxTemp"] + rng.randint(-1, 1),
+                batcur=-share // 48,
+            )
+
+    def report(self, full: bool = False, keys: list[str] | None = None) -> bytes:
+        """Return a report payload; partial reports carry a random share of keys."""
+        self._message_id += 1
+        if keys is not None:
+            properties = {key: self.properties[key] for key in keys}
+            packs = []
+        elif full:
+            properties = dict(self.properties)
+            packs = [dict(pack) for pack in self.packs]
+        else:
+            keys = self._rng.sample(sorted(self.properties), k=self._rng.randint(3, 10))
+            properties = {key: self.properties[key] for key in keys}
+            packs = [
+                {"sn": pack["sn"], "power": pack["power"], "socLevel": pack["socLevel"]}
+                for pack in self.packs
+                if self._rng.random() < 0.7
+            ]
+        report: dict[str, Any] = {
+            "messageId": str(self._message_id),
+            "product": self.product_id,
+            "deviceId": self.device_id,
+            "timestamp": int(time.time()),
+            "properties": properties,
+        }
+        if packs:
+            report["packData"] = packs
+        return json.dumps(report).encode("utf-8")
+
+
+class ZendureSimulator:
+    """A fleet of simulated devices publishing through an MqttBroker.
+
+    Devices answer `properties/write` with a reply carrying the command's
+    `messageId` and report the written values, and answer `getAll` reads
+    with a full report.
+    """
+
+    def __init__(self, broker: MqttBroker, seed: int = 0) -> None:
+        """Initialize the simulator."""
+        self.broker = broker
+        self._rng = random.Random(seed)
+        self.devices: dict[tuple[str, str], SimulatedDevice] = {}
+        broker.subscribe("iot/+/+/properties/write", self._on_write)
+        broker.subscribe("iot/+/+/properties/read", self._on_read)
+
+    def add_devices(self, count: int) -> list[SimulatedDevice]:
+        """Add devices, cycling through every supported model."""
+        added = []
+        for _ in range(count):
+            model = DEVICE_MODELS[len(self.devices) % len(DEVICE_MODELS)]
+            device = SimulatedDevice(model, f"sim{len(self.devices):06d}", self._rng)
+            self.devices[(device.product_id, device.device_id)] = device
+            added.append(device)
+        return added
+
+    def publish_reports(self, full: bool = False) -> int:
+        """Step every device and publish one report each; returns the count."""
+        for device in self.devices.values():
+            device.step()
+            self._publish_report(device, full)
+        return len(self.devices)
+
+    async def run(
+        self, duration: float, interval: float = 1.0, jitter: float = 0.3
+    ) -> None:
+        """Publish reports for `duration` seconds, each device on its own period.
+
+        Every period is `interval` spread by up to `jitter` of it either way.
+        """
+        loop = asyncio.get_running_loop()
+        end = loop.time() + duration
+        due = {
+            key: loop.time() + self._rng.uniform(0, interval) for key in self.devices
+        }
+        while (now := loop.time()) < end:
+            for key, when in due.items():
+                if when <= now:
+                    device = self.devices[key]
+                    device.step()
+                    self._publish_report(device, full=False)
+                    spread = self._rng.uniform(1 - jitter, 1 + jitter)
+                    due[key] = now + interval * spread
+            await asyncio.sleep(min(due.values()) - now if due else interval)
+
+    def _publish_report(
+        self, device: SimulatedDevice, full: bool, keys: list[str] | None = None
+    ) -> None:
+        """Publish a report of a device."""
+        self.broker.publish(
+            MQTT_TOPIC_REPORT.format(
+                product_id=device.product_id, device_id=device.device_id
+            ),
+            device.report(full, keys),
+        )
+
+    def _device(self, topic: str) -> SimulatedDevice | None:
+        """Return the device an iot/{product_id}/{device_id}/... topic is for."""
+        _, product_id, device_id = topic.split("/", 3)[:3]
+        return self.devices.get((product_id, device_id))
+
+    def _on_write(self, topic: str, payload: bytes) -> None:
+        """Apply a write command and reply to it."""
+        if (device := self._device(topic)) is None:
+            return
+        command = json.loads(payload)
+        device.writes.append(command["properties"])
+        device.properties.update(command["properties"])
+        self.broker.publish(
+            MQTT_TOPIC_WRITE_REPLY.format(
+                product_id=device.product_id, device_id=device.device_id
+            ),
+            json.dumps(
+                {
+                    "messageId": command["messageId"],
+                    "deviceId": device.device_id,
+                    "timestamp": int(time.time()),
+                    "properties": command["properties"],
+                }
+            ).encode("utf-8"),
+        )
+        self._publish_report(device, False, list(command["properties"]))
+
+    def _on_read(self, topic: str, payload: bytes) -> None:
+        """Answer a getAll read with a full report."""
+        if (device := self._device(topic)) is not None:
+            self._publish_report(device, full=True)
@@ -0,0 +1,209 @@
+"""Benchmark the Zendure message handler with recorded payloads."""
+import json
+import os
+import time
+from unittest.mock import MagicMock
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.zendure_mqtt.decoder import DECODERS
+from custom_components.zendure_mqtt.device import ZendureDevice, parse_report
+from custom_components.zendure_mqtt.recording import async_replay, read_records
+
+BENCHMARK_MESSAGES = 5000
+# Rounds of the parser comparison, the best of which is reported
+BENCHMARK_ROUNDS = 5
+
+
+def reference_parse_report(data: dict) -> tuple[dict, dict, int | None, str]:
+    """Parse a report the way the handler did before the dispatch tables.
+
+    Kept as the baseline of `test_parse_report_throughput`.
+    """
+    import json  # noqa: F401
+    from custom_components.zendure_mqtt.properties import (
+        DEVICE_CONVERTERS,
+        PACK_CONVERTERS,
+    )
+
+    values = {}
+    extras = {}
+    pack_count = None
+    if "properties" in data and isinstance(data["properties"], dict):
+        for prop_key, prop_value in data["properties"].items():
+            if prop_key in DEVICE_CONVERTERS:
+                converter = DEVICE_CONVERTERS[prop_key]
+                if converter is not None:
+                    prop_value = converter(prop_value)
+                values[(None, prop_key)] = prop_value
+            else:
+                extras[(None, prop_key)] = prop_value
+
+    if "packData" in data and isinstance(data["packData"], list):
+        pack_count = len(data["packData"])
+        for pack in data["packData"]:
+            if isinstance(pack, dict) and "sn" in pack:
+                pack_sn = pack["sn"]
+                for pack_prop_key, pack_prop_value in pack.items():
+                    if pack_prop_key == "sn":
+                        continue
+                    if pack_prop_key in PACK_CONVERTERS:
+                        converter = PACK_CONVERTERS[pack_prop_key]
+                        if converter is not None:
+                            pack_prop_value = converter(pack_prop_value)
+                        values[(pack_sn, pack_prop_key)] = pack_prop_value
+                    else:
+                        extras[(pack_sn, pack_prop_key)] = pack_prop_value
+
+    if "properties" in data and isinstance(data["properties"], dict):
+        if "electricLevel" in data["properties"]:
+            state = str(data["properties"]["electricLevel"])
+        elif "packState" in data["properties"]:
+            pack_state = data["properties"]["packState"]
+            state_map = {0: "idle", 1: "charging", 2: "discharging"}
+            state = state_map.get(pack_state, str(pack_state))
+        else:
+            state = "online"
+    else:
+        state = "online"
+    return values, extras, pack_count, state
+
+
+def recorded_messages(report: dict, count: int) -> list[MagicMock]:
+    """Return report messages with changing values, like a live device sends."""
+    messages = []
+    for index in range(count):
+        report["messageId"] = str(index)
+        report["properties"]["outputHomePower"] = 400 + index % 50
+        for pack in report["packData"]:
+            pack["power"] = 40 + index % 20
+        msg = MagicMock()
+        msg.topic = "/A8yh63/test-device-id/properties/report"
+        msg.payload = json.dumps(report).encode("utf-8")
+        messages.append(msg)
+    return messages
+
+
+async def test_message_throughput(hass: HomeAssistant, multipack_report) -> None:
+    """Feed recorded reports through the handler and report messages per second.
+
+    Run with `pytest -s tests/test_benchmark.py` to see the result.
+    """
+    connection = MagicMock(in_event_loop=True)
+    device = ZendureDevice(
+        hass, connection, "benchmark", "hub2000", "test-device-id", "A8yh63"
+    )
+    messages = recorded_messages(multipack_report, BENCHMARK_MESSAGES)
+
+    start = time.perf_counter()
+    for msg in messages:
+        device._on_message(msg)
+    elapsed = time.perf_counter() - start
+    await hass.async_block_till_done()
+
+    print(f"\n{BENCHMARK_MESSAGES / elapsed:.0f} messages/s")
+    assert device.messages_received == BENCHMARK_MESSAGES
+    assert device.get_value(("CO4H00000000", "power")) == 40 + (BENCHMARK_MESSAGES - 1) % 20
+
+
+def test_parse_report_throughput(multipack_report) -> None:
+    """Compare parse_report with the parse loop it replaced.
+
+    Run with `pytest -s tests/test_benchmark.py` to see the result.
+    """
+    reports = [
+        json.loads(msg.payload)
+        for msg in recorded_messages(multipack_report, BENCHMARK_MESSAGES)
+    ]
+
+    # Best of interleaved rounds, so warm-up and noise hit both alike
+    reference_elapsed = elapsed = float("inf")
+    for _ in range(BENCHMARK_ROUNDS):
+        start = time.perf_counter()
+        for data in reports:
+            reference_parse_report(data)
+        reference_elapsed = min(reference_elapsed, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for data in reports:
+            parse_report(data)
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    print(
+        f"\nreference: {BENCHMARK_MESSAGES / reference_elapsed:.0f} reports/s,"
+        f" parse_report: {BENCHMARK_MESSAGES / elapsed:.0f} reports/s"
+    )
+    # Both parse every report the same way
+    for data in reports:
+        values, extras, pack_count = parse_report(data)
+        assert reference_parse_report(data)[:3] == (
+            {key: value for key, _, value in values},
+            extras,
+            pack_count,
+        )
+
+
+async def test_replay_throughput(hass: HomeAssistant, multipack_report) -> None:
+    """Replay a capture as fast as possible and report throughput and latency.
+
+    Set ZENDURE_CAPTURE to a file recorded with the `record_traffic` option to
+    replay real traffic; otherwise the recorded reports above are used.
+    """
+    connection = MagicMock(in_event_loop=True)
+    device = ZendureDevice(
+        hass, connection, "benchmark", "hub2000", "test-device-id", "A8yh63"
+    )
+    if capture := os.environ.get("ZENDURE_CAPTURE"):
+        records = list(read_records(capture))
+    else:
+        records = [
+            (index / 10, msg.topic, msg.payload)
+            for index, msg in enumerate(
+                recorded_messages(multipack_report, BENCHMARK_MESSAGES)
+            )
+        ]
+
+    result = await async_replay(device, records, speed=0)
+    await hass.async_block_till_done()
+
+    print(f"\n{result.summary()}")
+    assert result.messages == len(records)
+
+
+async def test_decoder_throughput(hass: HomeAssistant, multipack_report) -> None:
+    """Compare the installed JSON decoders on recorded multi-pack reports.
+
+    Run with `pytest -s tests/test_benchmark.py` to see the result.
+    """
+    messages = recorded_messages(multipack_report, BENCHMARK_MESSAGES)
+    payloads = [msg.payload for msg in messages]
+    states = []
+    for name, decode in DECODERS.items():
+        start = time.perf_counter()
+        for payload in payloads:
+            decode(payload)
+        parse_elapsed = time.perf_counter() - start
+
+        device = ZendureDevice(
+            hass,
+            MagicMock(in_event_loop=True),
+            f"benchmark_{name}",
+            "hub2000",
+            "test-device-id",
+            "A8yh63",
+            decoder=decode,
+        )
+        start = time.perf_counter()
+        for msg in messages:
+            device._on_message(msg)
+        handler_elapsed = time.perf_counter() - start
+        states.append(device.store.as_dict())
+
+        print(
+            f"\n{name}: {BENCHMARK_MESSAGES / parse_elapsed:.0f} parses/s,"
+            f" {BENCHMARK_MESSAGES / handler_elapsed:.0f} messages/s"
+        )
+    await hass.async_block_till_done()
+
+    # Every decoder yields the same state
+    assert all(state == states[0] for state in states)
@@ -0,0 +1,50 @@
+"""Test the Zendure MQTT binary sensors."""
+from unittest.mock import MagicMock, patch
+import json
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.zendure_mqtt.const import (
+    CONF_DEVICE_ID,
+    CONF_DEVICE_MODEL,
+    CONF_MQTT_HOST,
+    CONF_MQTT_PORT,
+    DOMAIN,
+)
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+
+async def test_binary_sensor(hass: HomeAssistant, mock_mqtt_client) -> None:
+    """Test a binary sensor property."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps({"properties": {"wifiState": 1}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    state = hass.states.get("binary_sensor.zendure_hub2000_test_device_id_wifi_state")
+    assert state.state == "on"
+    assert state.attributes["device_class"] == "connectivity"
+
+    mock_mqtt_client.on_disconnect(mock_mqtt_client, None, 1)
+    await hass.async_block_till_done()
+
+    state = hass.states.get("binary_sensor.zendure_hub2000_test_device_id_wifi_state")
+    assert state.state == "unavailable"
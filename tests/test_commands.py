@@ -0,0 +1,73 @@
+"""Test the Zendure write command queue."""
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+from homeassistant.core import HomeAssistant
+import homeassistant.util.dt as dt_util
+
+from custom_components.zendure_mqtt.commands import CommandQueue
+
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+
+async def advance(hass: HomeAssistant, seconds: float) -> None:
+    """Move the clock forward and run what became due."""
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=seconds))
+    await hass.async_block_till_done()
+
+
+async def test_writes_are_coalesced_and_rate_limited(hass: HomeAssistant) -> None:
+    """Test a burst of writes becomes one command, spaced by the interval."""
+    send = MagicMock(return_value=True)
+    queue = CommandQueue(hass, send, interval=5)
+
+    first = queue.async_submit({"outputLimit": 600})
+    second = queue.async_submit({"inputLimit": 800, "outputLimit": 700})
+    third = queue.async_submit({"socSet": 900})
+    assert first is second is third
+    send.assert_not_called()
+
+    await advance(hass, 1)
+    message_id, properties = send.call_args[0]
+    assert properties == {"outputLimit": 700, "inputLimit": 800, "socSet": 900}
+    queue.async_acknowledge(message_id)
+    assert await first
+
+    # The next command waits for the interval, not just the window
+    later = queue.async_submit({"outputLimit": 500})
+    await advance(hass, 1)
+    assert send.call_count == 1
+
+    await advance(hass, 6)
+    assert send.call_args[0][1] == {"outputLimit": 500}
+    queue.async_acknowledge(send.call_args[0][0])
+    assert await later
+    assert queue.stats["writes_requested"] == 4
+    assert queue.stats["writes_coalesced"] == 2
+    assert queue.stats["commands_sent"] == 2
+
+
+async def test_replies_are_matched_by_message_id(hass: HomeAssistant) -> None:
+    """Test several commands await replies at once and unanswered ones time out."""
+    send = MagicMock(return_value=True)
+    queue = CommandQueue(hass, send, interval=0, ack_timeout=30)
+
+    first = queue.async_submit({"outputLimit": 600})
+    await advance(hass, 1)
+    second = queue.async_submit({"inputLimit": 800})
+    await advance(hass, 1)
+    assert queue.stats["commands_in_flight"] == 2
+
+    first_id, second_id = (call[0][0] for call in send.call_args_list)
+    assert first_id != second_id
+    queue.async_acknowledge(second_id)
+    # Replies to unknown commands are ignored
+    queue.async_acknowledge("unknown")
+    assert await second
+    assert not first.done()
+
+    await advance(hass, 31)
+    assert await first is False
+    assert queue.stats["commands_acknowledged"] == 1
+    assert queue.stats["commands_timed_out"] == 1
+    assert queue.stats["commands_in_flight"] == 0
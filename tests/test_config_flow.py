@@ -6,14 +6,29 @@ from homeassistant.core import HomeAssistant
 from homeassistant.data_entry_flow import FlowResultType
 
 from custom_components.zendure_mqtt.const import (
+    CONF_COMMAND_INTERVAL,
+    CONF_DEVICE,
     CONF_DEVICE_ID,
     CONF_DEVICE_MODEL,
     CONF_MQTT_HOST,
     CONF_MQTT_PASSWORD,
     CONF_MQTT_PORT,
     CONF_MQTT_USERNAME,
+    CONF_DEADBAND,
+    CONF_DEADBAND_PERCENT,
+    CONF_MIN_INTERVAL,
+    CONF_PACK_EXPIRY,
+    CONF_PROPERTY,
+    CONF_RECORD_TRAFFIC,
+    CONF_STATE_WRITE_INTERVAL,
+    CONF_TRANSPORT,
+    CONF_UPDATE_FILTERS,
     DOMAIN,
+    TRANSPORT_THREAD,
 )
+from custom_components.zendure_mqtt.probe import CannotConnect, InvalidAuth, ProbeResult
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 
 async def test_form(hass: HomeAssistant, mock_mqtt_client) -> None:
@@ -21,13 +36,17 @@ async def test_form(hass: HomeAssistant, mock_mqtt_client) -> None:
     result = await hass.config_entries.flow.async_init(
         DOMAIN, context={"source": config_entries.SOURCE_USER}
     )
+    assert result["type"] == FlowResultType.MENU
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {"next_step_id": "manual"}
+    )
     assert result["type"] == FlowResultType.FORM
     assert result["errors"] == {}
 
     with patch(
-        "custom_components.zendure_mqtt.config_flow.validate_mqtt_connection",
-        return_value=True,
-    ), patch(
+        "custom_components.zendure_mqtt.config_flow.async_probe_broker",
+        return_value=ProbeResult(0.01, True),
+    ) as mock_probe, patch(
         "custom_components.zendure_mqtt.async_setup_entry",
         return_value=True,
     ) as mock_setup_entry:
@@ -55,17 +74,27 @@ async def test_form(hass: HomeAssistant, mock_mqtt_client) -> None:
         CONF_DEVICE_ID: "test-device-id",
     }
     assert len(mock_setup_entry.mock_calls) == 1
+    mock_probe.assert_awaited_once_with(
+        "1.1.1.1",
+        1883,
+        "test-user",
+        "test-password",
+        "/A8yh63/test-device-id/properties/report",
+    )
 
 
-async def test_form_invalid_auth(hass: HomeAssistant) -> None:
-    """Test we handle invalid auth."""
+async def test_form_cannot_connect(hass: HomeAssistant) -> None:
+    """Test we handle an unreachable broker."""
     result = await hass.config_entries.flow.async_init(
         DOMAIN, context={"source": config_entries.SOURCE_USER}
     )
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {"next_step_id": "manual"}
+    )
 
     with patch(
-        "custom_components.zendure_mqtt.config_flow.validate_mqtt_connection",
-        return_value=False,
+        "custom_components.zendure_mqtt.config_flow.async_probe_broker",
+        side_effect=CannotConnect,
     ):
         result2 = await hass.config_entries.flow.async_configure(
             result["flow_id"],
@@ -83,15 +112,47 @@ async def test_form_invalid_auth(hass: HomeAssistant) -> None:
     assert result2["errors"] == {"base": "cannot_connect"}
 
 
+async def test_form_invalid_auth(hass: HomeAssistant) -> None:
+    """Test we handle refused credentials."""
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {"next_step_id": "manual"}
+    )
+
+    with patch(
+        "custom_components.zendure_mqtt.config_flow.async_probe_broker",
+        side_effect=InvalidAuth,
+    ):
+        result2 = await hass.config_entries.flow.async_configure(
+            result["flow_id"],
+            {
+                CONF_MQTT_HOST: "1.1.1.1",
+                CONF_MQTT_PORT: 1883,
+                CONF_MQTT_USERNAME: "test-user",
+                CONF_MQTT_PASSWORD: "wrong-password",
+                CONF_DEVICE_MODEL: "hub2000",
+                CONF_DEVICE_ID: "test-device-id",
+            },
+        )
+
+    assert result2["type"] == FlowResultType.FORM
+    assert result2["errors"] == {"base": "invalid_auth"}
+
+
 async def test_form_invalid_device_id(hass: HomeAssistant) -> None:
     """Test we handle invalid device id."""
     result = await hass.config_entries.flow.async_init(
         DOMAIN, context={"source": config_entries.SOURCE_USER}
     )
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {"next_step_id": "manual"}
+    )
 
     with patch(
-        "custom_components.zendure_mqtt.config_flow.validate_mqtt_connection",
-        return_value=True,
+        "custom_components.zendure_mqtt.config_flow.async_probe_broker",
+        return_value=ProbeResult(0.01, True),
     ):
         result2 = await hass.config_entries.flow.async_configure(
             result["flow_id"],
@@ -107,3 +168,160 @@ async def test_form_invalid_device_id(hass: HomeAssistant) -> None:
 
     assert result2["type"] == FlowResultType.FORM
     assert result2["errors"] == {"base": "invalid_device_id"}
+
+
+async def test_form_discovery(hass: HomeAssistant) -> None:
+    """Test picking a device found on the broker."""
+    MockConfigEntry(
+        domain=DOMAIN, unique_id="configured-id_hub1200", data={}
+    ).add_to_hass(hass)
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {"next_step_id": "discover"}
+    )
+    assert result["type"] == FlowResultType.FORM
+    assert result["step_id"] == "discover"
+
+    broker = {
+        CONF_MQTT_HOST: "1.1.1.1",
+        CONF_MQTT_PORT: 1883,
+        CONF_MQTT_USERNAME: "",
+        CONF_MQTT_PASSWORD: "",
+    }
+    with patch(
+        "custom_components.zendure_mqtt.config_flow.async_discover_devices",
+        return_value={
+            ("A8yh63", "new-id"): "hub2000",
+            ("73bkTV", "configured-id"): "hub1200",
+        },
+    ) as mock_discover:
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], broker
+        )
+    mock_discover.assert_awaited_once_with("1.1.1.1", 1883, None, None)
+    assert result["type"] == FlowResultType.FORM
+    assert result["step_id"] == "pick_device"
+    # Devices that are already set up are not offered
+    devices = result["data_schema"].schema[CONF_DEVICE].container
+    assert devices == {"A8yh63/new-id": "HUB2000 (new-id)"}
+
+    with patch(
+        "custom_components.zendure_mqtt.async_setup_entry",
+        return_value=True,
+    ):
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], {CONF_DEVICE: "A8yh63/new-id"}
+        )
+        await hass.async_block_till_done()
+
+    assert result["type"] == FlowResultType.CREATE_ENTRY
+    assert result["title"] == "Zendure HUB2000 (new-id)"
+    assert result["data"] == {
+        **broker,
+        CONF_DEVICE_MODEL: "hub2000",
+        CONF_DEVICE_ID: "new-id",
+    }
+
+
+async def test_form_discovery_nothing_found(hass: HomeAssistant) -> None:
+    """Test the discovery form shows an error when no device reports."""
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {"next_step_id": "discover"}
+    )
+    with patch(
+        "custom_components.zendure_mqtt.config_flow.async_discover_devices",
+        return_value={},
+    ):
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], {CONF_MQTT_HOST: "1.1.1.1"}
+        )
+
+    assert result["type"] == FlowResultType.FORM
+    assert result["errors"] == {"base": "no_devices_found"}
+
+
+async def test_options_settings(hass: HomeAssistant) -> None:
+    """Test changing the transport in the options flow."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["type"] == FlowResultType.MENU
+
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {"next_step_id": "settings"}
+    )
+    assert result["type"] == FlowResultType.FORM
+
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {CONF_TRANSPORT: TRANSPORT_THREAD, CONF_PACK_EXPIRY: 3600}
+    )
+    assert result["type"] == FlowResultType.CREATE_ENTRY
+    assert entry.options == {
+        CONF_TRANSPORT: TRANSPORT_THREAD,
+        CONF_PACK_EXPIRY: 3600,
+        CONF_COMMAND_INTERVAL: 1.0,
+        CONF_STATE_WRITE_INTERVAL: 0.0,
+        CONF_RECORD_TRAFFIC: False,
+    }
+
+
+async def test_options_update_filter(hass: HomeAssistant) -> None:
+    """Test overriding the update filter of a property."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+        options={CONF_TRANSPORT: TRANSPORT_THREAD},
+    )
+    entry.add_to_hass(hass)
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {"next_step_id": "update_filter"}
+    )
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {CONF_PROPERTY: "solarInputPower"}
+    )
+    assert result["type"] == FlowResultType.FORM
+    assert result["step_id"] == "update_filter_values"
+    # The form starts from the defaults in the property definition
+    defaults = {
+        str(key): key.default() for key in result["data_schema"].schema
+    }
+    assert defaults == {
+        CONF_DEADBAND: 2,
+        CONF_DEADBAND_PERCENT: 0,
+        CONF_MIN_INTERVAL: 0,
+    }
+
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"],
+        {CONF_DEADBAND: 0, CONF_DEADBAND_PERCENT: 5, CONF_MIN_INTERVAL: 30},
+    )
+    assert result["type"] == FlowResultType.CREATE_ENTRY
+    assert entry.options == {
+        CONF_TRANSPORT: TRANSPORT_THREAD,
+        CONF_UPDATE_FILTERS: {
+            "solarInputPower": {
+                CONF_DEADBAND: 0,
+                CONF_DEADBAND_PERCENT: 5,
+                CONF_MIN_INTERVAL: 30,
+            }
+        },
+    }
@@ -0,0 +1,183 @@
+"""Test the shared Zendure MQTT broker connection."""
+import asyncio
+import json
+import threading
+from unittest.mock import MagicMock, patch
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.zendure_mqtt.connection import (
+    RECONNECT_MAX,
+    RECONNECT_MIN,
+    MessageIdGuard,
+    ZendureMqttConnection,
+    filter_covers,
+    plan_subscriptions,
+    reconnect_delay,
+)
+from custom_components.zendure_mqtt.const import TRANSPORT_ASYNCIO, TRANSPORT_THREAD
+
+
+def test_filter_covers() -> None:
+    """Test topic filter coverage."""
+    assert filter_covers("/p/d/#", "/p/d/properties/report")
+    assert filter_covers("/p/d/#", "/p/d")
+    assert filter_covers("/+/+/properties/report", "/p/d/properties/report")
+    assert filter_covers("/p/+/properties/#", "/p/d/properties/write/reply")
+    assert not filter_covers("/p/d/properties/report", "/p/d/#")
+    assert not filter_covers("/p/d/properties/report", "/p/+/properties/report")
+    assert not filter_covers("/p/d/#", "/p/e/properties/report")
+    assert not filter_covers("/p/d/properties", "/p/d/properties/report")
+
+
+def test_plan_subscriptions() -> None:
+    """Test overlapping filters are reduced to a minimal set."""
+    assert plan_subscriptions(
+        [
+            "/p/d/properties/report",
+            "/p/d/properties/write/reply",
+            "/p/d/#",
+        ]
+    ) == ["/p/d/#"]
+    assert plan_subscriptions(
+        ["/p/d/properties/report", "/p/e/properties/report", "/p/d/properties/report"]
+    ) == ["/p/d/properties/report", "/p/e/properties/report"]
+
+
+def test_message_id_guard() -> None:
+    """Test repeated deliveries of a messageId are detected."""
+    guard = MessageIdGuard(size=2)
+    topic = "/p/d/properties/report"
+    assert not guard.is_duplicate(topic, b'{"messageId": "1", "properties": {}}')
+    assert guard.is_duplicate(topic, b'{"messageId":"1","properties":{}}')
+    assert not guard.is_duplicate("/p/d/properties/write/reply", b'{"messageId":1}')
+    # Payloads without a messageId are never treated as duplicates
+    assert not guard.is_duplicate(topic, b'{"properties": {}}')
+    assert not guard.is_duplicate(topic, b'{"properties": {}}')
+    assert not guard.is_duplicate(topic, b'{"messageId": 3}')
+    assert not guard.is_duplicate(topic, b'{"messageId": 4}')
+    # The oldest ID fell out of the topic's window
+    assert not guard.is_duplicate(topic, b'{"messageId": "1"}')
+    assert guard.duplicates == 1
+
+
+def test_message_id_guard_counter_reset() -> None:
+    """Test a device restarting its messageId counter is not dropped."""
+    guard = MessageIdGuard(max_age=30)
+    topic = "/p/d/properties/report"
+    for message_id in range(1, 6):
+        assert not guard.is_duplicate(topic, b'{"messageId": %d}' % message_id, 100.0)
+    # Redelivered within the age limit
+    assert guard.is_duplicate(topic, b'{"messageId": 5}', 110.0)
+    # The device restarted and counts from 1 again
+    for message_id in range(1, 6):
+        assert not guard.is_duplicate(topic, b'{"messageId": %d}' % message_id, 131.0)
+    assert guard.is_duplicate(topic, b'{"messageId": 3}', 132.0)
+    assert guard.duplicates == 2
+
+
+async def test_connection_routes_and_deduplicates(hass: HomeAssistant, mock_mqtt_client) -> None:
+    """Test messages reach their device once and subscriptions do not overlap."""
+    connection = ZendureMqttConnection(hass, "1.1.1.1", 1883, None, None, TRANSPORT_ASYNCIO)
+    received_a, received_b = [], []
+    connection.add_device(
+        "p", "a", ["/p/a/properties/report", "/p/a/#"], received_a.append, MagicMock()
+    )
+    remove_b = connection.add_device(
+        "p", "b", ["/p/b/properties/report"], received_b.append, MagicMock()
+    )
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    mock_mqtt_client.subscribe.assert_called_once_with(
+        [("/p/a/#", 0), ("/p/b/properties/report", 0)]
+    )
+
+    msg = MagicMock()
+    msg.topic = "/p/a/properties/report"
+    msg.payload = json.dumps({"messageId": "7", "properties": {}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    assert received_a == [msg]
+    assert received_b == []
+
+    remove_b()
+    mock_mqtt_client.unsubscribe.assert_called_once_with(["/p/b/properties/report"])
+
+    # A device added while connected subscribes only its own filters
+    mock_mqtt_client.subscribe.reset_mock()
+    remove_c = connection.add_device(
+        "p", "c", ["/p/c/properties/report", "/p/c/#"], MagicMock(), MagicMock()
+    )
+    mock_mqtt_client.subscribe.assert_called_once_with([("/p/c/#", 0)])
+
+    # A new session gets the cached plan of every device
+    mock_mqtt_client.subscribe.reset_mock()
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    mock_mqtt_client.subscribe.assert_called_once_with([("/p/a/#", 0), ("/p/c/#", 0)])
+
+    mock_mqtt_client.unsubscribe.reset_mock()
+    remove_c()
+    mock_mqtt_client.unsubscribe.assert_called_once_with(["/p/c/#"])
+
+
+async def test_thread_connect_resubscribes_in_event_loop(
+    hass: HomeAssistant, mock_mqtt_client
+) -> None:
+    """Test a connect on paho's thread leaves the subscription plan to the loop."""
+    connection = ZendureMqttConnection(hass, "1.1.1.1", 1883, None, None, TRANSPORT_THREAD)
+    connection.add_device("p", "a", ["/p/a/#"], MagicMock(), MagicMock())
+
+    thread = threading.Thread(
+        target=mock_mqtt_client.on_connect, args=(mock_mqtt_client, None, None, 0)
+    )
+    thread.start()
+    thread.join()
+    mock_mqtt_client.subscribe.assert_not_called()
+
+    await hass.async_block_till_done()
+    mock_mqtt_client.subscribe.assert_called_once_with([("/p/a/#", 0)])
+
+
+def test_reconnect_delay() -> None:
+    """Test the reconnect wait doubles up to the limit and is jittered."""
+    for failures, limit in ((1, RECONNECT_MIN), (2, 2 * RECONNECT_MIN), (20, RECONNECT_MAX)):
+        delays = [reconnect_delay(failures) for _ in range(50)]
+        assert all(limit / 2 <= delay <= limit for delay in delays)
+        assert len(set(delays)) > 1
+
+
+async def test_connect_in_background(hass: HomeAssistant, mock_mqtt_client) -> None:
+    """Test start does not wait for the broker and failed attempts back off."""
+    connection = ZendureMqttConnection(hass, "1.1.1.1", 1883, None, None, TRANSPORT_ASYNCIO)
+    mock_mqtt_client.connect.side_effect = OSError("unreachable")
+    sleeps = []
+    real_sleep = asyncio.sleep
+    stopped = asyncio.Event()
+
+    async def sleep(delay):
+        sleeps.append(delay)
+        if len(sleeps) > 4:
+            await stopped.wait()
+        await real_sleep(0)
+
+    with patch("custom_components.zendure_mqtt.connection.asyncio.sleep", sleep):
+        await connection.async_start()
+        assert mock_mqtt_client.connect.call_count == 0
+        for _ in range(100):
+            if len(sleeps) > 4:
+                break
+            await real_sleep(0.01)
+
+    # Keepalive ticks are interleaved with growing reconnect waits
+    assert mock_mqtt_client.connect.call_count == 3
+    assert RECONNECT_MIN / 2 <= sleeps[1] <= RECONNECT_MIN
+    assert RECONNECT_MIN <= sleeps[3] <= 2 * RECONNECT_MIN
+
+    mock_mqtt_client.connect.side_effect = None
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    assert connection._failures == 0
+    assert connection.reconnects == 0
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    assert connection.reconnects == 1
+
+    await connection.async_stop()
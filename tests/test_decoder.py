@@ -0,0 +1,16 @@
+"""Test the JSON decoders."""
+import pytest
+
+from custom_components.zendure_mqtt.decoder import DECODERS, get_decoder
+
+
+@pytest.mark.parametrize("name", sorted(DECODERS))
+def test_decoders(name: str) -> None:
+    """Test every decoder parses bytes and rejects non-JSON with ValueError."""
+    decode = get_decoder(name)
+    assert decode(b'{"properties": {"socSet": 900, "name": "\xc3\xa9"}}') == {
+        "properties": {"socSet": 900, "name": "é"}
+    }
+    for payload in (b"online", b"\xff\xfe", b'{"properties": '):
+        with pytest.raises(ValueError):
+            decode(payload)
@@ -0,0 +1,528 @@
+"""Test the Zendure device state."""
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+import json
+import threading
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from custom_components.zendure_mqtt.const import (
+    CONF_DEVICE_ID,
+    CONF_DEVICE_MODEL,
+    CONF_MQTT_HOST,
+    CONF_MQTT_PORT,
+    CONF_DEADBAND,
+    CONF_MIN_INTERVAL,
+    CONF_PACK_EXPIRY,
+    CONF_STATE_WRITE_INTERVAL,
+    CONF_TRANSPORT,
+    CONF_UPDATE_FILTERS,
+    DATA_BATCHER,
+    DOMAIN,
+    TRANSPORT_THREAD,
+)
+from custom_components.zendure_mqtt.sensor import (
+    ZendureMqttSensor,
+    ZendurePropertySensor,
+)
+
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
+
+
+async def test_unchanged_reports_skip_state_writes(
+    hass: HomeAssistant, mock_mqtt_client, multipack_report
+) -> None:
+    """Test a report repeating the last values writes no state."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    device = hass.data[DOMAIN][entry.entry_id]
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps(multipack_report).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+    writes = device.state_writes
+
+    # Same values under a new messageId
+    multipack_report["messageId"] = "1022"
+    msg.payload = json.dumps(multipack_report).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+    assert device.state_writes == writes
+
+    # A single changed pack value writes a single state
+    multipack_report["messageId"] = "1023"
+    multipack_report["packData"][2]["power"] = 99
+    multipack_report["packData"][3]["power"] += 1
+    msg.payload = json.dumps(multipack_report).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    assert device.stats["messages_received"] == 3
+    assert device.stats["state_writes"] == writes + 1
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_pack_co4h00000002_pack_power")
+    assert state.state == "99"
+    # The 1 W change on the last pack is inside the default deadband
+    assert device.stats["filtered_updates"] == 1
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_pack_co4h00000003_pack_power")
+    assert state.state == "48"
+
+
+async def test_minimum_update_interval(
+    hass: HomeAssistant, mock_mqtt_client, freezer
+) -> None:
+    """Test changes inside the minimum interval are held back, not lost."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+        options={
+            CONF_UPDATE_FILTERS: {
+                "outputHomePower": {CONF_DEADBAND: 0, CONF_MIN_INTERVAL: 30}
+            }
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    entity_id = "sensor.zendure_hub2000_test_device_id_output_home_power"
+
+    for power in (500, 501, 620):
+        msg.payload = json.dumps({"properties": {"outputHomePower": power}}).encode("utf-8")
+        mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+        await hass.async_block_till_done()
+        freezer.tick(5)
+
+    assert hass.states.get(entity_id).state == "501"
+
+    freezer.tick(30)
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert hass.states.get(entity_id).state == "620"
+
+
+async def test_silent_pack_is_forgotten(
+    hass: HomeAssistant, mock_mqtt_client, multipack_report, freezer
+) -> None:
+    """Test a pack that stops reporting is dropped and its entities unavailable."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+        options={CONF_PACK_EXPIRY: 600},
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    device = hass.data[DOMAIN][entry.entry_id]
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps(multipack_report).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+    assert device.stats["packs"] == 4
+
+    # Only the first pack keeps reporting
+    freezer.tick(900)
+    del multipack_report["packData"][1:]
+    multipack_report["messageId"] = "1022"
+    msg.payload = json.dumps(multipack_report).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    assert device.stats["packs"] == 1
+    assert device.stats["evicted_packs"] == 3
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_pack_co4h00000002_pack_power")
+    assert state.state == "unavailable"
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_pack_co4h00000000_pack_power")
+    assert state.state == "45"
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id")
+    assert not any(key.startswith("pack_CO4H00000002") for key in state.attributes)
+
+
+async def test_full_state_requested_on_connect_and_when_stale(
+    hass: HomeAssistant, mock_mqtt_client, freezer
+) -> None:
+    """Test getAll is requested after connecting and after a quiet period."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.publish.return_value.rc = 0
+
+    def read_requests() -> list:
+        return [
+            json.loads(call[0][1])
+            for call in mock_mqtt_client.publish.call_args_list
+            if call[0][0] == "iot/A8yh63/test-device-id/properties/read"
+        ]
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    freezer.tick(11)
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert [request["properties"] for request in read_requests()] == [["getAll"]]
+
+    # A reconnect asks again
+    mock_mqtt_client.on_disconnect(mock_mqtt_client, None, 1)
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    freezer.tick(11)
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert len(read_requests()) == 2
+
+    # So does a device that stays quiet past the staleness threshold
+    for _ in range(6):
+        freezer.tick(60)
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+    freezer.tick(11)
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert len(read_requests()) == 3
+    assert hass.data[DOMAIN][entry.entry_id].stats["resync_requests"] == 3
+
+
+async def test_thread_reports_handed_off(hass: HomeAssistant, mock_mqtt_client) -> None:
+    """Test a burst from paho's thread reaches the event loop as one update."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+        options={CONF_TRANSPORT: TRANSPORT_THREAD},
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    device = hass.data[DOMAIN][entry.entry_id]
+    device._handoff.max_pending = 3
+
+    def burst() -> None:
+        """Deliver reports like paho's network thread does."""
+        mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+        for power in range(100, 110):
+            msg = MagicMock()
+            msg.topic = "/A8yh63/test-device-id/properties/report"
+            msg.payload = json.dumps(
+                {"messageId": str(power), "properties": {"outputHomePower": power}}
+            ).encode("utf-8")
+            mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+        msg.payload = json.dumps(
+            {
+                "messageId": "1",
+                "properties": {"solarInputPower": 1, "inputLimit": 2, "gridInputPower": 3},
+            }
+        ).encode("utf-8")
+        mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+
+    thread = threading.Thread(target=burst)
+    thread.start()
+    thread.join()
+    # Nothing is applied until the event loop drains the handoff
+    assert device.get_value((None, "outputHomePower")) is None
+    assert device.stats["handoff_depth"] == 11
+    await hass.async_block_till_done()
+
+    stats = device.stats
+    assert stats["messages_received"] == 11
+    assert stats["handoff_drains"] == 1
+    assert stats["handoff_depth"] == 0
+    assert stats["handoff_max_depth"] == 11
+    assert stats["handoff_superseded"] == 9
+    # Only three keys may wait at once
+    assert stats["handoff_dropped"] == 1
+    assert device.get_value((None, "outputHomePower")) == 109
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_output_home_power")
+    assert state.state == "109"
+
+
+async def test_state_writes_batched_across_entries(
+    hass: HomeAssistant, mock_mqtt_client
+) -> None:
+    """Test bursts on two devices write each entity once, in one batch."""
+    entries = []
+    for device_id in ("device-a", "device-b"):
+        entry = MockConfigEntry(
+            domain=DOMAIN,
+            data={
+                CONF_MQTT_HOST: "1.1.1.1",
+                CONF_MQTT_PORT: 1883,
+                CONF_DEVICE_MODEL: "hub2000",
+                CONF_DEVICE_ID: device_id,
+            },
+        )
+        entry.add_to_hass(hass)
+        entries.append(entry)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        # Setting up the domain sets up both entries
+        await hass.config_entries.async_setup(entries[0].entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+
+    def report(device_id: str, power: int) -> None:
+        """Deliver a report of a device."""
+        msg = MagicMock()
+        msg.topic = f"/A8yh63/{device_id}/properties/report"
+        msg.payload = json.dumps(
+            {"messageId": str(power), "properties": {"outputHomePower": power}}
+        ).encode("utf-8")
+        mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+
+    for device_id in ("device-a", "device-b"):
+        report(device_id, 10)
+    await hass.async_block_till_done()
+
+    batcher = hass.data[DOMAIN][DATA_BATCHER]
+    flushes = batcher.flushes
+    coalesced = batcher.coalesced
+    written = []
+    original = ZendurePropertySensor.async_write_ha_state
+
+    def track_write(entity):
+        written.append(entity.entity_id)
+        original(entity)
+
+    with patch.object(ZendurePropertySensor, "async_write_ha_state", track_write):
+        for power in (100, 200, 300):
+            for device_id in ("device-a", "device-b"):
+                report(device_id, power)
+        # Nothing is written until the event loop iteration ends
+        assert written == []
+        await hass.async_block_till_done()
+
+    assert sorted(written) == [
+        "sensor.zendure_hub2000_device_a_output_home_power",
+        "sensor.zendure_hub2000_device_b_output_home_power",
+    ]
+    assert batcher.flushes == flushes + 1
+    assert batcher.coalesced == coalesced + 4
+    assert batcher.stats["batch_pending"] == 0
+    for device_id in ("device_a", "device_b"):
+        state = hass.states.get(f"sensor.zendure_hub2000_{device_id}_output_home_power")
+        assert state.state == "300"
+
+
+async def test_state_write_interval(hass: HomeAssistant, mock_mqtt_client) -> None:
+    """Test state writes wait for the configured interval."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+        options={CONF_STATE_WRITE_INTERVAL: 2.0},
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps({"properties": {"outputHomePower": 10}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=3))
+    await hass.async_block_till_done()
+
+    entity_id = "sensor.zendure_hub2000_test_device_id_output_home_power"
+    assert hass.states.get(entity_id).state == "10"
+
+    msg.payload = json.dumps({"properties": {"outputHomePower": 250}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+    assert hass.states.get(entity_id).state == "10"
+
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=3))
+    await hass.async_block_till_done()
+    assert hass.states.get(entity_id).state == "250"
+
+
+async def test_summary_state_kept_across_partial_reports(
+    hass: HomeAssistant, mock_mqtt_client
+) -> None:
+    """Test reports without the battery level leave the summary state alone."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    entity_id = "sensor.zendure_hub2000_test_device_id"
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps({"properties": {"packState": 1}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+    assert hass.states.get(entity_id).state == "charging"
+
+    msg.payload = json.dumps(
+        {"properties": {"electricLevel": 50, "outputHomePower": 100}}
+    ).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+    assert hass.states.get(entity_id).state == "50"
+
+    written = []
+    original = ZendureMqttSensor.async_write_ha_state
+
+    def track_write(entity):
+        written.append(entity.entity_id)
+        original(entity)
+
+    with patch.object(ZendureMqttSensor, "async_write_ha_state", track_write):
+        # A partial report and a write reply, repeating known values
+        msg.payload = json.dumps({"properties": {"outputHomePower": 100}}).encode("utf-8")
+        mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+        reply = MagicMock()
+        reply.topic = "/A8yh63/test-device-id/properties/write/reply"
+        reply.payload = json.dumps({"messageId": "5", "success": 1}).encode("utf-8")
+        mock_mqtt_client.on_message(mock_mqtt_client, None, reply)
+        msg.payload = json.dumps({"properties": {"electricLevel": 50}}).encode("utf-8")
+        mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+        await hass.async_block_till_done()
+
+    assert written == []
+    assert hass.states.get(entity_id).state == "50"
+
+
+async def test_malformed_pack_state(hass: HomeAssistant, mock_mqtt_client) -> None:
+    """Test a packState that is not a number is shown as text."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps(
+        {"properties": {"packState": [1], "outputHomePower": 100}}
+    ).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    assert hass.states.get("sensor.zendure_hub2000_test_device_id").state == "[1]"
+    # The other values of the report still reach their entities
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_output_home_power")
+    assert state.state == "100"
+
+    msg.payload = json.dumps({"properties": {"outputHomePower": 300}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_output_home_power")
+    assert state.state == "300"
+
+
+async def test_update_errors_are_logged(
+    hass: HomeAssistant, mock_mqtt_client, caplog
+) -> None:
+    """Test an error while applying a report is logged, not raised to paho."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    device = hass.data[DOMAIN][entry.entry_id]
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps({"properties": {"outputHomePower": 100}}).encode("utf-8")
+    with patch.object(device, "_apply_updates", side_effect=RuntimeError("boom")):
+        mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+        msg.payload = b"offline"
+        mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    assert caplog.text.count("Error processing MQTT message: boom") == 2
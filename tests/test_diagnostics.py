@@ -0,0 +1,98 @@
+"""Test the Zendure MQTT diagnostics."""
+from unittest.mock import MagicMock, patch
+import json
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
+
+from custom_components.zendure_mqtt.const import (
+    CONF_DEVICE_ID,
+    CONF_DEVICE_MODEL,
+    CONF_MQTT_HOST,
+    CONF_MQTT_PASSWORD,
+    CONF_MQTT_PORT,
+    CONF_MQTT_USERNAME,
+    DOMAIN,
+)
+from custom_components.zendure_mqtt.diagnostics import (
+    async_get_config_entry_diagnostics,
+)
+from custom_components.zendure_mqtt.metrics import MessageMetrics
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+
+def test_message_metrics() -> None:
+    """Test the message rate, bytes and timing percentiles."""
+    metrics = MessageMetrics(now=1000.0)
+    for index in range(120):
+        metrics.record_message(100, 1000.0 + index / 2)
+    for index in range(1, 101):
+        metrics.record_timing(index / 1e6, 2 * index / 1e6)
+
+    summary = metrics.as_dict(now=1060.0)
+    assert summary["bytes_received"] == 12000
+    # Two messages per second over the last minute
+    assert summary["message_rate"] == 2.0
+    assert summary["parse_time_p50"] == 0.051
+    assert summary["parse_time_p99"] == 0.099
+    assert summary["parse_time_max"] == 0.1
+    assert summary["convert_time_p50"] == 0.102
+
+    # Old seconds leave the window
+    assert metrics.message_rate(now=1200.0) == 0.0
+
+
+async def test_entry_diagnostics(hass: HomeAssistant, mock_mqtt_client) -> None:
+    """Test the diagnostics download and the diagnostic sensors."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_MQTT_USERNAME: "user",
+            CONF_MQTT_PASSWORD: "secret",
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps(
+        {"messageId": "1", "properties": {"electricLevel": 85, "unknownProperty": 7}}
+    ).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    # A repeated delivery is dropped before it is parsed
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+    assert diagnostics["entry"]["data"][CONF_MQTT_PASSWORD] == "**REDACTED**"
+    assert diagnostics["entry"]["data"][CONF_MQTT_USERNAME] == "**REDACTED**"
+    assert diagnostics["connection"]["connected"] is True
+    assert diagnostics["connection"]["duplicates"] == 1
+    metrics = diagnostics["device"]["metrics"]
+    assert metrics["bytes_received"] == len(msg.payload)
+    # Broker counters are shared by its devices, so they are not device metrics
+    assert "broker_duplicates" not in metrics
+    assert metrics["message_rate"] > 0
+    assert metrics["parse_time_max"] > 0
+    assert diagnostics["device"]["stats"]["messages_received"] == 1
+    assert diagnostics["values"]["values"] == {"electricLevel": 85}
+    assert diagnostics["values"]["extra"] == {"unknownProperty": 7}
+    json.dumps(diagnostics)
+
+    # Diagnostic sensors are created disabled
+    entity_registry = er.async_get(hass)
+    entity_id = "sensor.zendure_hub2000_test_device_id_bytes_received"
+    registry_entry = entity_registry.async_get(entity_id)
+    assert registry_entry.entity_category == "diagnostic"
+    assert registry_entry.disabled_by == er.RegistryEntryDisabler.INTEGRATION
+    assert hass.states.get(entity_id) is None
@@ -1,5 +1,6 @@
 """Test the Zendure MQTT initialization."""
-from unittest.mock import patch
+import json
+from unittest.mock import MagicMock, patch
 
 from homeassistant.config_entries import ConfigEntryState
 from homeassistant.core import HomeAssistant
@@ -11,10 +12,16 @@ from custom_components.zendure_mqtt.const import (
     CONF_MQTT_PASSWORD,
     CONF_MQTT_PORT,
     CONF_MQTT_USERNAME,
+    CONF_TRANSPORT,
+    DATA_CONNECTIONS,
     DOMAIN,
+    TRANSPORT_THREAD,
 )
 
-from pytest_homeassistant_custom_component.common import MockConfigEntry
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
 
 
 async def test_setup_unload_entry(hass: HomeAssistant, mock_mqtt_client) -> None:
@@ -32,7 +39,7 @@ async def test_setup_unload_entry(hass: HomeAssistant, mock_mqtt_client) -> None
     )
     entry.add_to_hass(hass)
 
-    with patch("custom_components.zendure_mqtt.sensor.mqtt.Client", return_value=mock_mqtt_client):
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
         await hass.config_entries.async_setup(entry.entry_id)
         await hass.async_block_till_done()
 
@@ -42,3 +49,191 @@ async def test_setup_unload_entry(hass: HomeAssistant, mock_mqtt_client) -> None
     await hass.async_block_till_done()
 
     assert entry.state == ConfigEntryState.NOT_LOADED
+
+
+async def test_entries_share_broker_connection(hass: HomeAssistant) -> None:
+    """Test entries on the same broker share one MQTT client."""
+    entries = []
+    for device_id in ("device-a", "device-b"):
+        entry = MockConfigEntry(
+            domain=DOMAIN,
+            data={
+                CONF_MQTT_HOST: "1.1.1.1",
+                CONF_MQTT_PORT: 1883,
+                CONF_MQTT_USERNAME: "test-user",
+                CONF_MQTT_PASSWORD: "test-password",
+                CONF_DEVICE_MODEL: "hub2000",
+                CONF_DEVICE_ID: device_id,
+            },
+        )
+        entry.add_to_hass(hass)
+        entries.append(entry)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client") as mock_client:
+        client = mock_client.return_value
+        # Setting up the domain sets up both entries
+        await hass.config_entries.async_setup(entries[0].entry_id)
+        await hass.async_block_till_done()
+
+        assert mock_client.call_count == 1
+        assert client.connect.call_count == 1
+
+        client.on_connect(client, None, None, 0)
+        msg = MagicMock()
+        msg.topic = "/A8yh63/device-b/properties/report"
+        msg.payload = json.dumps({"properties": {"electricLevel": 42}}).encode("utf-8")
+        client.on_message(client, None, msg)
+        await hass.async_block_till_done()
+
+        assert hass.states.get("sensor.zendure_hub2000_device_a").state == "unknown"
+        assert hass.states.get("sensor.zendure_hub2000_device_b").state == "42"
+
+        pool = hass.data[DOMAIN][DATA_CONNECTIONS]
+        assert len(pool) == 1
+
+        await hass.config_entries.async_unload(entries[0].entry_id)
+        await hass.async_block_till_done()
+        assert len(pool) == 1
+
+        await hass.config_entries.async_unload(entries[1].entry_id)
+        await hass.async_block_till_done()
+        assert len(pool) == 0
+
+
+
+async def test_transport_per_broker(hass: HomeAssistant, caplog) -> None:
+    """Test entries asking for different transports still share a connection."""
+    entries = []
+    for device_id, options in (
+        ("device-a", {}),
+        ("device-b", {CONF_TRANSPORT: TRANSPORT_THREAD}),
+    ):
+        entry = MockConfigEntry(
+            domain=DOMAIN,
+            data={
+                CONF_MQTT_HOST: "1.1.1.1",
+                CONF_MQTT_PORT: 1883,
+                CONF_DEVICE_MODEL: "hub2000",
+                CONF_DEVICE_ID: device_id,
+            },
+            options=options,
+        )
+        entry.add_to_hass(hass)
+        entries.append(entry)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client") as mock_client:
+        await hass.config_entries.async_setup(entries[0].entry_id)
+        await hass.async_block_till_done()
+
+        assert mock_client.call_count == 1
+        assert len(hass.data[DOMAIN][DATA_CONNECTIONS]) == 1
+        connections = {hass.data[DOMAIN][entry.entry_id].connection for entry in entries}
+        assert len(connections) == 1
+        assert "the transport applies to all devices on a broker" in caplog.text
+
+        for entry in entries:
+            await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_block_till_done()
+
+async def test_thread_transport(hass: HomeAssistant, mock_mqtt_client) -> None:
+    """Test the paho network thread is only used by the thread transport."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+        options={CONF_TRANSPORT: TRANSPORT_THREAD},
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    assert mock_mqtt_client.loop_start.call_count == 1
+
+    await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert mock_mqtt_client.loop_stop.call_count == 1
+    assert mock_mqtt_client.disconnect.call_count == 1
+
+
+async def test_asyncio_transport(hass: HomeAssistant, mock_mqtt_client) -> None:
+    """Test the default transport registers socket hooks instead of a thread."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    connection = hass.data[DOMAIN][DATA_CONNECTIONS].get(entry.entry_id)
+    assert connection.in_event_loop
+    assert mock_mqtt_client.connect.call_count == 1
+    assert mock_mqtt_client.loop_start.call_count == 0
+    assert mock_mqtt_client.on_socket_open == connection._on_socket_open
+
+    await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+
+async def test_snapshot_flushed_on_unload_and_removed(
+    hass: HomeAssistant, mock_mqtt_client, hass_storage, freezer
+) -> None:
+    """Test unloading writes a pending snapshot and removal leaves none behind."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+    key = f"{DOMAIN}.{entry.entry_id}"
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps({"properties": {"electricLevel": 50}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+    assert key not in hass_storage
+
+    # The save due in 60 s is written when the entry unloads
+    await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+    assert hass_storage[key]["data"]["values"] == {"electricLevel": 50}
+
+    await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    msg.payload = json.dumps({"properties": {"electricLevel": 60}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    await hass.config_entries.async_remove(entry.entry_id)
+    await hass.async_block_till_done()
+    assert key not in hass_storage
+
+    # No write that was due brings the file back
+    freezer.tick(120)
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert key not in hass_storage
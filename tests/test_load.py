@@ -0,0 +1,179 @@
+"""Load tests against simulated devices on a local MQTT broker."""
+import asyncio
+import gc
+import time
+import tracemalloc
+
+import pytest
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.zendure_mqtt.const import (
+    CONF_DEVICE_ID,
+    CONF_DEVICE_MODEL,
+    CONF_MQTT_HOST,
+    CONF_MQTT_PORT,
+    DATA_CONNECTIONS,
+    DEVICE_MODELS,
+    DOMAIN,
+)
+from custom_components.zendure_mqtt.device import ZendureDevice
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from .simulator import MqttBroker, ZendureSimulator
+
+FLEET_SIZE = 200
+REPORT_ROUNDS = 20
+MEMORY_ROUNDS = 5
+# Seconds of jittered traffic while the event loop lag is measured
+RUN_TIME = 2
+# Upper bounds for the steady state of the whole fleet; generous so slow CI
+# machines pass while an accidental quadratic path or leak does not
+MAX_CPU_PER_MESSAGE = 0.002
+MAX_LOOP_LAG = 0.5
+MAX_MEMORY_GROWTH = 256 * 1024
+
+
+async def _setup_fleet(
+    hass: HomeAssistant, broker: MqttBroker, simulator: ZendureSimulator, size: int
+) -> list[ZendureDevice]:
+    """Set up a config entry per simulated device and wait for the connection."""
+    devices = []
+    for simulated in simulator.add_devices(size):
+        entry = MockConfigEntry(
+            domain=DOMAIN,
+            unique_id=f"{simulated.device_id}_{simulated.model}",
+            data={
+                CONF_MQTT_HOST: "127.0.0.1",
+                CONF_MQTT_PORT: broker.port,
+                CONF_DEVICE_MODEL: simulated.model,
+                CONF_DEVICE_ID: simulated.device_id,
+            },
+        )
+        entry.add_to_hass(hass)
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        devices.append(hass.data[DOMAIN][entry.entry_id])
+    await hass.async_block_till_done()
+    await _wait_for(lambda: all(device.available for device in devices))
+    return devices
+
+
+async def _wait_for(condition, timeout: float = 30) -> None:
+    """Let the event loop run until the condition holds."""
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "condition not reached in time"
+        await asyncio.sleep(0.01)
+
+
+async def _unload_all(hass: HomeAssistant) -> None:
+    """Unload every config entry of the integration."""
+    for entry in hass.config_entries.async_entries(DOMAIN):
+        await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+
+async def _publish_rounds(
+    simulator: ZendureSimulator, devices: list[ZendureDevice], rounds: int
+) -> None:
+    """Publish rounds of reports and wait until every device handled them."""
+    received = sum(device.messages_received for device in devices)
+    for _ in range(rounds):
+        received += simulator.publish_reports()
+        await _wait_for(
+            lambda: sum(device.messages_received for device in devices) >= received
+        )
+
+
+def _integration_memory() -> int:
+    """Return the bytes held by allocations made in the integration's code."""
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(True, "*/custom_components/zendure_mqtt/*")]
+    )
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+
+async def _measure_loop_lag(lags: list[float], interval: float = 0.01) -> None:
+    """Record how late the event loop wakes a sleeping task."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+@pytest.mark.slow
+async def test_fleet_load(
+    hass: HomeAssistant, mqtt_broker: MqttBroker, zendure_simulator: ZendureSimulator
+) -> None:
+    """Test hundreds of devices on one broker stay cheap in CPU, lag and memory."""
+    devices = await _setup_fleet(hass, mqtt_broker, zendure_simulator, FLEET_SIZE)
+    # All entries share one broker connection
+    assert mqtt_broker.connections == 1
+    assert len(hass.data[DOMAIN][DATA_CONNECTIONS]._connections) == 1
+    assert {device.device_model for device in devices} == set(DEVICE_MODELS)
+
+    # A full report per device creates the entities
+    zendure_simulator.publish_reports(full=True)
+    await _wait_for(lambda: all(device.messages_received >= 1 for device in devices))
+    await hass.async_block_till_done()
+    assert all(
+        len(device.store.packs) == len(simulated.packs)
+        for device, simulated in zip(devices, zendure_simulator.devices.values())
+    )
+
+    cpu_before = time.process_time()
+    await _publish_rounds(zendure_simulator, devices, REPORT_ROUNDS)
+    cpu = time.process_time() - cpu_before
+
+    # Event loop lag under reports spread like a live fleet sends them
+    lags: list[float] = []
+    lag_task = asyncio.create_task(_measure_loop_lag(lags))
+    await zendure_simulator.run(RUN_TIME, interval=0.5)
+    lag_task.cancel()
+
+    # Memory is traced separately as tracing slows everything down
+    tracemalloc.start()
+    await _publish_rounds(zendure_simulator, devices, 2)
+    memory_before = _integration_memory()
+    await _publish_rounds(zendure_simulator, devices, MEMORY_ROUNDS)
+    memory_growth = _integration_memory() - memory_before
+    tracemalloc.stop()
+
+    messages = FLEET_SIZE * REPORT_ROUNDS
+    cpu_per_message = cpu / messages
+    assert cpu_per_message < MAX_CPU_PER_MESSAGE, (
+        f"{cpu_per_message * 1e6:.0f} us CPU per message"
+    )
+    max_lag = max(lags, default=0)
+    assert max_lag < MAX_LOOP_LAG, f"max loop lag {max_lag * 1000:.0f} ms"
+    assert memory_growth < MAX_MEMORY_GROWTH, (
+        f"memory growth {memory_growth / 1024:.0f} KiB"
+    )
+
+    await _unload_all(hass)
+
+
+async def test_fleet_writes(
+    hass: HomeAssistant, mqtt_broker: MqttBroker, zendure_simulator: ZendureSimulator
+) -> None:
+    """Test write commands reach simulated devices and are acknowledged."""
+    devices = await _setup_fleet(hass, mqtt_broker, zendure_simulator, 20)
+    zendure_simulator.publish_reports(full=True)
+    await _wait_for(lambda: all(device.messages_received >= 1 for device in devices))
+
+    results = await asyncio.gather(
+        *(device.async_write_property({"outputLimit": 400}) for device in devices)
+    )
+    assert all(results)
+    await _wait_for(
+        lambda: all(device.get_value((None, "outputLimit")) == 400 for device in devices)
+    )
+    assert all(
+        simulated.writes == [{"outputLimit": 400}]
+        for simulated in zendure_simulator.devices.values()
+    )
+
+    await _unload_all(hass)
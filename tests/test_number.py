@@ -0,0 +1,112 @@
+"""Test the Zendure MQTT numbers."""
+from unittest.mock import MagicMock, patch
+import json
+
+from homeassistant.components.number import (
+    ATTR_VALUE,
+    DOMAIN as NUMBER_DOMAIN,
+    SERVICE_SET_VALUE,
+)
+from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.core import HomeAssistant
+import pytest
+
+from custom_components.zendure_mqtt.const import (
+    CONF_DEVICE_ID,
+    CONF_DEVICE_MODEL,
+    CONF_MQTT_HOST,
+    CONF_MQTT_PORT,
+    DOMAIN,
+)
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+
+async def test_number(
+    hass: HomeAssistant, mock_mqtt_client, mock_write_replies
+) -> None:
+    """Test a writable number property."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps({"properties": {"outputLimit": 600}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    entity_id = "number.zendure_hub2000_test_device_id_output_limit"
+    state = hass.states.get(entity_id)
+    assert state.state == "600"
+    assert state.attributes["max"] == 10000
+
+    await hass.services.async_call(
+        NUMBER_DOMAIN,
+        SERVICE_SET_VALUE,
+        {ATTR_ENTITY_ID: entity_id, ATTR_VALUE: 800},
+        blocking=True,
+    )
+    topic, payload = mock_mqtt_client.publish.call_args[0]
+    assert topic == "iot/A8yh63/test-device-id/properties/write"
+    assert json.loads(payload)["properties"] == {"outputLimit": 800}
+
+
+async def test_converted_number(
+    hass: HomeAssistant, mock_mqtt_client, mock_write_replies
+) -> None:
+    """Test a number with a conversion writes raw values and checks its range."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps({"properties": {"socSet": 1000}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    entity_id = "number.zendure_hub2000_test_device_id_soc_set"
+    assert hass.states.get(entity_id).state == "100.0"
+
+    await hass.services.async_call(
+        NUMBER_DOMAIN,
+        SERVICE_SET_VALUE,
+        {ATTR_ENTITY_ID: entity_id, ATTR_VALUE: 90},
+        blocking=True,
+    )
+    topic, payload = mock_mqtt_client.publish.call_args[0]
+    assert json.loads(payload)["properties"] == {"socSet": 900}
+
+    # Rejected locally, nothing is published
+    mock_mqtt_client.publish.reset_mock()
+    device = hass.data[DOMAIN][entry.entry_id]
+    with pytest.raises(ValueError, match="at least 80"):
+        await device.async_write_property({"socSet": 50})
+    assert not device.write_property({"socSet": 50})
+    await hass.async_block_till_done()
+    mock_mqtt_client.publish.assert_not_called()
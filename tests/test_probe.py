@@ -0,0 +1,133 @@
+"""Test the config flow broker probe."""
+import asyncio
+
+import pytest
+
+from custom_components.zendure_mqtt.probe import (
+    CannotConnect,
+    InvalidAuth,
+    async_discover_devices,
+    async_probe_broker,
+    connect_packet,
+    subscribe_packet,
+)
+
+# The probe talks to a local broker over a real socket
+pytestmark = pytest.mark.usefixtures("socket_enabled")
+
+TOPIC = "/A8yh63/test-device-id/properties/report"
+
+
+async def _broker(
+    return_code: int = 0, reports: tuple[str, ...] = (TOPIC,), answer: bool = True
+):
+    """Start a minimal broker on a free local port; returns the server and what it received."""
+    received: list[bytes] = []
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            received.append(await reader.read(1024))
+            if not answer:
+                # Stay silent until the client gives up
+                await reader.read(1024)
+                return
+            writer.write(bytes([0x20, 0x02, 0x00, return_code]))
+            await writer.drain()
+            received.append(await reader.read(1024))
+            writer.write(b"\x90\x03\x00\x01\x00")
+            for report in reports:
+                topic = report.encode()
+                body = len(topic).to_bytes(2, "big") + topic + b'{"properties": {}}'
+                writer.write(bytes([0x30, len(body)]) + body)
+            await writer.drain()
+            await reader.read(1024)
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1], received
+
+
+def test_packets() -> None:
+    """Test CONNECT and SUBSCRIBE are encoded as MQTT 3.1.1."""
+    assert connect_packet("c", None, None, 10) == (
+        b"\x10\x0d\x00\x04MQTT\x04\x02\x00\x0a\x00\x01c"
+    )
+    assert connect_packet("c", "u", "p", 10) == (
+        b"\x10\x13\x00\x04MQTT\x04\xc2\x00\x0a\x00\x01c\x00\x01u\x00\x01p"
+    )
+    assert subscribe_packet(1, "t") == b"\x82\x06\x00\x01\x00\x01t\x00"
+    # Remaining lengths over 127 take a second byte
+    assert connect_packet("c" * 200, None, None, 10)[1:3] == b"\xd4\x01"
+
+
+async def test_probe_connects_and_sees_report() -> None:
+    """Test a broker accepting the session and delivering a report."""
+    server, port, received = await _broker()
+    async with server:
+        result = await async_probe_broker("127.0.0.1", port, "user", "secret", TOPIC)
+    assert result.report_seen is True
+    assert 0 <= result.rtt < 5
+    assert b"secret" in received[0]
+    assert TOPIC.encode() in received[1]
+
+
+async def test_probe_without_report() -> None:
+    """Test a quiet device does not fail the probe."""
+    server, port, _ = await _broker(reports=())
+    async with server:
+        result = await async_probe_broker(
+            "127.0.0.1", port, None, None, TOPIC, report_wait=0.1
+        )
+        assert result.report_seen is False
+        result = await async_probe_broker("127.0.0.1", port, None, None)
+        assert result.report_seen is None
+
+
+async def test_probe_refused_credentials() -> None:
+    """Test refused credentials are told apart from connection failures."""
+    server, port, _ = await _broker(return_code=4)
+    async with server:
+        with pytest.raises(InvalidAuth):
+            await async_probe_broker("127.0.0.1", port, "user", "wrong")
+
+
+async def test_probe_unreachable() -> None:
+    """Test a closed port and a silent broker fail within the deadline."""
+    server, port, _ = await _broker()
+    server.close()
+    await server.wait_closed()
+    with pytest.raises(CannotConnect):
+        await async_probe_broker("127.0.0.1", port, None, None)
+
+    server, port, _ = await _broker(answer=False)
+    async with server:
+        with pytest.raises(CannotConnect, match="did not answer"):
+            await async_probe_broker("127.0.0.1", port, None, None, timeout=0.1)
+
+
+async def test_discover_devices() -> None:
+    """Test devices of known models are collected from report topics."""
+    server, port, received = await _broker(
+        reports=(
+            TOPIC,
+            TOPIC,
+            "/unknown/other-device/properties/report",
+            "/73bkTV/second-device/properties/report",
+        )
+    )
+    async with server:
+        found = await async_discover_devices(
+            "127.0.0.1", port, None, None, duration=0.2
+        )
+        assert found == {
+            ("A8yh63", "test-device-id"): "hub2000",
+            ("73bkTV", "second-device"): "hub1200",
+        }
+        assert b"/+/+/properties/report" in received[1]
+
+        # The scan stops as soon as the limit is reached
+        found = await async_discover_devices(
+            "127.0.0.1", port, None, None, duration=10, limit=1
+        )
+        assert found == {("A8yh63", "test-device-id"): "hub2000"}
@@ -0,0 +1,145 @@
+"""Test the Zendure property definitions and conversions."""
+import timeit
+
+import pytest
+
+from custom_components.zendure_mqtt.properties import (
+    DEVICE_CONVERTERS,
+    DEVICE_PROPERTIES,
+    PACK_CONVERTERS,
+    PACK_PROPERTIES,
+    apply_conversion,
+    compile_conversion,
+    compile_inverse_conversion,
+    encode_writes,
+)
+
+
+def _eval_conversion(value, conversion):
+    """Convert a value the way the integration did before precompiling."""
+    if conversion is None or value is None:
+        return value
+    try:
+        return eval(conversion, {"__builtins__": {}}, {"value": value})
+    except Exception:
+        return value
+
+
+def _convert_report_eval(report: dict) -> dict:
+    """Convert a report by evaluating each formula string."""
+    result = {}
+    for key, value in report["properties"].items():
+        if key in DEVICE_PROPERTIES:
+            value = _eval_conversion(value, DEVICE_PROPERTIES[key]["conversion"])
+        result[key] = value
+    for pack in report["packData"]:
+        for key, value in pack.items():
+            if key in PACK_PROPERTIES:
+                value = _eval_conversion(value, PACK_PROPERTIES[key]["conversion"])
+            result[f"pack_{pack['sn']}_{key}"] = value
+    return result
+
+
+def _convert_report_compiled(report: dict) -> dict:
+    """Convert a report with the precompiled converters."""
+    result = {}
+    for key, value in report["properties"].items():
+        converter = DEVICE_CONVERTERS.get(key)
+        if converter is not None:
+            value = converter(value)
+        result[key] = value
+    for pack in report["packData"]:
+        for key, value in pack.items():
+            converter = PACK_CONVERTERS.get(key)
+            if converter is not None:
+                value = converter(value)
+            result[f"pack_{pack['sn']}_{key}"] = value
+    return result
+
+
+@pytest.mark.parametrize(
+    "definitions", [DEVICE_PROPERTIES, PACK_PROPERTIES], ids=["device", "pack"]
+)
+def test_compiled_conversions_match_eval(definitions) -> None:
+    """Test every compiled conversion returns exactly what eval returned."""
+    for definition in definitions.values():
+        converter = compile_conversion(definition["conversion"])
+        for value in (0, 1, 853, 2951, -9, 3.5, "n/a", None):
+            expected = _eval_conversion(value, definition["conversion"])
+            actual = value if converter is None else converter(value)
+            assert actual == expected
+
+
+def test_compile_conversion_rejects_unsafe_formulas() -> None:
+    """Test formulas may only do arithmetic on the value."""
+    with pytest.raises(ValueError):
+        compile_conversion("__import__('os').getcwd()")
+    with pytest.raises(ValueError):
+        compile_conversion("other / 10")
+    assert apply_conversion(5, "value.real") == 5
+
+
+def test_apply_conversion() -> None:
+    """Test the apply_conversion helper."""
+    assert apply_conversion(853, "value/10") == 85.3
+    assert apply_conversion(2951, "(value/10) - 273.15") == 2951 / 10 - 273.15
+    assert apply_conversion(42, None) == 42
+    assert apply_conversion(None, "value/10") is None
+
+
+@pytest.mark.parametrize(
+    "conversion",
+    ["value/10", "value/100", "(value/10) - 273.15", "2 * value + 1", "100 - value", "-value"],
+)
+def test_inverse_conversion_round_trips(conversion) -> None:
+    """Test the inverse of a conversion recovers the raw value."""
+    forward = compile_conversion(conversion)
+    inverse = compile_inverse_conversion(conversion)
+    for raw in (0, 1, 853, 2951, -9):
+        assert inverse(forward(raw)) == pytest.approx(raw)
+    with pytest.raises(ValueError):
+        compile_inverse_conversion("value * value")
+
+
+def test_encode_writes() -> None:
+    """Test writes are validated, quantized and converted to raw values."""
+    assert encode_writes({"socSet": 95.4, "outputLimit": 799.6, "lampSwitch": True}) == {
+        "socSet": 950,
+        "outputLimit": 800,
+        "lampSwitch": 1,
+    }
+    with pytest.raises(ValueError, match="at least 80"):
+        encode_writes({"socSet": 50})
+    with pytest.raises(ValueError, match="at most 10000"):
+        encode_writes({"outputLimit": 20000})
+    with pytest.raises(ValueError, match="not a writable property"):
+        encode_writes({"electricLevel": 50})
+    with pytest.raises(ValueError, match="Invalid value"):
+        encode_writes({"outputLimit": "800"})
+
+
+def test_benchmark_compiled_vs_eval(multipack_report) -> None:
+    """Benchmark precompiled conversions against eval on a multi-pack report."""
+    assert _convert_report_compiled(multipack_report) == _convert_report_eval(
+        multipack_report
+    )
+
+    number = 200
+    eval_time = min(
+        timeit.repeat(
+            lambda: _convert_report_eval(multipack_report), number=number, repeat=3
+        )
+    )
+    compiled_time = min(
+        timeit.repeat(
+            lambda: _convert_report_compiled(multipack_report),
+            number=number,
+            repeat=3,
+        )
+    )
+    print(
+        f"\nconversions per report: eval {eval_time / number * 1e6:.1f} us, "
+        f"compiled {compiled_time / number * 1e6:.1f} us "
+        f"({eval_time / compiled_time:.1f}x)"
+    )
+    assert compiled_time < eval_time
@@ -0,0 +1,85 @@
+"""Test the MQTT traffic capture and replay."""
+import json
+from unittest.mock import MagicMock
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.zendure_mqtt.device import ZendureDevice
+from custom_components.zendure_mqtt.recording import (
+    TrafficRecorder,
+    async_replay,
+    encode_record,
+    read_records,
+)
+
+TOPIC = "/A8yh63/test-device-id/properties/report"
+
+
+def _device(hass: HomeAssistant, recorder: TrafficRecorder | None = None) -> ZendureDevice:
+    """Return a device on a mock connection."""
+    return ZendureDevice(
+        hass,
+        MagicMock(in_event_loop=True),
+        "capture",
+        "hub2000",
+        "test-device-id",
+        "A8yh63",
+        recorder=recorder,
+    )
+
+
+async def test_record_messages(hass: HomeAssistant, tmp_path) -> None:
+    """Test received messages are appended to the capture file."""
+    path = str(tmp_path / "capture" / "entry.rec")
+    recorder = TrafficRecorder(hass, path)
+    device = _device(hass, recorder)
+    device.start()
+
+    for level in (50, 51):
+        msg = MagicMock()
+        msg.topic = TOPIC
+        msg.payload = json.dumps({"properties": {"electricLevel": level}}).encode()
+        device._on_message(msg)
+    device.stop()
+    await hass.async_block_till_done()
+
+    records = list(read_records(path))
+    assert [(topic, json.loads(payload)) for _, topic, payload in records] == [
+        (TOPIC, {"properties": {"electricLevel": 50}}),
+        (TOPIC, {"properties": {"electricLevel": 51}}),
+    ]
+    assert records[0][0] <= records[1][0]
+
+    # A full capture drops further records
+    recorder = TrafficRecorder(hass, path, max_bytes=0)
+    recorder._write(b"")
+    recorder.record(TOPIC, b"{}")
+    assert (recorder.records, recorder.dropped) == (0, 1)
+
+
+async def test_replay(hass: HomeAssistant, tmp_path, multipack_report) -> None:
+    """Test a capture is replayed with scaled spacing into the decoded state."""
+    path = tmp_path / "replay.rec"
+    report = json.dumps(multipack_report).encode()
+    path.write_bytes(
+        b"ZMQR1\n"
+        + encode_record(1000.0, TOPIC, report)
+        + encode_record(1001.0, TOPIC, b"not json")
+        + encode_record(1002.0, TOPIC, report)
+        # A record cut short by a crash is ignored
+        + encode_record(1003.0, TOPIC, report)[:-5]
+    )
+    device = _device(hass)
+
+    result = await async_replay(device, read_records(str(path)), speed=20)
+
+    assert result.messages == 3
+    # Two seconds of traffic at 20x speed
+    assert 0.1 <= result.elapsed < 1
+    assert result.throughput > 0
+    assert result.latency(50) <= result.latency(99) <= result.latency(100)
+    assert result.state["pack_count"] == 4
+    assert set(result.state["packs"]) == {
+        pack["sn"] for pack in multipack_report["packData"]
+    }
+    assert "messages/s" in result.summary()
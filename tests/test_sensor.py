@@ -2,6 +2,8 @@
 from unittest.mock import MagicMock, patch
 import json
 
+import pytest
+
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers import entity_registry as er
 
@@ -14,9 +16,15 @@ from custom_components.zendure_mqtt.const import (
     CONF_MQTT_USERNAME,
     DOMAIN,
 )
-from custom_components.zendure_mqtt.sensor import ZendureMqttSensor
+from custom_components.zendure_mqtt.sensor import (
+    DIAGNOSTIC_SENSORS,
+    ZendurePropertySensor,
+)
 
-from pytest_homeassistant_custom_component.common import MockConfigEntry
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
 
 
 async def test_sensor_setup(hass: HomeAssistant, mock_mqtt_client) -> None:
@@ -34,7 +42,7 @@ async def test_sensor_setup(hass: HomeAssistant, mock_mqtt_client) -> None:
     )
     entry.add_to_hass(hass)
 
-    with patch("custom_components.zendure_mqtt.sensor.mqtt.Client", return_value=mock_mqtt_client):
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
         await hass.config_entries.async_setup(entry.entry_id)
         await hass.async_block_till_done()
 
@@ -59,7 +67,7 @@ async def test_sensor_update(hass: HomeAssistant, mock_mqtt_client) -> None:
     )
     entry.add_to_hass(hass)
 
-    with patch("custom_components.zendure_mqtt.sensor.mqtt.Client", return_value=mock_mqtt_client):
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
         await hass.config_entries.async_setup(entry.entry_id)
         await hass.async_block_till_done()
 
@@ -77,4 +85,167 @@ async def test_sensor_update(hass: HomeAssistant, mock_mqtt_client) -> None:
     state = hass.states.get("sensor.zendure_hub2000_test_device_id")
     assert state is not None
     assert state.state == "85"
-    assert state.attributes["electricLevel"] == 85
+    assert "electricLevel" not in state.attributes
+
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_battery_level")
+    assert state is not None
+    assert state.state == "85"
+    assert state.attributes["unit_of_measurement"] == "%"
+    assert state.attributes["device_class"] == "battery"
+
+
+async def test_property_entities(
+    hass: HomeAssistant, mock_mqtt_client, multipack_report
+) -> None:
+    """Test entities are created per reported property and pack."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    multipack_report["properties"]["unknownProperty"] = 7
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps(multipack_report).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_hub_temperature")
+    assert float(state.state) == pytest.approx(27.95)
+    assert state.attributes["unit_of_measurement"] == "°C"
+
+    state = hass.states.get(
+        "sensor.zendure_hub2000_test_device_id_pack_co4h00000001_total_voltage"
+    )
+    assert float(state.state) == 49.16
+
+    # Properties without a definition stay on the main sensor
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id")
+    assert state.attributes["unknownProperty"] == 7
+    assert state.attributes["pack_count"] == 4
+    # The attribute view is only rebuilt when the device's snapshot changes
+    sensor = hass.data["sensor"].get_entity("sensor.zendure_hub2000_test_device_id")
+    assert sensor.extra_state_attributes is sensor.extra_state_attributes
+
+    entity_registry = er.async_get(hass)
+    entities = er.async_entries_for_config_entry(entity_registry, entry.entry_id)
+    # Main sensor, diagnostic sensors, one entity per property and nine per pack
+    assert len(entities) == (
+        1 + len(DIAGNOSTIC_SENSORS) + len(multipack_report["properties"]) - 1 + 4 * 9
+    )
+
+
+async def test_property_entity_writes_only_on_change(
+    hass: HomeAssistant, mock_mqtt_client
+) -> None:
+    """Test a property entity only writes its state when its value changes."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+
+    msg.payload = json.dumps({"properties": {"electricLevel": 85, "packState": 1}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    written = []
+    original = ZendurePropertySensor.async_write_ha_state
+
+    def track_write(entity):
+        written.append(entity.entity_id)
+        original(entity)
+
+    with patch.object(ZendurePropertySensor, "async_write_ha_state", track_write):
+        msg.payload = json.dumps({"properties": {"electricLevel": 85, "packState": 2}}).encode("utf-8")
+        mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+        await hass.async_block_till_done()
+
+    assert written == ["sensor.zendure_hub2000_test_device_id_pack_state"]
+    assert hass.states.get("sensor.zendure_hub2000_test_device_id_pack_state").state == "2"
+
+
+async def test_snapshot_saved_and_restored(
+    hass: HomeAssistant, mock_mqtt_client, hass_storage, freezer
+) -> None:
+    """Test the last known state is saved and shown as restored after a restart."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+    hass_storage[f"{DOMAIN}.{entry.entry_id}"] = {
+        "version": 1,
+        "key": f"{DOMAIN}.{entry.entry_id}",
+        "data": {
+            "state": "85",
+            "values": {"electricLevel": 85, "outputHomePower": 300},
+            "extra": {},
+            "pack_count": 1,
+            "packs": {"CO4H00000000": {"values": {"socLevel": 84}, "extra": {}}},
+        },
+    }
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    # Shown before the broker connects, marked as restored
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_output_home_power")
+    assert state.state == "300"
+    assert state.attributes["restored"] is True
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_pack_co4h00000000_soc_level")
+    assert state.state == "84"
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id")
+    assert state.state == "85"
+    assert state.attributes["restored"] is True
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    for power in (310, 320, 330):
+        msg.payload = json.dumps({"properties": {"outputHomePower": power}}).encode("utf-8")
+        mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+        await hass.async_block_till_done()
+
+    state = hass.states.get("sensor.zendure_hub2000_test_device_id_output_home_power")
+    assert state.state == "330"
+    assert "restored" not in state.attributes
+
+    # Changes are written together once the save delay has passed
+    freezer.tick(61)
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    saved = hass_storage[f"{DOMAIN}.{entry.entry_id}"]["data"]
+    assert saved["values"]["outputHomePower"] == 330
+    assert saved["packs"]["CO4H00000000"]["values"] == {"socLevel": 84}
+    assert hass.data[DOMAIN][entry.entry_id].stats["snapshot_saves"] == 1
@@ -0,0 +1,75 @@
+"""Test the bounded device store."""
+import pytest
+
+from custom_components.zendure_mqtt.store import PACK_SLOTS, UNSET, DeviceStore
+
+
+def test_unknown_and_raw_keys_are_capped() -> None:
+    """Test unknown properties and raw topics cannot grow without limit."""
+    store = DeviceStore(pack_expiry=60, max_extra=2, max_raw=2)
+
+    assert store.set_extra(store.extra, "a", 1)
+    assert store.set_extra(store.extra, "b", 2)
+    assert not store.set_extra(store.extra, "c", 3)
+    # Known keys still update when the store is full
+    assert store.set_extra(store.extra, "a", 4)
+    assert store.extra == {"a": 4, "b": 2}
+
+    for topic in ("/x/1", "/x/2", "/x/3"):
+        store.set_raw(topic, "payload")
+    assert list(store.raw) == ["/x/2", "/x/3"]
+
+    assert store.size["dropped_extra_attributes"] == 1
+    assert store.size["evicted_raw_topics"] == 1
+
+
+def test_packs_expire_and_are_capped() -> None:
+    """Test packs not reported in time, or beyond the limit, are forgotten."""
+    store = DeviceStore(pack_expiry=60, max_packs=2)
+    store.pack("A", 0).values[PACK_SLOTS["socLevel"]] = 50
+    store.pack("B", 10)
+    store.pack("C", 20)
+    assert set(store.packs) == {"B", "C"}
+    assert store.get("A", "socLevel") is None
+
+    store.pack("C", 80)
+    store.expire_packs(100)
+    assert set(store.packs) == {"C"}
+    assert store.pop_removed_packs() == ["A", "B"]
+    assert store.pop_removed_packs() == []
+    assert store.size["evicted_packs"] == 2
+
+
+def test_values_are_stored_by_slot() -> None:
+    """Test values live in fixed slots and keys are derived from them."""
+    store = DeviceStore(pack_expiry=60)
+    pack = store.pack("A", 0)
+    pack.values[PACK_SLOTS["power"]] = 45
+
+    assert store.get("A", "power") == 45
+    assert store.get("A", "socLevel") is None
+    assert store.get(None, "electricLevel", UNSET) is UNSET
+    assert store.keys() == [("A", "power")]
+    assert store.size["pack_values"] == 1
+    # The attribute view is cached until something without an entity changes
+    assert store.attributes() is store.attributes()
+    store.set_extra(pack.extra, "unknown", 1)
+    assert store.attributes() == {"pack_A_unknown": 1}
+
+
+def test_attributes_are_an_immutable_snapshot() -> None:
+    """Test readers get a read-only snapshot that is replaced on changes."""
+    store = DeviceStore(pack_expiry=60)
+    store.set_extra(store.extra, "unknown", 1)
+    snapshot = store.attributes()
+
+    with pytest.raises(TypeError):
+        snapshot["unknown"] = 2  # type: ignore[index]
+    # Unchanged values keep the snapshot
+    assert not store.set_extra(store.extra, "unknown", 1)
+    assert store.attributes() is snapshot
+
+    store.set_raw("/x/1", "payload")
+    assert store.attributes() is not snapshot
+    assert snapshot == {"unknown": 1}
+    assert store.attributes() == {"unknown": 1, "/x/1": "payload"}
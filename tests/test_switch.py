@@ -0,0 +1,61 @@
+"""Test the Zendure MQTT switches."""
+from unittest.mock import MagicMock, patch
+import json
+
+from homeassistant.components.switch import DOMAIN as SWITCH_DOMAIN
+from homeassistant.const import ATTR_ENTITY_ID, SERVICE_TURN_OFF, SERVICE_TURN_ON
+from homeassistant.core import HomeAssistant
+
+from custom_components.zendure_mqtt.const import (
+    CONF_DEVICE_ID,
+    CONF_DEVICE_MODEL,
+    CONF_MQTT_HOST,
+    CONF_MQTT_PORT,
+    DOMAIN,
+)
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+
+async def test_switch(
+    hass: HomeAssistant, mock_mqtt_client, mock_write_replies
+) -> None:
+    """Test a writable switch property."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_MQTT_HOST: "1.1.1.1",
+            CONF_MQTT_PORT: 1883,
+            CONF_DEVICE_MODEL: "hub2000",
+            CONF_DEVICE_ID: "test-device-id",
+        },
+    )
+    entry.add_to_hass(hass)
+
+    with patch("custom_components.zendure_mqtt.connection.mqtt.Client", return_value=mock_mqtt_client):
+        await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    mock_mqtt_client.on_connect(mock_mqtt_client, None, None, 0)
+    msg = MagicMock()
+    msg.topic = "/A8yh63/test-device-id/properties/report"
+    msg.payload = json.dumps({"properties": {"lampSwitch": 0}}).encode("utf-8")
+    mock_mqtt_client.on_message(mock_mqtt_client, None, msg)
+    await hass.async_block_till_done()
+
+    entity_id = "switch.zendure_hub2000_test_device_id_lamp"
+    assert hass.states.get(entity_id).state == "off"
+
+    await hass.services.async_call(
+        SWITCH_DOMAIN, SERVICE_TURN_ON, {ATTR_ENTITY_ID: entity_id}, blocking=True
+    )
+    topic, payload = mock_mqtt_client.publish.call_args[0]
+    assert topic == "iot/A8yh63/test-device-id/properties/write"
+    assert json.loads(payload)["properties"] == {"lampSwitch": 1}
+
+    await hass.services.async_call(
+        SWITCH_DOMAIN, SERVICE_TURN_OFF, {ATTR_ENTITY_ID: entity_id}, blocking=True
+    )
+    topic, payload = mock_mqtt_client.publish.call_args[0]
+    assert topic == "iot/A8yh63/test-device-id/properties/write"
+    assert json.loads(payload)["properties"] == {"lampSwitch": 0}